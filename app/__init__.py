@@ -1,10 +1,10 @@
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_socketio import SocketIO
 from app.config import Config
 import os
-from flask_migrate import Migrate
 from flask_mail import Mail
 
 # Initialize extensions
@@ -14,39 +14,40 @@ login_manager.login_view = 'auth.login'
 login_manager.login_message_category = 'info'
 socketio = SocketIO()
 mail = Mail()
-migrate = Migrate()
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
     # Initialize extensions with app
+    from app.utils.engine import engine_options, init_engine_profile
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     db.init_app(app)
-    migrate.init_app(app, db)
+    init_engine_profile(app)
+    # Alembic is only needed by `flask db`, so keep it out of worker startup
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
     login_manager.init_app(app)
-    socketio.init_app(app, cors_allowed_origins="*")
+    from app.utils.user_cache import init_user_cache
+    init_user_cache(app)
+    from app.socket.room_cache import init_room_cache
+    init_room_cache(app)
+    from app.utils.report_cache import init_report_cache
+    init_report_cache(app)
+    from app.socket.relay import init_ice_relay
+    init_ice_relay(app)
+    from app.socket.manager import socketio_options
+    from app.socket.presence import init_presence
+    socketio.init_app(app, cors_allowed_origins="*", **socketio_options(app.config))
+    init_presence(app)
     mail.init_app(app)
 
     
     # Ensure upload directory exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['REPORT_FOLDER'], exist_ok=True)
 
-    with app.app_context():
-        from app.models import User, UserRole
-        admin_user = User.query.filter_by(role=UserRole.ADMIN).first()
-        if not admin_user:
-            admin_user = User(
-                username='admin',
-                email='admin@gmail.com',
-                role=UserRole.ADMIN
-            )
-            admin_user.set_password('admin123')  # Set a default password
-            db.session.add(admin_user)
-            db.session.commit()
-            print('Admin user created successfully!')
-        else:
-            print('Admin user already exists!',admin_user.email)
-    
     # Register blueprints
     from app.auth.routes import auth_bp as auth
     from app.attachee.routes import attachee_bp as attachee
@@ -64,15 +65,38 @@ def create_app(config_class=Config):
     app.register_blueprint(main)
     app.register_blueprint(video)
     
+    # Register Socket.IO event handlers
+    from app.socket import events
+    
     # Register error handlers
     from app.errors import register_error_handlers
     register_error_handlers(app)
     
-    # Create database tables if they don't exist
-    with app.app_context():
-        db.create_all()
+    # Record SQL statistics per request
+    from app.utils.query_stats import init_query_stats
+    init_query_stats(app)
+    
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
     
     return app
 
+def start_background_tasks(app):
+    """Start per-process background work; call once in each serving process"""
+    # Periodically correct drift in the dashboard counters
+    if app.config['COUNTER_RECONCILE_INTERVAL']:
+        from app.utils.counters import reconcile_periodically
+        socketio.start_background_task(reconcile_periodically, app, app.config['COUNTER_RECONCILE_INTERVAL'])
+    # Expire video room participants whose disconnect was never handled
+    if app.config['PRESENCE_HEARTBEAT_INTERVAL']:
+        from app.socket.presence import reap_periodically
+        socketio.start_background_task(reap_periodically, app, app.config['PRESENCE_HEARTBEAT_INTERVAL'],
+                                       app.config['PRESENCE_TTL'])
+    # Warm the typeahead index before the first keystroke needs it
+    from app.utils.autocomplete import refresh_periodically
+    socketio.start_background_task(refresh_periodically, app, app.config['AUTOCOMPLETE_REFRESH_INTERVAL'])
+
 # Import models to ensure they are registered with SQLAlchemy
-from app import models
\ No newline at end of file
+from app import models
+from app.utils import counters, user_cache, search, autocomplete
@@ -1,10 +1,16 @@
-from flask import render_template, redirect, url_for, flash, request, current_app
+from flask import render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import current_user, login_required
 from app import db
 from app.models import User, Organization, AttacheeProfile, LogbookEntry, VideoSession, UserRole
 from app.admin import admin
 from app.admin.forms import OrganizationForm, UserForm, UserSearchForm
 from app.utils.decorators import role_required
+from app.utils.pagination import keyset_paginate
+from app.utils.search import search_users
+from app.utils.loading import USER_WITH_ORGANIZATION
+from app.utils.exports import export_user_list
+from app.utils.user_cache import user_cache
+from app.utils.counters import get_counters, role_key, USERS, ORGANIZATIONS, LOGBOOK_ENTRIES, VIDEO_SESSIONS
 from datetime import datetime
 from sqlalchemy import func
 
@@ -13,14 +19,16 @@ from sqlalchemy import func
 @role_required(UserRole.ADMIN)
 def dashboard():
     """Admin dashboard route"""
-    # Get counts for various metrics
-    user_count = User.query.count()
-    attachee_count = User.query.filter_by(role=UserRole.ATTACHEE).count()
-    assessor_count = User.query.filter_by(role=UserRole.ASSESSOR).count()
-    org_manager_count = User.query.filter_by(role=UserRole.ORG_MANAGER).count()
-    org_count = Organization.query.count()
-    logbook_count = LogbookEntry.query.count()
-    video_session_count = VideoSession.query.count()
+    # Get counts for various metrics from the materialized counters
+    counts = get_counters(USERS, role_key(UserRole.ATTACHEE), role_key(UserRole.ASSESSOR),
+                          role_key(UserRole.ORG_MANAGER), ORGANIZATIONS, LOGBOOK_ENTRIES, VIDEO_SESSIONS)
+    user_count = counts[USERS]
+    attachee_count = counts[role_key(UserRole.ATTACHEE)]
+    assessor_count = counts[role_key(UserRole.ASSESSOR)]
+    org_manager_count = counts[role_key(UserRole.ORG_MANAGER)]
+    org_count = counts[ORGANIZATIONS]
+    logbook_count = counts[LOGBOOK_ENTRIES]
+    video_session_count = counts[VIDEO_SESSIONS]
     
     # Get recent users
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
@@ -45,30 +53,50 @@ def dashboard():
 @role_required(UserRole.ADMIN)
 def users():
     """List all users"""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search_form = UserSearchForm()
+    query, sort_key, search_term, role_filter = _filtered_users()
+    if search_term:
+        search_form.search.data = search_term
+    
+    # Paginate results, with a capped total so the count stays cheap
+    users = keyset_paginate(query.options(*USER_WITH_ORGANIZATION), sort_key, cursor=cursor,
+                            per_page=20, descending=False, count='estimate')
+    
+    return render_template('admin/users.html',
+                          title='Manage Users',
+                          users=users,
+                          search_form=search_form,
+                          current_role=role_filter)
+
+@admin.route('/users/export')
+@login_required
+@role_required(UserRole.ADMIN)
+def export_users():
+    """Users matching the list's search and role filter, as CSV or XLSX"""
+    query, sort_key, _, _ = _filtered_users()
+    return export_user_list(query, sort_key, request.args.get('format', 'csv'), descending=False)
+
+def _filtered_users():
+    """
+    Returns:
+        Tuple of (query of users matching the list's search and role
+        filter, ascending sort key, search term, role filter)
+    """
     query = User.query
     
     # Apply search filter if provided
     search_term = request.args.get('search', '')
+    sort_key = (User.username, User.id)
     if search_term:
-        search_form.search.data = search_term
-        query = query.filter(User.username.ilike(f'%{search_term}%') | 
-                            User.email.ilike(f'%{search_term}%'))
+        query, rank = search_users(query, search_term)
+        sort_key = (rank, User.id)
     
     # Apply role filter if provided
     role_filter = request.args.get('role', '')
     if role_filter and role_filter in [role.name for role in UserRole]:
         query = query.filter(User.role == UserRole[role_filter])
-    
-    # Paginate results
-    users = query.order_by(User.username).paginate(page=page, per_page=20)
-    
-    return render_template('admin/users.html',
-                          title='Manage Users',
-                          users=users,
-                          search_form=search_form,
-                          current_role=role_filter)
+    return query, sort_key, search_term, role_filter
 
 @admin.route('/user/<int:user_id>')
 @login_required
@@ -112,4 +140,11 @@ def create_user():
     
     return render_template('admin/create_user.html',
                           title='Create User',
-                          form=form,UserRole=UserRole)
\ No newline at end of file
+                          form=form,UserRole=UserRole)
+
+@admin.route('/cache-stats')
+@login_required
+@role_required(UserRole.ADMIN)
+def cache_stats():
+    """Hit ratio and size of this worker's user cache"""
+    return jsonify(user_cache=user_cache.stats())
\ No newline at end of file
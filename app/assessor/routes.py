@@ -6,27 +6,34 @@ from app.models import UserRole, LogbookStatus, VideoSessionStatus
 from app.assessor.forms import FeedbackForm, VideoSessionForm, AttacheeSearchForm
 from app.assessor import assessor
 from app.utils.decorators import role_required
+from app.utils.pagination import keyset_paginate
+from app.utils.search import search_users, search_logbook_entries, attach_snippets
+from app.utils.counters import get_counters, role_key, status_key
+from app.utils.notifications import notify
+from app.utils.exports import export_logbook_entries, export_video_sessions
+from app.utils.loading import LOGBOOK_WITH_ATTACHEE, SESSION_WITH_ATTACHEE, ATTACHEE_WITH_PROFILE, PROFILE_WITH_USER
 from datetime import datetime, timedelta
-from sqlalchemy import or_
 
 @assessor.route('/dashboard')
 @login_required
 @role_required(UserRole.ASSESSOR)
 def dashboard():
     # Get counts for various metrics
-    attachee_count = User.query.filter_by(role=UserRole.ATTACHEE).count()
-    pending_logbooks = LogbookEntry.query.filter_by(status=LogbookStatus.SUBMITTED).count()
+    counts = get_counters(role_key(UserRole.ATTACHEE), status_key(LogbookStatus.SUBMITTED))
+    attachee_count = counts[role_key(UserRole.ATTACHEE)]
+    pending_logbooks = counts[status_key(LogbookStatus.SUBMITTED)]
     upcoming_sessions = VideoSession.query.filter_by(
         assessor_id=current_user.id,
         status=VideoSessionStatus.SCHEDULED
     ).filter(VideoSession.start_time >= datetime.now()).count()
     
     # Get recent logbook entries pending review
-    recent_entries = LogbookEntry.query.filter_by(status=LogbookStatus.SUBMITTED)\
+    recent_entries = LogbookEntry.query.options(*LOGBOOK_WITH_ATTACHEE)\
+                                .filter_by(status=LogbookStatus.SUBMITTED)\
                                 .order_by(LogbookEntry.created_at.desc()).limit(5).all()
     
     # Get upcoming video sessions
-    upcoming_video_sessions = VideoSession.query.filter_by(
+    upcoming_video_sessions = VideoSession.query.options(*SESSION_WITH_ATTACHEE).filter_by(
         assessor_id=current_user.id,
         status=VideoSessionStatus.SCHEDULED
     ).filter(VideoSession.start_time >= datetime.now())\
@@ -45,26 +52,21 @@ def dashboard():
 @role_required(UserRole.ASSESSOR)
 def attachees():
     form = AttacheeSearchForm()
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     
     # Base query for attachees
-    query = User.query.filter_by(role=UserRole.ATTACHEE)
+    query = User.query.options(*ATTACHEE_WITH_PROFILE).filter_by(role=UserRole.ATTACHEE)
     
-    # Apply search filter if provided
+    # Apply search filter if provided, best matches first
     search = request.args.get('search', '')
+    sort_key = (User.username, User.id)
     if search:
-        # Join with profile to search by name or organization
-        query = query.join(AttacheeProfile).join(Organization, AttacheeProfile.organization_id == Organization.id, isouter=True)\
-                    .filter(or_(
-                        User.username.contains(search),
-                        User.email.contains(search),
-                        AttacheeProfile.first_name.contains(search),
-                        AttacheeProfile.last_name.contains(search),
-                        Organization.name.contains(search)
-                    ))
+        query, rank = search_users(query, search)
+        sort_key = (rank, User.id)
     
     # Paginate results
-    attachees = query.paginate(page=page, per_page=10)
+    attachees = keyset_paginate(query, sort_key, cursor=cursor,
+                                per_page=10, descending=False)
     
     return render_template('assessor/attachees.html',
                           title='Manage Attachees',
@@ -77,7 +79,7 @@ def attachees():
 @role_required(UserRole.ASSESSOR)
 def view_attachee(attachee_id):
     attachee = User.query.filter_by(id=attachee_id, role=UserRole.ATTACHEE).first_or_404()
-    profile = AttacheeProfile.query.filter_by(user_id=attachee_id).first_or_404()
+    profile = AttacheeProfile.query.options(*PROFILE_WITH_USER).filter_by(user_id=attachee_id).first_or_404()
     
     # Get organization if available
     organization = None
@@ -104,7 +106,40 @@ def view_attachee(attachee_id):
 @login_required
 @role_required(UserRole.ASSESSOR)
 def logbooks():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    query, sort_key, status_filter, search = _filtered_logbooks()
+    query = query.options(*LOGBOOK_WITH_ATTACHEE)
+    
+    # Newest first, or best match first when searching the entry text
+    if search['q']:
+        entries = keyset_paginate(query, sort_key, cursor=cursor, per_page=10, descending=False)
+        attach_snippets(entries.items, search['q'])
+    else:
+        entries = keyset_paginate(query, sort_key, cursor=cursor, per_page=10)
+    
+    return render_template('assessor/logbooks.html',
+                          title='Review Logbooks',
+                          entries=entries,
+                          status_filter=status_filter,
+                          search=search,
+                          organizations=Organization.query.order_by(Organization.name).all())
+
+@assessor.route('/logbooks/export')
+@login_required
+@role_required(UserRole.ASSESSOR)
+def export_logbooks():
+    """Logbook entries matching the review list's filters, as CSV or XLSX"""
+    query, sort_key, _, search = _filtered_logbooks()
+    return export_logbook_entries(query, sort_key, request.args.get('format', 'csv'), descending=not search['q'])
+
+def _filtered_logbooks():
+    """
+    Logbook entries matching the review list's query string
+    
+    Returns:
+        Tuple of (query, sort key, status filter, search args); the list
+        shows the sort key descending, or ascending when searching
+    """
     status_filter = request.args.get('status', 'all')
     
     # Base query for logbook entries
@@ -119,13 +154,23 @@ def logbooks():
             # Invalid status, ignore filter
             pass
     
-    # Order by date and paginate
-    entries = query.order_by(LogbookEntry.created_at.desc()).paginate(page=page, per_page=10)
+    # Narrow by organization and week range
+    search = dict(q=request.args.get('q', '').strip(),
+                  week_from=request.args.get('week_from', type=int),
+                  week_to=request.args.get('week_to', type=int),
+                  organization=request.args.get('organization', type=int))
+    if search['organization']:
+        query = query.join(User, LogbookEntry.attachee_id == User.id)\
+                     .filter(User.organization_id == search['organization'])
+    if search['week_from']:
+        query = query.filter(LogbookEntry.week_number >= search['week_from'])
+    if search['week_to']:
+        query = query.filter(LogbookEntry.week_number <= search['week_to'])
     
-    return render_template('assessor/logbooks.html',
-                          title='Review Logbooks',
-                          entries=entries,
-                          status_filter=status_filter)
+    if search['q']:
+        query, rank = search_logbook_entries(query, search['q'])
+        return query, (rank, LogbookEntry.id), status_filter, search
+    return query, (LogbookEntry.created_at, LogbookEntry.id), status_filter, search
 
 @assessor.route('/logbook/<int:entry_id>', methods=['GET', 'POST'])
 @login_required
@@ -140,6 +185,9 @@ def review_logbook(entry_id):
         entry.status = LogbookStatus[form.status.data]
         entry.assessor_approved_by = current_user.id
         entry.assessor_approved_at = datetime.now()
+        notify(entry.attachee_id, 'Logbook reviewed',
+               f'{current_user.username} reviewed your week {entry.week_number} logbook entry: {entry.status.value}.',
+               link=url_for('attachee.view_logbook_entry', entry_id=entry.id), commit=False)
         
         db.session.commit()
         flash('Your feedback has been submitted.', 'success')
@@ -155,7 +203,31 @@ def review_logbook(entry_id):
 @login_required
 @role_required(UserRole.ASSESSOR)
 def video_sessions():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    query, status_filter = _filtered_sessions()
+    
+    # Order by start_time instead of scheduled_date
+    sessions = keyset_paginate(query.options(*SESSION_WITH_ATTACHEE), (VideoSession.start_time, VideoSession.id),
+                               cursor=cursor, per_page=10)
+    
+    return render_template('assessor/video_sessions.html',
+                          title='Video Sessions',
+                          sessions=sessions,
+                          status_filter=status_filter)
+
+@assessor.route('/video-sessions/export')
+@login_required
+@role_required(UserRole.ASSESSOR)
+def export_sessions():
+    """This assessor's video sessions matching the list's filters, as CSV or XLSX"""
+    query, _ = _filtered_sessions()
+    return export_video_sessions(query, (VideoSession.start_time, VideoSession.id), request.args.get('format', 'csv'))
+
+def _filtered_sessions():
+    """
+    Returns:
+        Tuple of (query of this assessor's sessions matching the list's status filter, status filter)
+    """
     status_filter = request.args.get('status', 'all')
     
     # Base query for video sessions
@@ -169,14 +241,7 @@ def video_sessions():
         except (KeyError, AttributeError):
             # Invalid status, ignore filter
             pass
-    
-    # Order by start_time instead of scheduled_date
-    sessions = query.order_by(VideoSession.start_time.desc()).paginate(page=page, per_page=10)
-    
-    return render_template('assessor/video_sessions.html',
-                          title='Video Sessions',
-                          sessions=sessions,
-                          status_filter=status_filter)
+    return query, status_filter
 
 @assessor.route('/schedule-session/<int:attachee_id>', methods=['GET', 'POST'])
 @login_required
@@ -207,6 +272,10 @@ def schedule_session(attachee_id):
             )
             
             db.session.add(session)
+            db.session.flush()
+            notify(attachee_id, 'Video session scheduled',
+                   f'{current_user.username} scheduled "{session.title}" for {session_datetime:%Y-%m-%d %H:%M}.',
+                   link=url_for('attachee.view_session', session_id=session.id), commit=False)
             db.session.commit()
             
             flash(f'Video session scheduled with {attachee.username}.', 'success')
@@ -6,6 +6,9 @@ from app.models import User, AttacheeProfile, Organization, LogbookEntry, FileUp
 from app.attachee.forms import ProfileForm, LogbookEntryForm, FileUploadForm
 from app.attachee import attachee_bp
 from app.utils.decorators import role_required
+from app.utils.pagination import keyset_paginate
+from app.utils.notifications import notify_many, mark_read
+from app.utils.loading import SESSION_WITH_ASSESSOR
 from app.models import UserRole
 import os
 from datetime import datetime
@@ -91,10 +94,10 @@ def profile():
 @login_required
 @role_required(UserRole.ATTACHEE)
 def logbook():
-    page = request.args.get('page', 1, type=int)
-    entries = LogbookEntry.query.filter_by(attachee_id=current_user.id)\
-                         .order_by(LogbookEntry.created_at.desc())\
-                         .paginate(page=page, per_page=10, error_out=False)
+    cursor = request.args.get('cursor')
+    entries = keyset_paginate(LogbookEntry.query.filter_by(attachee_id=current_user.id),
+                              (LogbookEntry.created_at, LogbookEntry.id),
+                              cursor=cursor, per_page=10)
     
     return render_template('attachee/logbook.html', 
                            title='My Logbook', 
@@ -203,6 +206,10 @@ def submit_logbook_entry(entry_id):
         return redirect(url_for('attachee.view_logbook_entry', entry_id=entry.id))
     
     entry.status = LogbookStatus.SUBMITTED
+    notify_many([assessor.id for assessor in current_user.assessors],
+                'Logbook submitted',
+                f'{current_user.username} submitted their week {entry.week_number} logbook entry for review.',
+                link=url_for('assessor.review_logbook', entry_id=entry.id), commit=False)
     db.session.commit()
     flash('Your logbook entry has been submitted for review!', 'success')
     return redirect(url_for('attachee.logbook'))
@@ -211,10 +218,10 @@ def submit_logbook_entry(entry_id):
 @login_required
 @role_required(UserRole.ATTACHEE)
 def files():
-    page = request.args.get('page', 1, type=int)
-    files = FileUpload.query.filter_by(attachee_id=current_user.id)\
-                      .order_by(FileUpload.uploaded_at.desc())\
-                      .paginate(page=page, per_page=10, error_out=False)
+    cursor = request.args.get('cursor')
+    files = keyset_paginate(FileUpload.query.filter_by(attachee_id=current_user.id),
+                            (FileUpload.uploaded_at, FileUpload.id),
+                            cursor=cursor, per_page=10)
     
     return render_template('attachee/files.html', 
                            title='My Files', 
@@ -310,11 +317,11 @@ def delete_file(file_id):
 @login_required
 @role_required(UserRole.ATTACHEE)
 def video_sessions():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     status_filter = request.args.get('status', 'all')
     
     # Base query for video sessions
-    query = VideoSession.query.filter_by(attachee_id=current_user.id)
+    query = VideoSession.query.options(*SESSION_WITH_ASSESSOR).filter_by(attachee_id=current_user.id)
     
     # Apply status filter if provided
     if status_filter != 'all':
@@ -326,7 +333,8 @@ def video_sessions():
             pass
     
     # Order by start time and paginate
-    sessions = query.order_by(VideoSession.start_time.desc()).paginate(page=page, per_page=10, error_out=False)
+    sessions = keyset_paginate(query, (VideoSession.start_time, VideoSession.id),
+                               cursor=cursor, per_page=10)
     
     return render_template('attachee/video_sessions.html',
                           title='My Video Sessions',
@@ -345,24 +353,16 @@ def view_session(session_id):
                           session=session,
                           assessor=assessor)
 
+# Notifications are shared by every role and live in the main blueprint
 @attachee_bp.route('/notifications')
 @login_required
 @role_required(UserRole.ATTACHEE)
 def notifications():
-    page = request.args.get('page', 1, type=int)
-    notifications = current_user.notifications.order_by(
-        db.desc('created_at')).paginate(
-        page=page, per_page=20, error_out=False)
-    
-    return render_template('attachee/notifications.html',
-                          title='My Notifications',
-                          notifications=notifications)
+    return redirect(url_for('main.notifications'))
 
 @attachee_bp.route('/notifications/<int:notification_id>/mark-read', methods=['POST'])
 @login_required
 @role_required(UserRole.ATTACHEE)
 def mark_notification_read(notification_id):
-    notification = current_user.notifications.filter_by(id=notification_id).first_or_404()
-    notification.is_read = True
-    db.session.commit()
-    return redirect(url_for('attachee.notifications'))
\ No newline at end of file
+    mark_read(current_user.id, [notification_id])
+    return redirect(url_for('main.notifications'))
\ No newline at end of file
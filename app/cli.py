@@ -0,0 +1,281 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    @with_appcontext
+    def init_db():
+        """Create any missing tables and mark the schema as migrated."""
+        from flask_migrate import stamp
+        from app import db
+        from app.utils.search import rebuild_search_index
+        db.create_all()
+        rebuild_search_index()
+        stamp()
+        click.echo('Database initialised.')
+
+    @app.cli.command('create-admin')
+    @click.option('--username', default='admin', show_default=True)
+    @click.option('--email', default=lambda: current_app.config['ADMINS'][0], show_default='first of ADMINS')
+    @click.password_option()
+    @with_appcontext
+    def create_admin(username, email, password):
+        """Create the administrator account if there is none."""
+        from app import db
+        from app.models import User, UserRole
+        admin_user = User.query.filter_by(role=UserRole.ADMIN).first()
+        if admin_user:
+            click.echo(f'Admin user already exists: {admin_user.email}')
+            return
+        admin_user = User(username=username, email=email, role=UserRole.ADMIN)
+        admin_user.set_password(password)
+        db.session.add(admin_user)
+        db.session.commit()
+        click.echo('Admin user created successfully!')
+
+    @app.cli.command('check-query-plans')
+    @click.option('--user-id', default=1, help='User id to plan the per-user queries with.')
+    @click.option('--org-id', default=1, help='Organization id to plan the per-organization queries with.')
+    @with_appcontext
+    def check_query_plans(user_id, org_id):
+        """Fail if any list or dashboard query scans a whole table."""
+        from app.utils.query_plans import find_full_scans
+        failures = find_full_scans(user_id, org_id)
+        for name, line in failures:
+            click.echo(f'{name}: {line}', err=True)
+        if failures:
+            raise SystemExit(1)
+        click.echo('No full table scans found.')
+
+    @app.cli.command('reconcile-counters')
+    @with_appcontext
+    def reconcile_counters_command():
+        """Recompute the dashboard counters from the source tables."""
+        from app.utils.counters import reconcile_counters
+        drift = reconcile_counters()
+        for key, (stored, actual) in sorted(drift.items()):
+            click.echo(f'{key}: {stored} -> {actual}')
+        click.echo(f'Reconciled dashboard counters ({len(drift)} corrected).')
+
+    @app.cli.command('rebuild-search-index')
+    @with_appcontext
+    def rebuild_search_index_command():
+        """Recreate the user and logbook search indexes from their source tables."""
+        from app.utils.search import rebuild_search_index
+        for table, documents in rebuild_search_index().items():
+            click.echo(f'{table}: {documents} documents')
+
+    @app.cli.group()
+    def bench():
+        """Performance benchmarks, run against a throwaway database."""
+
+    @bench.command('eager-loading')
+    @click.option('--sizes', default='10,100,1000', help='Comma separated row counts.')
+    def bench_eager_loading(sizes):
+        """Statements per list view before and after eager loading."""
+        from app.utils.benchmarks import eager_loading_benchmark
+        click.echo(f'{"view":<26}{"rows":>6}{"before":>8}{"after":>7}')
+        for view, rows, before, after in eager_loading_benchmark([int(n) for n in sizes.split(',')]):
+            click.echo(f'{view:<26}{rows:>6}{before:>8}{after:>7}')
+
+    @bench.command('concurrency')
+    @click.option('--writers', default=8, help='Threads submitting logbook entries.')
+    @click.option('--submissions', default=25, help='Entries each writer submits.')
+    @click.option('--readers', default=4, help='Threads reading the logbook lists meanwhile.')
+    def bench_concurrency(writers, submissions, readers):
+        """Concurrent logbook submissions with driver defaults and with the engine profile."""
+        from app.utils.benchmarks import concurrency_benchmark
+        click.echo(f'{"profile":<10}{"saved":>7}{"locked":>8}{"failed":>8}{"seconds":>9}{"reads":>8}{"slowest read":>14}')
+        for profile, saved, locked, failed, seconds, reads, slowest in concurrency_benchmark(writers, submissions, readers):
+            click.echo(f'{profile:<10}{saved:>7}{locked:>8}{failed:>8}{seconds:>9.2f}{reads:>8}{slowest:>12.1f}ms')
+
+    @bench.command('search')
+    @click.option('--attachees', default=50000, help='Attachees to seed (plus one assessor each).')
+    @click.option('--term', 'terms', multiple=True, help='Search terms to time (repeatable).')
+    def bench_search(attachees, terms):
+        """Attachee search with LIKE filters and with the full-text index."""
+        from app.utils.benchmarks import search_benchmark
+        kwargs = {'terms': terms} if terms else {}
+        click.echo(f'{"term":<20}{"LIKE":>10}{"index":>10}{"matches":>9}')
+        for term, like_ms, index_ms, matches in search_benchmark(attachees, **kwargs):
+            click.echo(f'{term:<20}{like_ms:>8.1f}ms{index_ms:>8.1f}ms{matches:>9}')
+
+    @bench.command('autocomplete')
+    @click.option('--attachees', default=50000, help='Attachees to seed, each with an assessor and organization.')
+    @click.option('--budget-us', default=100.0, help='Fail if a lookup takes longer.')
+    def bench_autocomplete(attachees, budget_us):
+        """Typeahead index load time and per-keystroke lookups."""
+        from app.utils.benchmarks import autocomplete_benchmark
+        load_ms, results = autocomplete_benchmark(attachees)
+        click.echo(f'{"load":<32}{load_ms:>10.1f}ms')
+        click.echo(f'{"lookup":<32}{"index":>12}{"database":>12}{"results":>9}')
+        for name, lookup_us, search_ms, found in results:
+            click.echo(f'{name:<32}{lookup_us:>10.1f}µs{search_ms:>10.1f}ms{found:>9}')
+        if max(lookup_us for _, lookup_us, _, _ in results) > budget_us:
+            click.echo(f'A lookup exceeded the {budget_us:.0f}µs budget', err=True)
+            raise SystemExit(1)
+
+    @bench.command('logbook-search')
+    @click.option('--entries', default=200000, help='Logbook entries to seed.')
+    @click.option('--term', 'terms', multiple=True, help='Search terms to time (repeatable).')
+    def bench_logbook_search(entries, terms):
+        """Ranked logbook search pages with snippets."""
+        from app.utils.benchmarks import logbook_search_benchmark
+        kwargs = {'terms': terms} if terms else {}
+        click.echo(f'{"term":<24}{"page":>10}{"matches":>9}')
+        for term, ms, matches in logbook_search_benchmark(entries, **kwargs):
+            click.echo(f'{term:<24}{ms:>8.1f}ms{matches:>9}')
+
+    @bench.command('presence')
+    @click.option('--rooms', default='100,10000', help='Comma separated live room counts.')
+    @click.option('--database-url', default=None, help='Also time the shared registry on this database.')
+    @click.option('--budget-us', default=50.0, help='Fail if an in-memory operation takes longer.')
+    def bench_presence(rooms, database_url, budget_us):
+        """Video room join, leave and disconnect cost as rooms go live."""
+        from app.utils.benchmarks import presence_benchmark
+        results = presence_benchmark([int(n) for n in rooms.split(',')], database_url=database_url)
+        click.echo(f'{"registry":<10}{"rooms":>8}{"join":>10}{"leave":>10}{"disconnect":>12}')
+        for name, live, join_us, leave_us, disconnect_us in results:
+            click.echo(f'{name:<10}{live:>8}{join_us:>8.1f}µs{leave_us:>8.1f}µs{disconnect_us:>10.1f}µs')
+        if max(max(timings) for name, _, *timings in results if name == 'memory') > budget_us:
+            click.echo(f'An in-memory operation exceeded the {budget_us:.0f}µs budget', err=True)
+            raise SystemExit(1)
+
+    @bench.command('room-joins')
+    @click.option('--attachees', default=200, help='Sockets rejoining their own video room.')
+    @click.option('--rounds', default=10, help='Times each socket leaves and rejoins.')
+    def bench_room_joins(attachees, rounds):
+        """Video room join throughput with the room cache off and on."""
+        from app.utils.benchmarks import room_join_benchmark
+        click.echo(f'{"cache":<8}{"joins/s":>10}{"queries/join":>14}')
+        for name, rate, queries in room_join_benchmark(attachees, rounds):
+            click.echo(f'{name:<8}{rate:>10.0f}{queries:>14.2f}')
+
+    @bench.command('ice-relay')
+    @click.option('--candidates', default=40, help='Candidates the sender trickles.')
+    @click.option('--delays', default='0,10,25', help='Comma separated ICE_COALESCE_MS values.')
+    def bench_ice_relay(candidates, delays):
+        """Events and relay latency for trickled ICE candidates, with and without coalescing."""
+        from app.utils.benchmarks import ice_relay_benchmark
+        click.echo(f'{"delay":<8}{"events":>8}{"candidates":>12}{"merged":>8}{"p50":>9}{"p99":>9}{"depth":>7}')
+        for delay, events, delivered, stats in ice_relay_benchmark(candidates, delays=[int(d) for d in delays.split(',')]):
+            click.echo(f'{delay:>5}ms{events:>8}{delivered:>12}{stats["merged"]:>8}'
+                       f'{stats["latency_ms"]["p50"]:>7.1f}ms{stats["latency_ms"]["p99"]:>7.1f}ms'
+                       f'{stats["queue_depth"]["max"]:>7}')
+
+    @bench.command('socket-metrics')
+    @click.option('--budget-us', default=5.0, help='Fail if instrumentation adds more per event.')
+    def bench_socket_metrics(budget_us):
+        """Per-event overhead of the Socket.IO handler metrics."""
+        from app.utils.benchmarks import socket_metrics_benchmark
+        bare, instrumented = socket_metrics_benchmark()
+        click.echo(f'{"bare handler":<20}{bare:>8.2f}µs')
+        click.echo(f'{"instrumented":<20}{instrumented:>8.2f}µs')
+        if instrumented - bare > budget_us:
+            click.echo(f'Instrumentation added {instrumented - bare:.2f}µs (budget {budget_us:.0f}µs)', err=True)
+            raise SystemExit(1)
+
+    @bench.command('reports')
+    @click.option('--attachees', default=1500, help='Attachees to seed (plus one assessor each).')
+    @click.option('--workers', default=2, help='Report pool processes.')
+    def bench_reports(attachees, workers):
+        """Admin user report built in the request versus as a background job."""
+        from app.utils.benchmarks import report_jobs_benchmark
+        click.echo(f'{"mode":<18}{"response":>12}{"ready":>12}{"stall":>12}')
+        for mode, responded, ready, stall in report_jobs_benchmark(attachees, workers):
+            click.echo(f'{mode:<18}{responded:>10.0f}ms{ready:>10.0f}ms{stall:>10.0f}ms')
+
+    @bench.command('report-stream')
+    @click.option('--attachees', default=500, help='Attachees to seed (plus one assessor each).')
+    @click.option('--downloads', default=8, help='Streamed downloads started at once.')
+    @click.option('--max-active', default=4, help='REPORT_STREAM_MAX_ACTIVE for the run.')
+    def bench_report_stream(attachees, downloads, max_active):
+        """Report written to disk by a job versus streamed from memory."""
+        from app.utils.benchmarks import report_stream_benchmark
+        rows, (sent, refused, peak) = report_stream_benchmark(attachees, downloads, max_active)
+        click.echo(f'{"delivery":<10}{"time":>10}{"files":>8}{"disk":>12}')
+        for delivery, elapsed, files, size in rows:
+            click.echo(f'{delivery:<10}{elapsed:>8.0f}ms{files:>8}{size / 1024:>10.0f}KB')
+        click.echo(f'{downloads} concurrent streams: {sent} sent, {refused} refused, '
+                   f'peak traced memory {peak:.1f}MB')
+
+    @bench.command('report-cache')
+    @click.option('--entries', default=52, help='Logbook entries of the attachee.')
+    @click.option('--repeat', default=20, help='Downloads of the unchanged report.')
+    def bench_report_cache(entries, repeat):
+        """Logbook report downloads with the report cache off and on."""
+        from app.utils.benchmarks import report_cache_benchmark
+        click.echo(f'{"case":<26}{"time":>10}  identical')
+        for case, elapsed, identical in report_cache_benchmark(entries, repeat):
+            click.echo(f'{case:<26}{elapsed:>8.1f}ms  {"" if identical is None else identical}')
+
+    @bench.command('large-reports')
+    @click.option('--sizes', default='1000,10000,100000', help='Comma separated user counts.')
+    @click.option('--kinds', default='users,organizations', help='Comma separated reports to build.')
+    def bench_large_reports(sizes, kinds):
+        """User and organization report time and memory as the tables grow."""
+        from app.utils.benchmarks import large_report_benchmark
+        sizes = [int(size) for size in sizes.split(',')]
+        click.echo(f'{"report":<15}{"users":>9}{"time":>10}{"per user":>11}{"peak":>10}{"pdf":>9}')
+        for kind, size, seconds, per_user, peak, pdf in large_report_benchmark(sizes, kinds.split(',')):
+            click.echo(f'{kind:<15}{size:>9}{seconds:>9.2f}s{per_user:>9.0f}us{peak:>8.1f}MB{pdf:>7.1f}MB')
+
+    @bench.command('exports')
+    @click.option('--sizes', default='10000,100000', help='Comma separated logbook entry counts.')
+    @click.option('--formats', default='csv,xlsx', help='Comma separated export formats.')
+    def bench_exports(sizes, formats):
+        """Logbook export latency and memory as the table grows."""
+        from app.utils.benchmarks import export_benchmark
+        sizes = [int(size) for size in sizes.split(',')]
+        click.echo(f'{"format":<8}{"entries":>9}{"header":>10}{"rows":>10}{"total":>9}{"peak":>10}{"output":>10}')
+        for fmt, size, header, first, elapsed, peak, output in export_benchmark(sizes, formats.split(',')):
+            click.echo(f'{fmt:<8}{size:>9}{header:>8.1f}ms{first:>8.1f}ms{elapsed:>8.2f}s{peak:>8.1f}MB'
+                       f'{output:>8.1f}MB')
+
+    @bench.command('bulk-logbooks')
+    @click.option('--attachees', default=60, help='Attachees in the organization.')
+    @click.option('--entries', default=12, help='Logbook entries per attachee.')
+    @click.option('--workers', default='0,2', help='Comma separated REPORT_WORKERS values.')
+    def bench_bulk_logbooks(attachees, entries, workers):
+        """Organization logbook export streamed as a ZIP, serially and across the pool."""
+        from app.utils.benchmarks import bulk_logbook_benchmark
+        click.echo(f'{"workers":<10}{"first":>10}{"total":>10}{"reports":>9}')
+        for count, first, elapsed, reports in bulk_logbook_benchmark(
+                attachees, entries, [int(count) for count in workers.split(',')]):
+            click.echo(f'{count:<10}{first:>8.0f}ms{elapsed:>8.0f}ms{reports:>9}')
+
+    @bench.command('gevent-signaling')
+    @click.option('--database-url', envvar='BENCH_POSTGRES_URL', required=True,
+                  help='postgresql+psycopg2:// URL to run pg_sleep() against (or BENCH_POSTGRES_URL).')
+    @click.option('--slow-queries', default=8, help='Greenlets running slow queries meanwhile.')
+    @click.option('--query-seconds', default=0.5, help='Duration of each slow query.')
+    @click.option('--candidates', default=100, help='ICE candidates to relay.')
+    @click.option('--budget-ms', default=50.0, help='Fail if a candidate is delayed longer in gevent mode.')
+    def bench_gevent_signaling(database_url, slow_queries, query_seconds, candidates, budget_ms):
+        """ICE candidate relay delay while other greenlets wait on PostgreSQL."""
+        from app.utils.benchmarks import signaling_benchmark
+        click.echo(f'{"gevent mode":<12}{"median":>10}{"max":>10}')
+        results = signaling_benchmark(database_url, slow_queries, query_seconds, candidates)
+        for mode, median, slowest in results:
+            click.echo(f'{mode:<12}{median:>8.1f}ms{slowest:>8.1f}ms')
+        if results[-1][2] > budget_ms:
+            click.echo(f'Signaling was delayed {results[-1][2]:.1f}ms in gevent mode (budget {budget_ms:.0f}ms)', err=True)
+            raise SystemExit(1)
+
+    @bench.command('startup')
+    @click.option('--runs', default=3, help='Fresh interpreters to start; the fastest counts.')
+    @click.option('--budget-ms', default=1000.0, help='Fail if building the app takes longer.')
+    @click.option('--top', default=10, help='Packages to list by import time.')
+    def bench_startup(runs, budget_ms, top):
+        """Time importing and creating the app; fail over budget or if lazy modules load."""
+        from app.utils.benchmarks import startup_benchmark
+        total, packages, loaded = startup_benchmark(runs)
+        for package, ms in packages[:top]:
+            click.echo(f'{package:<26}{ms:>8.1f}ms')
+        click.echo(f'{"startup":<26}{total:>8.1f}ms (budget {budget_ms:.0f}ms)')
+        if loaded:
+            click.echo(f'Imported at startup but should load lazily: {", ".join(loaded)}', err=True)
+        if loaded or total > budget_ms:
+            raise SystemExit(1)
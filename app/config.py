@@ -11,11 +11,112 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Engine profile picked by backend (DATABASE_TUNING=0 keeps driver defaults,
+    # apart from the gevent settings below)
+    DATABASE_TUNING = os.environ.get('DATABASE_TUNING', '1') != '0'
+    # SQLite, applied as pragmas on every connection
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 15000)  # ms
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)  # bytes
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -64000)  # negative means KiB
+    # Connection pool per worker process (file-backed SQLite and PostgreSQL)
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 10)
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW') or 20)
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT') or 30)  # seconds
+    # Under gevent: 'auto' follows gevent's monkey patching, 'on'/'off' force it.
+    # psycopg2 then yields to other greenlets while waiting on the server, and
+    # the pool becomes a fixed size that greenlets queue for.
+    DATABASE_GEVENT_MODE = os.environ.get('DATABASE_GEVENT_MODE') or 'auto'
+    DATABASE_GEVENT_POOL_SIZE = int(os.environ.get('DATABASE_GEVENT_POOL_SIZE') or 40)
+    # PostgreSQL only
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE') or 1800)  # seconds
+    # PostgreSQL server-side limits in ms (0 disables)
+    DATABASE_STATEMENT_TIMEOUT = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT') or 30000)
+    DATABASE_LOCK_TIMEOUT = int(os.environ.get('DATABASE_LOCK_TIMEOUT') or 10000)
+    DATABASE_IDLE_IN_TRANSACTION_TIMEOUT = int(os.environ.get('DATABASE_IDLE_IN_TRANSACTION_TIMEOUT') or 60000)
+    
+    # Dashboard counters (seconds between reconciliations, 0 to rely on `flask reconcile-counters`)
+    COUNTER_RECONCILE_INTERVAL = int(os.environ.get('COUNTER_RECONCILE_INTERVAL') or 0)
+    
+    # Per-request SQL statistics (X-Query-Count/X-Query-Time headers and a log line)
+    QUERY_STATS_ENABLED = os.environ.get('QUERY_STATS_ENABLED', '1') != '0'
+    # A statement repeated this many times in one request is reported as an N+1
+    QUERY_STATS_REPEAT_THRESHOLD = int(os.environ.get('QUERY_STATS_REPEAT_THRESHOLD') or 5)
+    # Fail such requests with NPlusOneError (meant for tests)
+    QUERY_STATS_STRICT = os.environ.get('QUERY_STATS_STRICT') is not None
     
     # File Upload
     UPLOAD_FOLDER = os.path.join(basedir, 'attachepro', 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
     
+    # Cached user loader (per process; a TTL of 0 disables it)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)
+    
+    # Video room access cached per process for Socket.IO joins and signaling;
+    # commits invalidate it locally, the TTL bounds staleness in other workers
+    ROOM_CACHE_SIZE = int(os.environ.get('ROOM_CACHE_SIZE') or 4096)
+    ROOM_CACHE_TTL = int(os.environ.get('ROOM_CACHE_TTL') or 60)
+    
+    # ICE candidate relay. With ICE_COALESCE_MS above 0, candidates are sent
+    # to the peer in batches that wait that long; each connection buffers at
+    # most ICE_QUEUE_SIZE, held up to ICE_MAX_HOLD_MS for a slow receiver
+    ICE_COALESCE_MS = int(os.environ.get('ICE_COALESCE_MS') or 0)
+    ICE_QUEUE_SIZE = int(os.environ.get('ICE_QUEUE_SIZE') or 32)
+    ICE_MAX_HOLD_MS = int(os.environ.get('ICE_MAX_HOLD_MS') or 500)
+    
+    # Bearer token a Prometheus scraper sends to /metrics (admins can always
+    # view it); metrics are per worker, so scrape each one
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+    
+    # Background report jobs. Reports are written outside the static folder
+    # and only served to users allowed to see them
+    REPORT_FOLDER = os.environ.get('REPORT_FOLDER') or os.path.join(os.path.dirname(basedir), 'reports')
+    # Processes building reports (0 builds them in a greenlet of the worker)
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS') or 2)
+    # Queued and running jobs beyond which new reports are refused
+    REPORT_MAX_ACTIVE = int(os.environ.get('REPORT_MAX_ACTIVE') or 20)
+    # Seconds after which an unfinished job is considered lost
+    REPORT_JOB_TIMEOUT = int(os.environ.get('REPORT_JOB_TIMEOUT') or 900)
+    # Seconds a finished job and its file are kept for download (0 keeps them)
+    REPORT_RETENTION = int(os.environ.get('REPORT_RETENTION') or 24 * 3600)
+    REPORT_PROGRESS_INTERVAL = float(os.environ.get('REPORT_PROGRESS_INTERVAL') or 0.5)  # seconds
+    # 'job' writes reports to REPORT_FOLDER from background jobs with a
+    # progress page; 'stream' builds them in memory and sends them as the
+    # response, writing nothing to disk. A streaming worker holds at most
+    # REPORT_STREAM_MAX_ACTIVE reports in memory and refuses more
+    REPORT_DELIVERY = os.environ.get('REPORT_DELIVERY') or 'job'
+    REPORT_STREAM_MAX_ACTIVE = int(os.environ.get('REPORT_STREAM_MAX_ACTIVE') or 4)
+    REPORT_STREAM_CHUNK_SIZE = int(os.environ.get('REPORT_STREAM_CHUNK_SIZE') or 64 * 1024)  # bytes
+    # Built logbook reports kept per process, keyed on a fingerprint of their
+    # data, so an unchanged logbook is not rebuilt (0 disables the cache)
+    REPORT_CACHE_BYTES = int(os.environ.get('REPORT_CACHE_BYTES') or 64 * 2 ** 20)
+    
+    # Socket.IO across workers. SOCKETIO_MESSAGE_QUEUE relays events between
+    # them: a redis://, kafka:// or amqp:// URL, or a sqlite:// URL for a
+    # file shared by the workers of one host. PRESENCE_URL is
+    # the database holding video room participants; empty keeps them per process.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+    SOCKETIO_QUEUE_POLL_INTERVAL = float(os.environ.get('SOCKETIO_QUEUE_POLL_INTERVAL') or 0.02)  # seconds
+    PRESENCE_URL = os.environ.get('PRESENCE_URL') or None
+    # Seconds between refreshes of this worker's live connections, and after
+    # which an unrefreshed connection is dropped from its rooms (0 disables)
+    PRESENCE_HEARTBEAT_INTERVAL = int(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL') or 30)
+    PRESENCE_TTL = int(os.environ.get('PRESENCE_TTL') or 90)
+    
+    # Typeahead index (per process; seconds between reloads picking up other
+    # workers' changes, 0 to load once at startup)
+    AUTOCOMPLETE_REFRESH_INTERVAL = int(os.environ.get('AUTOCOMPLETE_REFRESH_INTERVAL') or 300)
+    
+    # Password hashing. Stored hashes made with another method are upgraded on
+    # the next successful login. The hash must fit User.password_hash (128 chars).
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'
+    # Processes hashing off the request worker (0 hashes inline)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    # Hashes running or queued at once; further logins wait their turn
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING') or 16)
+    
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
@@ -1,7 +1,13 @@
-from flask import render_template, redirect, url_for, flash, request
+import hmac
+from flask import render_template, redirect, url_for, flash, request, jsonify, abort, current_app, send_from_directory
 from flask_login import current_user, login_required
-from app.models import User, UserRole, VideoSession, LogbookEntry
+from app.models import User, UserRole, VideoSession, LogbookEntry, Notification, ReportJob, ReportStatus
 from app.main import main
+from app.socket.metrics import render_metrics
+from app.utils.autocomplete import autocomplete as typeahead, user_scopes, organization_scopes
+from app.utils.notifications import mark_read
+from app.utils.pagination import keyset_paginate
+from app.utils.reports import PARAMS, can_access, report_filename, request_report, stream_report, serialize, ReportsBusy
 from datetime import datetime
 
 @main.route('/')
@@ -32,4 +38,106 @@ def contact():
 @main.route('/features')
 def features():
     """Features page route"""
-    return render_template('main/features.html', title='Features')
\ No newline at end of file
+    return render_template('main/features.html', title='Features')
+
+@main.route('/autocomplete/<kind>')
+@login_required
+def autocomplete(kind):
+    """Typeahead suggestions for the user, attachee and organization search boxes"""
+    prefix = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 10, type=int), 25)
+    if kind not in ('users', 'organizations'):
+        return jsonify({'error': 'Unknown kind'}), 404
+    if len(prefix) < 2 or limit < 1:
+        return jsonify(results=[])
+    typeahead.ensure_loaded()
+    if kind == 'organizations':
+        return jsonify(results=typeahead.organizations(prefix, organization_scopes(current_user), limit))
+    scopes = user_scopes(current_user)
+    # Admins can narrow to one role, like the user list's role filter
+    role = request.args.get('role', '')
+    if role in UserRole.__members__:
+        scopes = [scope for scope in scopes if scope[0] == UserRole[role]]
+    return jsonify(results=typeahead.users(prefix, scopes, limit))
+
+@main.route('/notifications')
+@login_required
+def notifications():
+    """Notifications for the current user, newest first"""
+    cursor = request.args.get('cursor')
+    query = Notification.query.filter_by(user_id=current_user.id)
+    notifications = keyset_paginate(query, (Notification.created_at, Notification.id),
+                                    cursor=cursor, per_page=20)
+    return render_template('main/notifications.html',
+                          title='Notifications',
+                          notifications=notifications)
+
+@main.route('/notifications/<int:notification_id>/read', methods=['POST'])
+@login_required
+def mark_notification_read(notification_id):
+    notification = Notification.query.filter_by(id=notification_id, user_id=current_user.id).first_or_404()
+    mark_read(current_user.id, [notification.id])
+    # "Open" marks the notification read on the way to the page it is about
+    if request.form.get('open') and notification.link:
+        return redirect(notification.link)
+    return redirect(url_for('main.notifications'))
+
+@main.route('/notifications/read-all', methods=['POST'])
+@login_required
+def mark_all_notifications_read():
+    mark_read(current_user.id)
+    return redirect(url_for('main.notifications'))
+
+@main.route('/metrics')
+def metrics():
+    """Prometheus metrics for this worker, for the METRICS_TOKEN bearer or an admin"""
+    token = current_app.config['METRICS_TOKEN']
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    authorized = (token and hmac.compare_digest(supplied, token)) or \
+        (current_user.is_authenticated and current_user.role == UserRole.ADMIN)
+    if not authorized:
+        abort(403)
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@main.route('/reports', methods=['POST'])
+@login_required
+def create_report():
+    """
+    Queue a report, or join the job already building it, and show its
+    progress; with REPORT_DELIVERY set to 'stream', send the report itself
+    """
+    kind = request.form.get('kind', '')
+    params = {name: request.form.get(name, type=int) for name in PARAMS.get(kind, ())}
+    if not can_access(current_user, kind, params):
+        abort(403)
+    try:
+        if current_app.config['REPORT_DELIVERY'] == 'stream':
+            return stream_report(kind, params, report_filename(kind))
+        job = request_report(current_user, kind, params)
+    except ReportsBusy:
+        flash('Too many reports are being generated. Please try again in a few minutes.', 'warning')
+        return redirect(request.referrer or url_for('main.index'))
+    return redirect(url_for('main.report', job_id=job.id))
+
+def _report_job(job_id):
+    job = ReportJob.query.get_or_404(job_id)
+    if not can_access(current_user, job.kind, job.params):
+        abort(403)
+    return job
+
+@main.route('/reports/<int:job_id>')
+@login_required
+def report(job_id):
+    """Progress of a report job, with its download link once done"""
+    job = _report_job(job_id)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(serialize(job))
+    return render_template('main/report.html', title='Report', job=job, ReportStatus=ReportStatus)
+
+@main.route('/reports/<int:job_id>/download')
+@login_required
+def download_report(job_id):
+    job = _report_job(job_id)
+    if job.status != ReportStatus.DONE:
+        abort(404)
+    return send_from_directory(current_app.config['REPORT_FOLDER'], job.filename, as_attachment=True)
@@ -1,7 +1,6 @@
 from datetime import datetime
 from flask import current_app
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
 import enum
 import os
@@ -32,6 +31,13 @@ class VideoSessionStatus(enum.Enum):
     CANCELLED = 'cancelled'
 
 
+class ReportStatus(enum.Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
 # Association tables for many-to-many relationships
 assessor_attachee = db.Table('assessor_attachee',
     db.Column('assessor_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
@@ -41,7 +47,8 @@ assessor_attachee = db.Table('assessor_attachee',
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from app.utils.user_cache import load_cached_user
+    return load_cached_user(int(user_id))
 
 
 class User(db.Model, UserMixin):
@@ -55,6 +62,14 @@ class User(db.Model, UserMixin):
     last_login = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     
+    # Indexes for the role/organization filtered user lists
+    __table_args__ = (
+        db.Index('ix_user_role_username', 'role', 'username'),
+        db.Index('ix_user_organization_id_role_username', 'organization_id', 'role', 'username'),
+        db.Index('ix_user_username', 'username'),
+        db.Index('ix_user_created_at', 'created_at'),
+    )
+    
     # Relationships
     organization = db.relationship('Organization', back_populates='users')
     attachee_profile = db.relationship('AttacheeProfile', back_populates='user', uselist=False)
@@ -79,10 +94,16 @@ class User(db.Model, UserMixin):
         super(User, self).__init__(**kwargs)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        from app.utils.passwords import hash_password
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        from app.utils.passwords import verify_password
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        from app.utils.passwords import needs_rehash
+        return needs_rehash(self.password_hash)
     
     def is_admin(self):
         return self.role == UserRole.ADMIN
@@ -159,6 +180,15 @@ class LogbookEntry(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Indexes for the logbook lists and dashboards
+    __table_args__ = (
+        db.Index('ix_logbook_entry_attachee_id_created_at', 'attachee_id', 'created_at'),
+        db.Index('ix_logbook_entry_attachee_id_status', 'attachee_id', 'status'),
+        db.Index('ix_logbook_entry_attachee_id_week_number', 'attachee_id', 'week_number'),
+        db.Index('ix_logbook_entry_status_created_at', 'status', 'created_at'),
+        db.Index('ix_logbook_entry_created_at', 'created_at'),
+    )
+    
     # Relationships
     attachee = db.relationship('User', foreign_keys=[attachee_id], back_populates='logbook_entries')
     org_approver = db.relationship('User', foreign_keys=[org_approved_by])
@@ -185,6 +215,11 @@ class FileUpload(db.Model):
     description = db.Column(db.Text, nullable=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Index for the attachee file list
+    __table_args__ = (
+        db.Index('ix_file_upload_attachee_id_uploaded_at', 'attachee_id', 'uploaded_at'),
+    )
+    
     # Relationships
     attachee = db.relationship('User', back_populates='file_uploads')
     
@@ -205,6 +240,12 @@ class VideoSession(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Indexes for the per-participant session lists
+    __table_args__ = (
+        db.Index('ix_video_session_assessor_id_status_start_time', 'assessor_id', 'status', 'start_time'),
+        db.Index('ix_video_session_attachee_id_status_start_time', 'attachee_id', 'status', 'start_time'),
+    )
+    
     # Relationships
     attachee = db.relationship('User', foreign_keys=[attachee_id], back_populates='initiated_sessions')
     assessor = db.relationship('User', foreign_keys=[assessor_id], back_populates='received_sessions')
@@ -222,6 +263,12 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Indexes for the notification list and the unread badge
+    __table_args__ = (
+        db.Index('ix_notification_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_notification_user_id_is_read', 'user_id', 'is_read'),
+    )
+    
     # Relationships
     user = db.relationship('User', back_populates='notifications')
     
@@ -261,4 +308,38 @@ class Announcement(db.Model):
     organization = db.relationship('Organization')
     
     def __repr__(self):
-        return f'<Announcement {self.title}, Active: {self.is_active}>'
\ No newline at end of file
+        return f'<Announcement {self.title}, Active: {self.is_active}>'
+
+
+class DashboardCounter(db.Model):
+    """Materialized row counts read by the dashboards, see app/utils/counters.py"""
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DashboardCounter {self.key}={self.value}>'
+
+
+class ReportJob(db.Model):
+    """A report built in the background, see app/utils/reports.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    # Kind and parameters; concurrent requests with the same key share a job
+    key = db.Column(db.String(100), nullable=False)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    requested_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.Enum(ReportStatus), nullable=False, default=ReportStatus.QUEUED)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    filename = db.Column(db.String(200), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Lookup of the active job for a key
+    __table_args__ = (
+        db.Index('ix_report_job_key_status', 'key', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<ReportJob {self.key}, Status: {self.status.value}>'
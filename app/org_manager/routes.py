@@ -5,6 +5,11 @@ from app.models import User, Organization, AttacheeProfile, LogbookEntry, UserRo
 from app.org_manager import org_manager
 from app.org_manager.forms import AttacheeForm, LogbookReviewForm
 from app.utils.decorators import role_required
+from app.utils.pagination import keyset_paginate
+from app.utils.search import search_users, search_logbook_entries, attach_snippets
+from app.utils.counters import get_counters, role_key, status_key
+from app.utils.loading import JOINED_LOGBOOK_WITH_ATTACHEE, ATTACHEE_WITH_PROFILE
+from app.utils.exports import export_logbook_entries
 from datetime import datetime
 from sqlalchemy import func
 
@@ -16,17 +21,10 @@ def dashboard():
     # Get counts for various metrics
     org_id = current_user.organization_id
     
-    # Count users in this organization
-    attachee_count = User.query.filter_by(organization_id=org_id, role=UserRole.ATTACHEE).count()
-    
-    # Count pending logbook entries - explicitly specify join condition
-    pending_logbooks = LogbookEntry.query.join(
-        User,
-        LogbookEntry.attachee_id == User.id  # Explicit join condition
-    ).filter(
-        User.organization_id == org_id,
-        LogbookEntry.status == LogbookStatus.SUBMITTED
-    ).count()
+    # Count attachees and pending logbook entries in this organization
+    counts = get_counters(role_key(UserRole.ATTACHEE, org_id), status_key(LogbookStatus.SUBMITTED, org_id))
+    attachee_count = counts[role_key(UserRole.ATTACHEE, org_id)]
+    pending_logbooks = counts[status_key(LogbookStatus.SUBMITTED, org_id)]
     
     # Get recent attachees in this organization
     recent_attachees = User.query.filter_by(
@@ -38,7 +36,7 @@ def dashboard():
     recent_entries = LogbookEntry.query.join(
         User,
         LogbookEntry.attachee_id == User.id  # Explicit join condition
-    ).filter(
+    ).options(*JOINED_LOGBOOK_WITH_ATTACHEE).filter(
         User.organization_id == org_id,
         LogbookEntry.status == LogbookStatus.SUBMITTED
     ).order_by(LogbookEntry.created_at.desc()).limit(5).all()
@@ -55,20 +53,22 @@ def dashboard():
 @role_required(UserRole.ORG_MANAGER)
 def attachees():
     """List all attachees in the organization"""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     org_id = current_user.organization_id
     
     # Get all attachees in this organization
-    query = User.query.filter_by(organization_id=org_id, role=UserRole.ATTACHEE)
+    query = User.query.options(*ATTACHEE_WITH_PROFILE).filter_by(organization_id=org_id, role=UserRole.ATTACHEE)
     
     # Apply search filter if provided
     search_term = request.args.get('search', '')
+    sort_key = (User.username, User.id)
     if search_term:
-        query = query.filter(User.username.ilike(f'%{search_term}%') | 
-                            User.email.ilike(f'%{search_term}%'))
+        query, rank = search_users(query, search_term)
+        sort_key = (rank, User.id)
     
     # Paginate results
-    attachees = query.order_by(User.username).paginate(page=page, per_page=20)
+    attachees = keyset_paginate(query, sort_key, cursor=cursor,
+                                per_page=20, descending=False)
     
     return render_template('org_manager/attachees.html',
                           title='Manage Attachees',
@@ -99,7 +99,40 @@ def view_attachee(attachee_id):
 @role_required(UserRole.ORG_MANAGER)
 def logbooks():
     """List all logbooks for review"""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    query, sort_key, status_filter, search = _filtered_logbooks()
+    query = query.options(*JOINED_LOGBOOK_WITH_ATTACHEE)
+    
+    # Newest first, or best match first when searching the entry text
+    if search['q']:
+        entries = keyset_paginate(query, sort_key, cursor=cursor, per_page=10, descending=False)
+        attach_snippets(entries.items, search['q'])
+    else:
+        entries = keyset_paginate(query, sort_key, cursor=cursor, per_page=10)
+    
+    return render_template('org_manager/logbooks.html',
+                          title='Review Logbooks',
+                          entries=entries,
+                          status_filter=status_filter,
+                          search=search)
+
+@org_manager.route('/logbooks/export')
+@login_required
+@role_required(UserRole.ORG_MANAGER)
+def export_logbooks():
+    """This organization's logbook entries matching the review list's filters, as CSV or XLSX"""
+    query, sort_key, _, search = _filtered_logbooks()
+    return export_logbook_entries(query, sort_key, request.args.get('format', 'csv'), descending=not search['q'])
+
+def _filtered_logbooks():
+    """
+    This organization's logbook entries matching the review list's query string
+    
+    Returns:
+        Tuple of (query joined to the attachee, sort key, status filter,
+        search args); the list shows the sort key descending, or ascending
+        when searching
+    """
     status_filter = request.args.get('status', 'submitted')
     org_id = current_user.organization_id
     
@@ -118,13 +151,19 @@ def logbooks():
             # Invalid status, ignore filter
             pass
     
-    # Order by date and paginate
-    entries = query.order_by(LogbookEntry.created_at.desc()).paginate(page=page, per_page=10)
-    
-    return render_template('org_manager/logbooks.html',
-                          title='Review Logbooks',
-                          entries=entries,
-                          status_filter=status_filter)
+    # Narrow by week range
+    search = dict(q=request.args.get('q', '').strip(),
+                  week_from=request.args.get('week_from', type=int),
+                  week_to=request.args.get('week_to', type=int))
+    if search['week_from']:
+        query = query.filter(LogbookEntry.week_number >= search['week_from'])
+    if search['week_to']:
+        query = query.filter(LogbookEntry.week_number <= search['week_to'])
+    
+    if search['q']:
+        query, rank = search_logbook_entries(query, search['q'])
+        return query, (rank, LogbookEntry.id), status_filter, search
+    return query, (LogbookEntry.created_at, LogbookEntry.id), status_filter, search
 
 @org_manager.route('/logbook/<int:entry_id>', methods=['GET', 'POST'])
 @login_required
@@ -175,9 +214,11 @@ def organization():
     organization = Organization.query.get_or_404(org_id)
     
     # Get counts
-    attachee_count = User.query.filter_by(organization_id=org_id, role=UserRole.ATTACHEE).count()
-    assessor_count = User.query.filter_by(organization_id=org_id, role=UserRole.ASSESSOR).count()
-    manager_count = User.query.filter_by(organization_id=org_id, role=UserRole.ORG_MANAGER).count()
+    counts = get_counters(role_key(UserRole.ATTACHEE, org_id), role_key(UserRole.ASSESSOR, org_id),
+                          role_key(UserRole.ORG_MANAGER, org_id))
+    attachee_count = counts[role_key(UserRole.ATTACHEE, org_id)]
+    assessor_count = counts[role_key(UserRole.ASSESSOR, org_id)]
+    manager_count = counts[role_key(UserRole.ORG_MANAGER, org_id)]
     
     return render_template('org_manager/organization.html',
                           title=f'Organization: {organization.name}',
@@ -1,71 +1,71 @@
 from flask import request, current_app
-from flask_socketio import emit, join_room, leave_room
+from flask_socketio import emit, join_room, leave_room, rooms
 from flask_login import current_user
-from app import socketio, db
-from app.models import VideoSession, User, VideoSessionStatus
+from app import db
+from app.models import VideoSession, VideoSessionStatus, ReportJob
+from app.utils.notifications import user_room, unread_count
+from app.socket.presence import get_presence
+from app.socket.room_cache import get_room
+from app.socket.relay import ice_relay
+from app.socket.metrics import on
+from app.utils.reports import can_access, report_room, serialize
 from datetime import datetime
 import json
 
-# Store active rooms and participants
-active_rooms = {}
-
-@socketio.on('connect')
+@on('connect')
 def handle_connect():
     if not current_user.is_authenticated:
         return False
     print(f"User {current_user.username} connected")
+    # Every tab of a user shares one room, so notifications reach all of them
+    join_room(user_room(current_user.id))
+    emit('notification_count', {'unread': unread_count(current_user.id)})
 
-@socketio.on('disconnect')
+@on('disconnect')
 def handle_disconnect():
     print(f"User {current_user.username if current_user.is_authenticated else 'Anonymous'} disconnected")
-    # Clean up any rooms the user was in
-    for room_id, participants in list(active_rooms.items()):
-        if current_user.id in participants:
-            participants.remove(current_user.id)
-            # Notify others in the room
+    ice_relay.discard(request.sid)
+    # Clean up any rooms this connection was in
+    for room_id, participants in get_presence().disconnect(request.sid).items():
+        # Notify others in the room, unless the user is still there from another tab
+        if current_user.is_authenticated and current_user.id not in participants:
             emit('user_left', {'user_id': current_user.id, 'username': current_user.username}, room=room_id)
-            # If room is empty, remove it
-            if not participants:
-                del active_rooms[room_id]
 
-@socketio.on('join_room')
+@on('join_room')
 def handle_join_room(data):
     room_id = data.get('room_id')
     if not room_id:
         emit('error', {'message': 'Room ID is required'})
         return
     
-    # Check if the session exists and user has permission
-    session = VideoSession.query.filter_by(room_id=room_id).first()
+    # Check if the session exists and user has permission, from the room
+    # cache so reconnect storms do not query per attempt
+    session = get_room(room_id)
     if not session:
         emit('error', {'message': 'Invalid room ID'})
         return
     
     # Check if user is authorized to join this room
-    if current_user.id != session.attachee_id and current_user.id != session.assessor_id:
+    if current_user.id not in session.usernames:
         emit('error', {'message': 'You are not authorized to join this room'})
         return
     
-    # Join the room
-    join_room(room_id)
-    
-    # Initialize room if not exists
-    if room_id not in active_rooms:
-        active_rooms[room_id] = []
+    if session.status == VideoSessionStatus.CANCELLED:
+        emit('error', {'message': 'This session has been cancelled'})
+        return
     
-    # Add user to room participants if not already there
-    if current_user.id not in active_rooms[room_id]:
-        active_rooms[room_id].append(current_user.id)
+    # Join the room, recording the participant for every worker
+    join_room(room_id)
+    participants = get_presence().join(room_id, request.sid, current_user.id)
     
     # Get other participant info
     other_participant_id = session.attachee_id if current_user.id == session.assessor_id else session.assessor_id
-    other_participant = User.query.get(other_participant_id)
     
     # Notify others in the room
     emit('user_joined', {
         'user_id': current_user.id,
         'username': current_user.username,
-        'participants': active_rooms[room_id]
+        'participants': participants
     }, room=room_id)
     
     # Send room info to the user
@@ -73,13 +73,13 @@ def handle_join_room(data):
         'room_id': room_id,
         'session_title': session.title,
         'other_participant': {
-            'id': other_participant.id,
-            'username': other_participant.username
+            'id': other_participant_id,
+            'username': session.usernames[other_participant_id]
         },
-        'participants': active_rooms[room_id]
+        'participants': participants
     })
 
-@socketio.on('leave_room')
+@on('leave_room')
 def handle_leave_room(data):
     room_id = data.get('room_id')
     if not room_id:
@@ -87,20 +87,18 @@ def handle_leave_room(data):
     
     leave_room(room_id)
     
-    # Remove user from room participants
-    if room_id in active_rooms and current_user.id in active_rooms[room_id]:
-        active_rooms[room_id].remove(current_user.id)
+    # Remove this connection from the room's participants
+    participants = get_presence().leave(room_id, request.sid)
+    if participants is not None and current_user.id not in participants:
         # Notify others in the room
         emit('user_left', {'user_id': current_user.id, 'username': current_user.username}, room=room_id)
-        # If room is empty, remove it
-        if not active_rooms[room_id]:
-            del active_rooms[room_id]
 
 # WebRTC signaling
-@socketio.on('offer')
+@on('offer')
 def handle_offer(data):
     room_id = data.get('room_id')
-    if not room_id or room_id not in active_rooms:
+    # Only relay for connections that joined the room; rooms() is local state
+    if not room_id or room_id not in rooms():
         return
     
     # Forward the offer to others in the room
@@ -109,10 +107,10 @@ def handle_offer(data):
         'user_id': current_user.id
     }, room=room_id, include_self=False)
 
-@socketio.on('answer')
+@on('answer')
 def handle_answer(data):
     room_id = data.get('room_id')
-    if not room_id or room_id not in active_rooms:
+    if not room_id or room_id not in rooms():
         return
     
     # Forward the answer to others in the room
@@ -121,30 +119,45 @@ def handle_answer(data):
         'user_id': current_user.id
     }, room=room_id, include_self=False)
 
-@socketio.on('ice_candidate')
+@on('ice_candidate')
 def handle_ice_candidate(data):
     room_id = data.get('room_id')
-    if not room_id or room_id not in active_rooms:
+    if not room_id or room_id not in rooms():
         return
     
-    # Forward the ICE candidate to others in the room
-    emit('ice_candidate', {
-        'candidate': data.get('candidate'),
-        'user_id': current_user.id
-    }, room=room_id, include_self=False)
+    # Forward the ICE candidate to others in the room, batched with the
+    # next few when ICE_COALESCE_MS is set
+    ice_relay.relay(room_id, request.sid, current_user.id, data.get('candidate'))
 
-@socketio.on('end_call')
+@on('end_call')
 def handle_end_call(data):
     room_id = data.get('room_id')
-    if not room_id or room_id not in active_rooms:
+    if not room_id or room_id not in rooms():
         return
     
     # Notify everyone in the room that the call has ended
     emit('call_ended', {'user_id': current_user.id}, room=room_id)
     
-    # Update session status if needed
-    session = VideoSession.query.filter_by(room_id=room_id).first()
+    # Update session status if needed; the cached status saves the query
+    # when the other participant already ended the call
+    room = get_room(room_id)
+    if not room or room.status != VideoSessionStatus.SCHEDULED:
+        return
+    session = db.session.get(VideoSession, room.session_id)
     if session and session.status == VideoSessionStatus.SCHEDULED:
         session.status = VideoSessionStatus.COMPLETED
         session.completed_date = datetime.now()
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+
+# Report jobs
+@on('watch_report')
+def handle_watch_report(data):
+    job = db.session.get(ReportJob, data.get('job_id') or 0)
+    if not job or not can_access(current_user, job.kind, job.params):
+        emit('error', {'message': 'Report not found'})
+        return
+    
+    # Progress is emitted to the job's room; send the current state now in
+    # case the job finished before the page connected
+    join_room(report_room(job.id))
+    emit('report_progress', serialize(job))
@@ -0,0 +1,102 @@
+import pickle
+import time
+import socketio
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, Float, LargeBinary, select, delete, func
+from app.utils.engine import create_tuned_engine
+
+metadata = MetaData()
+
+socket_message = Table(
+    'socket_message', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('channel', String(64), nullable=False),
+    Column('payload', LargeBinary, nullable=False),
+    Column('created_at', Float, nullable=False),
+    Index('ix_socket_message_created_at', 'created_at'),
+    # Never reuse the ids of pruned messages: listeners skip ids <= the last they read
+    sqlite_autoincrement=True,
+)
+
+
+class DatabaseManager(socketio.PubSubManager):
+    """
+    Socket.IO client manager that relays events between workers through a
+    database table, for hosts without Redis or a message broker
+
+    Each worker appends the events it emits and polls for events appended by
+    the others. SQLite serialises writers, so ids are seen in commit order,
+    and AUTOINCREMENT keeps them rising after old messages are pruned. Only
+    SQLite is supported: PostgreSQL hands out serial ids before commit, so a
+    late commit with a lower id would be skipped. Across hosts use a Redis
+    message_queue instead.
+    """
+    name = 'database'
+
+    def __init__(self, engine, channel='flask-socketio', write_only=False, logger=None,
+                 poll_interval=0.02, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._created = False
+
+    def _connect(self):
+        # Create the table on first use rather than at app startup
+        if not self._created:
+            metadata.create_all(self.engine)
+            self._created = True
+        return self.engine.begin()
+
+    def _publish(self, data):
+        with self._connect() as connection:
+            connection.execute(socket_message.insert().values(channel=self.channel, payload=pickle.dumps(data),
+                                                              created_at=time.time()))
+
+    def _listen(self):
+        with self._connect() as connection:
+            last_id = connection.scalar(select(func.max(socket_message.c.id))) or 0
+        pruned_at = time.monotonic()
+        while True:
+            try:
+                with self._connect() as connection:
+                    rows = connection.execute(select(socket_message.c.id, socket_message.c.payload)
+                                              .where(socket_message.c.id > last_id,
+                                                     socket_message.c.channel == self.channel)
+                                              .order_by(socket_message.c.id)).all()
+                    # Any worker may drop messages every listener has long since read
+                    if time.monotonic() - pruned_at > self.retention:
+                        connection.execute(delete(socket_message)
+                                           .where(socket_message.c.created_at < time.time() - self.retention))
+                        pruned_at = time.monotonic()
+            except Exception:
+                self._get_logger().exception('Cannot read the socket message table, retrying')
+                rows = []
+            for message_id, payload in rows:
+                last_id = message_id
+                yield payload
+            self.server.sleep(self.poll_interval)
+
+
+def socketio_options(config):
+    """
+    Keyword arguments for socketio.init_app sharing events between workers
+
+    Args:
+        config: Application config
+
+    Returns:
+        {} for a single worker, message_queue for Redis, Kafka or AMQP URLs,
+        or a DatabaseManager for SQLite URLs
+
+    Raises:
+        ValueError: for a PostgreSQL URL, whose ids are not in commit order
+    """
+    url = config['SOCKETIO_MESSAGE_QUEUE']
+    if not url:
+        return {}
+    if url.startswith(('postgresql:', 'postgresql+')):
+        raise ValueError('SOCKETIO_MESSAGE_QUEUE cannot be a PostgreSQL database; use SQLite or a Redis URL')
+    if url.startswith('sqlite:'):
+        return {'client_manager': DatabaseManager(create_tuned_engine(url, config),
+                                                  poll_interval=config['SOCKETIO_QUEUE_POLL_INTERVAL'])}
+    return {'message_queue': url}
@@ -0,0 +1,181 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+# Upper bounds of the handler latency buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _EventStats:
+    """Counters for one event: a latency histogram and the last minute of calls"""
+    __slots__ = ('calls', 'errors', 'seconds', 'buckets', 'window', 'window_second')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        # Calls per second for the last 60 seconds, as a ring
+        self.window = [0] * 60
+        self.window_second = 0
+
+    def _advance(self, second):
+        gap = second - self.window_second
+        if gap >= 60:
+            self.window = [0] * 60
+        else:
+            for skipped in range(self.window_second + 1, self.window_second + 1 + max(gap, 0)):
+                self.window[skipped % 60] = 0
+        self.window_second = max(second, self.window_second)
+
+    def record(self, elapsed, failed, second):
+        self.calls += 1
+        self.errors += failed
+        self.seconds += elapsed
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+        if second != self.window_second:
+            self._advance(second)
+        self.window[second % 60] += 1
+
+    def rate(self, second):
+        """Calls per second over the last full minute"""
+        self._advance(second)
+        return (sum(self.window) - self.window[second % 60]) / 59
+
+
+class SocketMetrics:
+    """
+    Per-process Socket.IO handler metrics
+
+    Recording is a perf_counter pair, a bisect and a few integer updates
+    under a lock, so it can stay on in production. Each worker counts only
+    the events it handled.
+    """
+
+    def __init__(self):
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def record(self, event, elapsed, failed=False):
+        with self._lock:
+            stats = self._events.get(event)
+            if stats is None:
+                stats = self._events[event] = _EventStats()
+            stats.record(elapsed, failed, int(time.monotonic()))
+
+    def instrument(self, event, handler):
+        """Wrap a handler so each call is timed and failures are counted"""
+        # Flask-SocketIO retries connect handlers without the auth argument
+        # on TypeError; drop the arguments up front so that is not an error
+        takes_args = bool(inspect.signature(handler).parameters)
+
+        @functools.wraps(handler)
+        def timed(*args):
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = handler(*args) if takes_args else handler()
+                failed = False
+                return result
+            finally:
+                self.record(event, time.perf_counter() - started, failed)
+        return timed
+
+    def snapshot(self):
+        """
+        Current counters per event
+
+        Returns:
+            {event: {'calls', 'errors', 'seconds', 'rate', 'buckets'}}, where
+            buckets pairs each upper bound with a cumulative count
+        """
+        second = int(time.monotonic())
+        with self._lock:
+            events = {}
+            for event, stats in sorted(self._events.items()):
+                cumulative, total = [], 0
+                for bound, count in zip(BUCKETS + (float('inf'),), stats.buckets):
+                    total += count
+                    cumulative.append((bound, total))
+                events[event] = {'calls': stats.calls, 'errors': stats.errors, 'seconds': stats.seconds,
+                                 'rate': stats.rate(second), 'buckets': cumulative}
+            return events
+
+
+socket_metrics = SocketMetrics()
+
+
+def on(event, namespace=None):
+    """socketio.on that records the handler's latency, call rate and errors"""
+    from app import socketio
+
+    def decorator(handler):
+        socketio.on(event, namespace)(socket_metrics.instrument(event, handler))
+        return handler
+    return decorator
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics():
+    """
+    This worker's Socket.IO, relay and cache metrics in the Prometheus text
+    exposition format
+    """
+    from app import socketio
+    from app.socket.relay import ice_relay
+    from app.socket.room_cache import room_cache
+    from app.utils.report_cache import report_cache
+    from app.utils.user_cache import user_cache
+    lines = []
+
+    def metric(name, kind, help, samples):
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(v)}"' for key, v in labels.items())
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+    events = socket_metrics.snapshot()
+    lines.append('# HELP socketio_handler_seconds Socket.IO handler latency')
+    lines.append('# TYPE socketio_handler_seconds histogram')
+    for event, stats in events.items():
+        for bound, count in stats['buckets']:
+            le = '+Inf' if bound == float('inf') else bound
+            lines.append(f'socketio_handler_seconds_bucket{{event="{_label(event)}",le="{le}"}} {count}')
+        lines.append(f'socketio_handler_seconds_sum{{event="{_label(event)}"}} {stats["seconds"]:.6f}')
+        lines.append(f'socketio_handler_seconds_count{{event="{_label(event)}"}} {stats["calls"]}')
+    metric('socketio_handler_errors_total', 'counter', 'Socket.IO handlers that raised',
+           [({'event': event}, stats['errors']) for event, stats in events.items()])
+    metric('socketio_events_per_second', 'gauge', 'Socket.IO events handled per second over the last minute',
+           [({'event': event}, round(stats['rate'], 3)) for event, stats in events.items()])
+
+    server = socketio.server
+    connected = len(server.manager.rooms.get('/', {}).get(None, {})) if server else 0
+    metric('socketio_connected_clients', 'gauge', 'Socket.IO connections to this worker', [({}, connected)])
+
+    relay = ice_relay.stats()
+    metric('ice_relay_candidates_total', 'counter', 'ICE candidates received for relaying',
+           [({}, relay['candidates'])])
+    metric('ice_relay_events_total', 'counter', 'ICE candidate events emitted', [({}, relay['events'])])
+    metric('ice_relay_merged_total', 'counter', 'Repeated ICE candidates merged', [({}, relay['merged'])])
+    metric('ice_relay_dropped_total', 'counter', 'ICE candidates dropped from full queues',
+           [({}, relay['dropped'])])
+    metric('ice_relay_latency_milliseconds', 'summary', 'ICE relay latency; quantiles over recent candidates',
+           [({'quantile': q}, relay['latency_ms'][key]) for q, key in (('0.5', 'p50'), ('0.99', 'p99'))])
+    lines.append(f'ice_relay_latency_milliseconds_sum {relay["latency_ms"]["sum"]}')
+    lines.append(f'ice_relay_latency_milliseconds_count {relay["latency_ms"]["count"]}')
+    metric('ice_relay_queue_depth', 'gauge', 'ICE candidates waiting to be relayed', [({}, relay['pending'])])
+
+    for name, cache in (('user', user_cache), ('room', room_cache), ('report', report_cache)):
+        stats = cache.stats()
+        metric(f'{name}_cache_hits_total', 'counter', f'{name.title()} cache hits', [({}, stats['hits'])])
+        metric(f'{name}_cache_misses_total', 'counter', f'{name.title()} cache misses', [({}, stats['misses'])])
+        metric(f'{name}_cache_size', 'gauge', f'{name.title()} cache entries', [({}, stats['size'])])
+    metric('report_cache_bytes', 'gauge', 'Bytes of PDFs in the report cache',
+           [({}, report_cache.stats()['bytes'])])
+    return '\n'.join(lines) + '\n'
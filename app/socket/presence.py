@@ -0,0 +1,244 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, Float, select, update, delete, func
+from app.utils.engine import create_tuned_engine
+
+metadata = MetaData()
+
+# One row per connection in a room; shared by every worker using the same database
+socket_presence = Table(
+    'socket_presence', metadata,
+    Column('room', String(64), primary_key=True),
+    Column('sid', String(64), primary_key=True),
+    Column('user_id', Integer, nullable=False),
+    Column('joined_at', Float, nullable=False),
+    Column('seen_at', Float, nullable=False),
+    Index('ix_socket_presence_sid', 'sid'),
+    Index('ix_socket_presence_seen_at', 'seen_at'),
+)
+
+
+class _Connection:
+    """What the registry knows about one Socket.IO connection"""
+    __slots__ = ('user_id', 'rooms', 'seen_at')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.rooms = set()
+        self.seen_at = time.monotonic()
+
+
+class MemoryPresence:
+    """
+    Video room participants known to this process only
+
+    Rooms map each user to the set of their connections, in joining order,
+    and each connection keeps the set of rooms it is in, so join, leave and
+    disconnect cost the same however many rooms are live. Enough for a
+    single worker; with several, use DatabasePresence.
+    """
+
+    def __init__(self):
+        self._rooms = {}
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def join(self, room, sid, user_id):
+        """Add a connection to a room and return the room's participant ids"""
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None:
+                connection = self._connections[sid] = _Connection(user_id)
+            connection.rooms.add(room)
+            connection.seen_at = time.monotonic()
+            users = self._rooms.setdefault(room, {})
+            users.setdefault(user_id, set()).add(sid)
+            return list(users)
+
+    def leave(self, room, sid):
+        """
+        Remove a connection from a room
+
+        Returns:
+            Remaining participant ids, or None if the connection was not in the room
+        """
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None or room not in connection.rooms:
+                return None
+            connection.rooms.discard(room)
+            if not connection.rooms:
+                del self._connections[sid]
+            return self._remove(room, sid, connection.user_id)
+
+    def disconnect(self, sid):
+        """Remove a connection from every room; returns {room: remaining participant ids}"""
+        with self._lock:
+            connection = self._connections.pop(sid, None)
+            if connection is None:
+                return {}
+            return {room: self._remove(room, sid, connection.user_id) for room in connection.rooms}
+
+    def participants(self, room):
+        with self._lock:
+            return list(self._rooms.get(room, ()))
+
+    def _remove(self, room, sid, user_id):
+        users = self._rooms[room]
+        sids = users[user_id]
+        sids.discard(sid)
+        if not sids:
+            del users[user_id]
+        if not users:
+            del self._rooms[room]
+        return list(users)
+
+    def heartbeat(self, alive):
+        """Mark the connections `alive(sid)` still reports as seen now"""
+        now = time.monotonic()
+        with self._lock:
+            for sid, connection in self._connections.items():
+                if alive(sid):
+                    connection.seen_at = now
+
+    def reap(self, ttl):
+        """
+        Drop connections not seen for `ttl` seconds, such as ones whose
+        disconnect was never handled
+
+        Returns:
+            (room, user_id) pairs for users no longer in a room
+        """
+        cutoff = time.monotonic() - ttl
+        left = []
+        with self._lock:
+            for sid in [sid for sid, connection in self._connections.items() if connection.seen_at < cutoff]:
+                connection = self._connections.pop(sid)
+                for room in connection.rooms:
+                    if connection.user_id not in self._remove(room, sid, connection.user_id):
+                        left.append((room, connection.user_id))
+        return left
+
+
+class DatabasePresence:
+    """
+    Video room participants in a database shared by all workers
+
+    A SQLite file serves the workers of one host; point PRESENCE_URL at a
+    PostgreSQL database to share it between hosts. Each worker refreshes
+    seen_at for its live connections, so rows left by a worker that died
+    expire through reap().
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._created = False
+        self._local = set()
+        self._lock = threading.Lock()
+
+    def _begin(self):
+        # Create the table on first use rather than at app startup
+        if not self._created:
+            metadata.create_all(self.engine)
+            self._created = True
+        return self.engine.begin()
+
+    def __len__(self):
+        with self._begin() as connection:
+            return connection.scalar(select(func.count(socket_presence.c.room.distinct())))
+
+    def join(self, room, sid, user_id):
+        now = time.time()
+        with self._lock:
+            self._local.add(sid)
+        with self._begin() as connection:
+            connection.execute(delete(socket_presence).where(socket_presence.c.room == room,
+                                                             socket_presence.c.sid == sid))
+            connection.execute(socket_presence.insert().values(room=room, sid=sid, user_id=user_id,
+                                                               joined_at=now, seen_at=now))
+            return self._participants(connection, room)
+
+    def leave(self, room, sid):
+        with self._begin() as connection:
+            removed = connection.execute(delete(socket_presence).where(socket_presence.c.room == room,
+                                                                       socket_presence.c.sid == sid)).rowcount
+            return self._participants(connection, room) if removed else None
+
+    def disconnect(self, sid):
+        with self._lock:
+            self._local.discard(sid)
+        with self._begin() as connection:
+            rooms = connection.scalars(delete(socket_presence).where(socket_presence.c.sid == sid)
+                                       .returning(socket_presence.c.room)).all()
+            return {room: self._participants(connection, room) for room in rooms}
+
+    def participants(self, room):
+        with self._begin() as connection:
+            return self._participants(connection, room)
+
+    def _participants(self, connection, room):
+        return connection.scalars(select(socket_presence.c.user_id)
+                                  .where(socket_presence.c.room == room)
+                                  .group_by(socket_presence.c.user_id)
+                                  .order_by(func.min(socket_presence.c.joined_at))).all()
+
+    def heartbeat(self, alive, batch=500):
+        with self._lock:
+            # Connections this worker lost track of are left to expire
+            self._local = {sid for sid in self._local if alive(sid)}
+            local = list(self._local)
+        now = time.time()
+        with self._begin() as connection:
+            for i in range(0, len(local), batch):
+                connection.execute(update(socket_presence).where(socket_presence.c.sid.in_(local[i:i + batch]))
+                                   .values(seen_at=now))
+
+    def reap(self, ttl):
+        with self._begin() as connection:
+            # RETURNING gives each worker only the rows it removed itself
+            removed = connection.execute(delete(socket_presence)
+                                         .where(socket_presence.c.seen_at < time.time() - ttl)
+                                         .returning(socket_presence.c.room, socket_presence.c.user_id)).all()
+            removed_users = {}
+            for room, user_id in removed:
+                removed_users.setdefault(room, set()).add(user_id)
+            left = []
+            for room, user_ids in removed_users.items():
+                left.extend((room, user_id) for user_id in user_ids - set(self._participants(connection, room)))
+            return left
+
+
+def init_presence(app):
+    """Choose the presence registry from PRESENCE_URL (empty for this process only)"""
+    url = app.config['PRESENCE_URL']
+    app.extensions['presence'] = DatabasePresence(create_tuned_engine(url, app.config)) if url else MemoryPresence()
+
+
+def get_presence():
+    return current_app.extensions['presence']
+
+
+def reap_periodically(app, interval, ttl):
+    """
+    Background task that refreshes this worker's live connections every
+    `interval` seconds and drops any not seen for `ttl`, telling the rest of
+    each room that the user left
+    """
+    from app import socketio
+    presence = app.extensions['presence']
+
+    def alive(sid):
+        return socketio.server.manager.is_connected(sid, '/')
+
+    while True:
+        socketio.sleep(interval)
+        try:
+            presence.heartbeat(alive)
+            for room, user_id in presence.reap(ttl):
+                socketio.emit('user_left', {'user_id': user_id}, to=room)
+        except Exception as e:
+            app.logger.error(f'Error reaping video room presence: {e}')
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class _Batch:
+    """Candidates one connection sent to a room and not yet relayed"""
+    __slots__ = ('user_id', 'candidates', 'started_at')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.candidates = OrderedDict()
+        self.started_at = time.monotonic()
+
+
+class IceRelay:
+    """
+    Relays ICE candidates to the rest of a video room
+
+    With no delay each candidate is emitted as it arrives, as ice_candidate.
+    With a delay, candidates from one connection to one room are buffered
+    for that long and sent as a single ice_candidates event. The buffer is
+    each connection's outbound queue: a repeated candidate replaces the
+    earlier copy, and past `queue_size` the oldest are dropped. While a
+    receiver on this worker still has `queue_size` packets waiting to go out,
+    the flush is put off, up to `max_hold` seconds, so the batch keeps
+    merging instead of piling onto a slow client.
+    """
+
+    def __init__(self, delay=0.0, queue_size=32, max_hold=0.5):
+        self.delay = delay
+        self.queue_size = queue_size
+        self.max_hold = max_hold
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def configure(self, delay, queue_size, max_hold):
+        with self._lock:
+            self.delay = delay
+            self.queue_size = queue_size
+            self.max_hold = max_hold
+            self._reset_stats()
+
+    def _reset_stats(self):
+        self.candidates = 0
+        self.events = 0
+        self.merged = 0
+        self.dropped = 0
+        self.deferred = 0
+        # Recent samples, enough for percentiles without growing unbounded,
+        # and running totals over every relayed candidate
+        self._latencies = deque(maxlen=1024)
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self._depths = deque(maxlen=1024)
+
+    def relay(self, room_id, sid, user_id, candidate):
+        """
+        Send a candidate from connection `sid` to the others in `room_id`
+
+        Args:
+            room_id: Video room the sender joined
+            sid: Sender's connection
+            user_id: Sender's user id, passed on to the peer
+            candidate: RTCIceCandidate init dict from the client
+        """
+        from app import socketio
+        if not self.delay:
+            self.candidates += 1
+            self.events += 1
+            self._latencies.append(0.0)
+            self._latency_count += 1
+            socketio.emit('ice_candidate', {'candidate': candidate, 'user_id': user_id},
+                          to=room_id, skip_sid=sid)
+            return
+        key = (room_id, sid)
+        with self._lock:
+            self.candidates += 1
+            batch = self._pending.get(key)
+            start = batch is None
+            if start:
+                batch = self._pending[key] = _Batch(user_id)
+            identity = candidate.get('candidate') if isinstance(candidate, dict) else candidate
+            if batch.candidates.pop(identity, None) is not None:
+                self.merged += 1
+            batch.candidates[identity] = (time.monotonic(), candidate)
+            if len(batch.candidates) > self.queue_size:
+                batch.candidates.popitem(last=False)
+                self.dropped += 1
+        if start:
+            socketio.start_background_task(self._flush_later, key)
+
+    def discard(self, sid):
+        """Forget what a disconnected connection had queued"""
+        with self._lock:
+            for key in [key for key in self._pending if key[1] == sid]:
+                del self._pending[key]
+
+    def _backlog(self, room_id, sid):
+        # Packets engine.io has queued for the receivers connected to this
+        # worker; receivers on other workers are not visible here
+        from app import socketio
+        server = socketio.server
+        depth = 0
+        for receiver, eio_sid in server.manager.get_participants('/', room_id):
+            if receiver != sid:
+                socket = server.eio.sockets.get(eio_sid)
+                if socket is not None:
+                    depth = max(depth, socket.queue.qsize())
+        return depth
+
+    def _flush_later(self, key):
+        from app import socketio
+        room_id, sid = key
+        while True:
+            socketio.sleep(self.delay)
+            backlog = self._backlog(room_id, sid)
+            with self._lock:
+                batch = self._pending.get(key)
+                if batch is None:
+                    return
+                if backlog >= self.queue_size and time.monotonic() - batch.started_at < self.max_hold:
+                    self.deferred += 1
+                    continue
+                del self._pending[key]
+                now = time.monotonic()
+                waits = [now - received_at for received_at, _ in batch.candidates.values()]
+                self._latencies.extend(waits)
+                self._latency_sum += sum(waits)
+                self._latency_count += len(waits)
+                self._depths.append(len(batch.candidates))
+                self.events += 1
+            socketio.emit('ice_candidates', {
+                'candidates': [candidate for _, candidate in batch.candidates.values()],
+                'user_id': batch.user_id,
+            }, to=room_id, skip_sid=sid)
+            return
+
+    def stats(self):
+        with self._lock:
+            latencies = [seconds * 1000 for seconds in self._latencies]
+            depths = list(self._depths)
+            pending = sum(len(batch.candidates) for batch in self._pending.values())
+            latency_sum, latency_count = self._latency_sum * 1000, self._latency_count
+        return {
+            'delay_ms': self.delay * 1000,
+            'candidates': self.candidates,
+            'events': self.events,
+            'merged': self.merged,
+            'dropped': self.dropped,
+            'deferred': self.deferred,
+            'pending': pending,
+            'latency_ms': {'p50': round(_percentile(latencies, 0.5), 2),
+                           'p99': round(_percentile(latencies, 0.99), 2),
+                           'max': round(max(latencies, default=0.0), 2),
+                           'sum': round(latency_sum, 3), 'count': latency_count},
+            'queue_depth': {'p50': _percentile(depths, 0.5), 'max': max(depths, default=0)},
+        }
+
+
+ice_relay = IceRelay()
+
+
+def init_ice_relay(app):
+    ice_relay.configure(app.config['ICE_COALESCE_MS'] / 1000, app.config['ICE_QUEUE_SIZE'],
+                        app.config['ICE_MAX_HOLD_MS'] / 1000)
@@ -0,0 +1,109 @@
+import functools
+from collections import namedtuple
+from sqlalchemy import bindparam, event, inspect, select
+from sqlalchemy.orm import Session, aliased, object_session
+from app import db
+from app.models import User, VideoSession
+from app.utils.lru_cache import LRUCache
+
+# What room joins and signaling events need to know about a video session
+RoomAccess = namedtuple('RoomAccess', 'session_id title status attachee_id assessor_id usernames')
+# Tells a miss from a room cached as unknown
+_MISSING = object()
+
+
+class RoomCache(LRUCache):
+    """
+    Per-process LRU of video session access by room id, with a TTL
+
+    Unknown room ids are cached too, so a client retrying a bad id does not
+    query on every attempt. Commits in this process invalidate affected rooms
+    at once; the TTL bounds how long other workers may see a stale entry.
+    """
+
+    def __init__(self, maxsize=4096, ttl=60):
+        super().__init__(maxsize, ttl)
+
+    def get_or_load(self, room_id, load):
+        """
+        Access for a room, calling `load(room_id)` on a miss
+
+        Returns:
+            RoomAccess, or None if no session has this room id
+        """
+        access = self.get(room_id, _MISSING)
+        if access is _MISSING:
+            generation = self.generation()
+            access = load(room_id)
+            self.put(room_id, access, generation=generation)
+        return access
+
+
+room_cache = RoomCache()
+
+
+@functools.cache
+def _room_statement():
+    # Built once: constructing the aliased select costs more than running it
+    attachee, assessor = aliased(User), aliased(User)
+    return (select(VideoSession.id, VideoSession.title, VideoSession.status,
+                   attachee.id, attachee.username, assessor.id, assessor.username)
+            .join(attachee, attachee.id == VideoSession.attachee_id)
+            .join(assessor, assessor.id == VideoSession.assessor_id)
+            .where(VideoSession.room_id == bindparam('room_id')))
+
+
+def _load_room(room_id):
+    row = db.session.execute(_room_statement(), {'room_id': room_id}).first()
+    if row is None:
+        return None
+    session_id, title, status, attachee_id, attachee_name, assessor_id, assessor_name = row
+    return RoomAccess(session_id, title, status, attachee_id, assessor_id,
+                      {attachee_id: attachee_name, assessor_id: assessor_name})
+
+
+def get_room(room_id):
+    """
+    Participants and status of the session behind a room, from the cache
+    when possible
+
+    Returns:
+        RoomAccess, or None if no session has this room id
+    """
+    return room_cache.get_or_load(room_id, _load_room)
+
+
+# Rooms touched by a flush are invalidated once the transaction commits, when
+# a miss can no longer read the values from before the change
+
+def _pending(target):
+    session = object_session(target)
+    return session.info.setdefault('room_cache', set()) if session is not None else None
+
+
+@event.listens_for(VideoSession, 'after_insert')
+@event.listens_for(VideoSession, 'after_update')
+@event.listens_for(VideoSession, 'after_delete')
+def _session_changed(mapper, connection, target):
+    # Covers cancelling, completing and rescheduling, and a new session
+    # taking a room id cached as unknown
+    pending = _pending(target)
+    if pending is not None:
+        pending.add(target.room_id)
+        history = inspect(target).attrs.room_id.history
+        pending.update(history.deleted or ())
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_rooms(session):
+    for room_id in session.info.pop('room_cache', ()):
+        room_cache.invalidate(room_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rooms(session):
+    session.info.pop('room_cache', None)
+
+
+def init_room_cache(app):
+    room_cache.configure(app.config['ROOM_CACHE_SIZE'], app.config['ROOM_CACHE_TTL'])
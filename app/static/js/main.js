@@ -11,4 +11,78 @@ document.addEventListener('DOMContentLoaded', function() {
     var popoverList = popoverTriggerList.map(function (popoverTriggerEl) {
         return new bootstrap.Popover(popoverTriggerEl)
     })
-});
\ No newline at end of file
+});
+
+// Typeahead for search boxes marked with data-autocomplete="<url>"
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('input[data-autocomplete]').forEach(function(input) {
+        var list = document.createElement('datalist');
+        list.id = input.name + '-suggestions';
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+        input.after(list);
+
+        var timer = null;
+        var controller = null;
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            timer = setTimeout(function() {
+                if (controller) controller.abort();
+                controller = new AbortController();
+                var url = new URL(input.dataset.autocomplete, window.location.origin);
+                url.searchParams.set('q', input.value);
+                fetch(url, {signal: controller.signal, credentials: 'same-origin'})
+                    .then(function(response) { return response.json(); })
+                    .then(function(data) {
+                        list.replaceChildren.apply(list, data.results.map(function(result) {
+                            var option = document.createElement('option');
+                            option.value = result.username || result.name;
+                            if (result.email) option.label = result.email;
+                            return option;
+                        }));
+                    })
+                    .catch(function() {});
+            }, 100);
+        });
+    });
+});
+
+
+// Notifications: one Socket.IO connection per page, shared with other scripts
+// as window.appSocket. The server pushes the unread count on connect and
+// whenever it changes, so the badge stays current without polling.
+(function() {
+    var badge = document.getElementById('notification-badge');
+    if (!badge || typeof io === 'undefined') return;
+    var socket = window.appSocket = io();
+
+    socket.on('notification_count', function(data) {
+        badge.textContent = data.unread > 99 ? '99+' : data.unread;
+        badge.classList.toggle('d-none', !data.unread);
+    });
+
+    socket.on('notification', function(notification) {
+        var container = document.getElementById('notification-toasts');
+        if (!container) return;
+        var toast = document.createElement('div');
+        toast.className = 'toast';
+        toast.setAttribute('role', 'status');
+        var header = document.createElement('div');
+        header.className = 'toast-header';
+        var title = document.createElement('strong');
+        title.className = 'me-auto';
+        title.textContent = notification.title;
+        var close = document.createElement('button');
+        close.type = 'button';
+        close.className = 'btn-close';
+        close.setAttribute('data-bs-dismiss', 'toast');
+        header.append(title, close);
+        var body = document.createElement('div');
+        body.className = 'toast-body';
+        body.textContent = notification.message;
+        toast.append(header, body);
+        container.append(toast);
+        toast.addEventListener('hidden.bs.toast', function() { toast.remove(); });
+        new bootstrap.Toast(toast).show();
+    });
+})();
@@ -0,0 +1,274 @@
+import bisect
+import heapq
+import threading
+import time
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.models import User, Organization, UserRole
+
+
+class PrefixIndex:
+    """
+    Sorted (key, id) pairs per scope, searched by prefix with bisect
+
+    A document is listed under several lowercased keys and several scopes;
+    a lookup merges the matching runs of the requested scopes in key order.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def extend(self, documents):
+        """Append (id, keys, scopes) documents in bulk; call sort() before searching"""
+        for id, keys, scopes in documents:
+            for scope in scopes:
+                self._arrays.setdefault(scope, []).extend((key, id) for key in keys)
+            self._entries[id] = (keys, scopes)
+
+    def sort(self):
+        for array in self._arrays.values():
+            array.sort()
+
+    def add(self, id, keys, scopes):
+        self.remove(id)
+        for scope in scopes:
+            array = self._arrays.setdefault(scope, [])
+            for key in keys:
+                bisect.insort(array, (key, id))
+        self._entries[id] = (keys, scopes)
+
+    def remove(self, id):
+        keys, scopes = self._entries.pop(id, ((), ()))
+        for scope in scopes:
+            array = self._arrays[scope]
+            for key in keys:
+                i = bisect.bisect_left(array, (key, id))
+                if i < len(array) and array[i] == (key, id):
+                    del array[i]
+
+    def _run(self, array, prefix):
+        for i in range(bisect.bisect_left(array, (prefix,)), len(array)):
+            if not array[i][0].startswith(prefix):
+                return
+            yield array[i]
+
+    def search(self, prefix, scopes, limit):
+        """
+        Ids with a key starting with `prefix`, in key order
+
+        Args:
+            prefix: Lowercased prefix
+            scopes: Scopes to search
+            limit: Maximum number of ids
+
+        Returns:
+            List of distinct ids
+        """
+        runs = [self._run(self._arrays[scope], prefix) for scope in scopes if scope in self._arrays]
+        ids = []
+        for key, id in heapq.merge(*runs):
+            if id not in ids:
+                ids.append(id)
+                if len(ids) == limit:
+                    break
+        return ids
+
+
+def _organization_keys(name):
+    # The whole name and each later word, so "Acme Data Labs" matches "data"
+    words = name.lower().split()
+    return tuple(' '.join(words[i:]) for i in range(len(words)))
+
+
+class Autocomplete:
+    """
+    Per-process typeahead over usernames, emails and organization names
+
+    Users are scoped by (role,) and (role, organization_id), organizations by
+    'all' and their own id, so a lookup only walks what the caller may see.
+    """
+
+    def __init__(self):
+        self.loaded_at = None
+        self._users = {}
+        self._organizations = {}
+        self._user_index = PrefixIndex()
+        self._organization_index = PrefixIndex()
+        self._lock = threading.RLock()
+
+    def _user_document(self, id, username, email, role, organization_id):
+        scopes = ((role,), (role, organization_id)) if organization_id else ((role,),)
+        return id, (username.lower(), email.lower()), scopes
+
+    def _batches(self, statement, size=5000):
+        # Yield to other greenlets after each batch, so a reload does not
+        # stall the worker's requests for its whole duration
+        from app import socketio
+        for rows in db.session.execute(statement.execution_options(yield_per=size)).partitions():
+            yield rows
+            socketio.sleep(0)
+
+    def load(self):
+        """Read every user and organization; run inside an app context"""
+        users, organizations = {}, {}
+        user_index, organization_index = PrefixIndex(), PrefixIndex()
+        for rows in self._batches(select(User.id, User.username, User.email, User.role, User.organization_id)):
+            user_index.extend(self._user_document(*row) for row in rows)
+            users.update((row.id, tuple(row)) for row in rows)
+        for rows in self._batches(select(Organization.id, Organization.name)):
+            organization_index.extend((id, _organization_keys(name), ('all', id)) for id, name in rows)
+            organizations.update(rows)
+        user_index.sort()
+        organization_index.sort()
+        with self._lock:
+            self._users = users
+            self._organizations = organizations
+            self._user_index, self._organization_index = user_index, organization_index
+            self.loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        if self.loaded_at is None:
+            with self._lock:
+                if self.loaded_at is None:
+                    self.load()
+
+    def put_user(self, id, username, email, role, organization_id):
+        with self._lock:
+            self._users[id] = (id, username, email, role, organization_id)
+            self._user_index.add(*self._user_document(id, username, email, role, organization_id))
+
+    def remove_user(self, id):
+        with self._lock:
+            self._users.pop(id, None)
+            self._user_index.remove(id)
+
+    def put_organization(self, id, name):
+        with self._lock:
+            self._organizations[id] = name
+            self._organization_index.add(id, _organization_keys(name), ('all', id))
+
+    def remove_organization(self, id):
+        with self._lock:
+            self._organizations.pop(id, None)
+            self._organization_index.remove(id)
+
+    def users(self, prefix, scopes, limit=10):
+        """Users in `scopes` whose username or email starts with `prefix`"""
+        with self._lock:
+            ids = self._user_index.search(prefix.lower(), scopes, limit)
+            return [{'id': id, 'username': username, 'email': email, 'role': role.value,
+                     'organization': self._organizations.get(organization_id)}
+                    for id, username, email, role, organization_id in map(self._users.get, ids)]
+
+    def organizations(self, prefix, scopes, limit=10):
+        """Organizations in `scopes` with a name word starting with `prefix`"""
+        with self._lock:
+            ids = self._organization_index.search(prefix.lower(), scopes, limit)
+            return [{'id': id, 'name': self._organizations[id]} for id in ids]
+
+    def stats(self):
+        return {
+            'users': len(self._user_index),
+            'organizations': len(self._organization_index),
+            'age': round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+        }
+
+
+autocomplete = Autocomplete()
+
+
+def user_scopes(user):
+    """User index scopes visible to `user`, matching the attachee and user lists"""
+    if user.role == UserRole.ADMIN:
+        return [(role,) for role in UserRole]
+    if user.role == UserRole.ASSESSOR:
+        return [(UserRole.ATTACHEE,)]
+    if user.role == UserRole.ORG_MANAGER and user.organization_id:
+        return [(UserRole.ATTACHEE, user.organization_id)]
+    return []
+
+
+def organization_scopes(user):
+    """Organization index scopes visible to `user`"""
+    if user.role in (UserRole.ADMIN, UserRole.ASSESSOR):
+        return ['all']
+    if user.role == UserRole.ORG_MANAGER and user.organization_id:
+        return [user.organization_id]
+    return []
+
+
+# Changes are recorded at flush time, while the values are loaded, and only
+# applied once the transaction commits
+
+def _pending(target):
+    session = object_session(target)
+    return session.info.setdefault('autocomplete', []) if session is not None else None
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+def _user_saved(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append((autocomplete.put_user, (target.id, target.username, target.email,
+                                                target.role, target.organization_id)))
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append((autocomplete.remove_user, (target.id,)))
+
+
+@event.listens_for(Organization, 'after_insert')
+@event.listens_for(Organization, 'after_update')
+def _organization_saved(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append((autocomplete.put_organization, (target.id, target.name)))
+
+
+@event.listens_for(Organization, 'after_delete')
+def _organization_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append((autocomplete.remove_organization, (target.id,)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    pending = session.info.pop('autocomplete', None)
+    # Nothing to keep current until the index has been loaded
+    if pending and autocomplete.loaded_at is not None:
+        for apply, args in pending:
+            apply(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('autocomplete', None)
+
+
+def refresh_periodically(app, interval):
+    """
+    Background task that warms the index, then reloads it every `interval`
+    seconds to pick up changes committed by other processes
+    """
+    from app import socketio
+    while True:
+        with app.app_context():
+            try:
+                autocomplete.load()
+            except Exception as e:
+                app.logger.error(f'Error loading the autocomplete index: {e}')
+            finally:
+                db.session.remove()
+        if not interval:
+            return
+        socketio.sleep(interval)
@@ -0,0 +1,948 @@
+import gc
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError, TimeoutError
+from app import db
+from app.config import Config
+from app.utils.query_stats import count_queries
+from app.utils.search import create_search_tables, rebuild_search_index
+
+
+class BenchmarkConfig(Config):
+    QUERY_STATS_ENABLED = False
+    COUNTER_RECONCILE_INTERVAL = 0
+
+
+@contextmanager
+def benchmark_app(**config):
+    """
+    Application bound to a throwaway SQLite database
+
+    Args:
+        **config: Extra config values for this run
+
+    Yields:
+        Flask app with an active app context
+    """
+    from app import create_app
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    uri = 'sqlite:///' + path
+    engine = create_engine(uri)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        create_search_tables(connection)
+    engine.dispose()
+    config_class = type('Config', (BenchmarkConfig,), dict(SQLALCHEMY_DATABASE_URI=uri, **config))
+    app = create_app(config_class)
+    try:
+        with app.app_context():
+            yield app
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        os.remove(path)
+
+
+def seed(attachees, entries_per_attachee=1, password_hash='x'):
+    """
+    Insert attachees with a profile, logbook entries and a video session each
+
+    Every attachee gets its own organization and assessor, the worst case
+    for per-row lazy loading since nothing is shared in the identity map.
+    """
+    from app.models import User, Organization, AttacheeProfile, LogbookEntry, VideoSession
+    from app.models import UserRole, LogbookStatus
+    start = datetime(2024, 1, 1)
+    orgs = [dict(name=f'Organization {i}', address='Nairobi', contact_email=f'org{i}@example.com',
+                 created_at=start) for i in range(attachees)]
+    db.session.execute(db.insert(Organization), orgs)
+    org_ids = db.session.scalars(db.select(Organization.id).order_by(Organization.id)).all()[-attachees:]
+    users = []
+    for i, org_id in enumerate(org_ids):
+        users.append(dict(username=f'assessor{i}', email=f'assessor{i}@example.com', password_hash=password_hash,
+                          role=UserRole.ASSESSOR, organization_id=org_id, created_at=start, is_active=True))
+        users.append(dict(username=f'attachee{i}', email=f'attachee{i}@example.com', password_hash=password_hash,
+                          role=UserRole.ATTACHEE, organization_id=org_id, created_at=start + timedelta(minutes=i),
+                          is_active=True))
+    db.session.execute(db.insert(User), users)
+    ids = db.session.execute(db.select(User.id, User.role).where(User.email.like('%@example.com'))
+                             .order_by(User.id)).all()
+    assessor_ids = [uid for uid, role in ids if role == UserRole.ASSESSOR]
+    attachee_ids = [uid for uid, role in ids if role == UserRole.ATTACHEE]
+    db.session.execute(db.insert(AttacheeProfile), [
+        dict(user_id=uid, university='University of Nairobi', course='Computer Science', department='IT')
+        for uid in attachee_ids])
+    db.session.execute(db.insert(LogbookEntry), [
+        dict(attachee_id=uid, week_number=week + 1, start_date=date(2024, 1, 1), end_date=date(2024, 1, 5),
+             tasks='Built and tested features', skills_gained='Flask, SQL', challenges='None reported',
+             hours_worked=40, status=LogbookStatus.SUBMITTED,
+             created_at=start + timedelta(minutes=i, seconds=week), updated_at=start)
+        for i, uid in enumerate(attachee_ids) for week in range(entries_per_attachee)])
+    db.session.execute(db.insert(VideoSession), [
+        dict(attachee_id=attachee_id, assessor_id=assessor_id, room_id=f'room-{attachee_id}',
+             title='Progress review', start_time=start + timedelta(days=1, minutes=i),
+             end_time=start + timedelta(days=1, minutes=i + 30), created_at=start, updated_at=start)
+        for i, (attachee_id, assessor_id) in enumerate(zip(attachee_ids, assessor_ids))])
+    db.session.commit()
+    # Bulk inserts skip the mapper events that keep the search index current
+    rebuild_search_index()
+    return attachee_ids
+
+
+def _eager_loading_cases():
+    """(view, query factory taking loader options, per-row template access)"""
+    from app.models import User, LogbookEntry, VideoSession, UserRole
+    from app.utils import loading
+    return [
+        ('assessor.logbooks', loading.LOGBOOK_WITH_ATTACHEE,
+         lambda opts, n: LogbookEntry.query.options(*opts).order_by(LogbookEntry.created_at.desc()).limit(n),
+         lambda entry: entry.attachee.username),
+        ('org_manager.logbooks', loading.JOINED_LOGBOOK_WITH_ATTACHEE,
+         lambda opts, n: LogbookEntry.query.join(User, LogbookEntry.attachee_id == User.id).options(*opts)
+             .filter(User.role == UserRole.ATTACHEE).order_by(LogbookEntry.created_at.desc()).limit(n),
+         lambda entry: entry.attachee.username),
+        ('assessor.video_sessions', loading.SESSION_WITH_ATTACHEE,
+         lambda opts, n: VideoSession.query.options(*opts).order_by(VideoSession.start_time.desc()).limit(n),
+         lambda session: session.attachee.username),
+        ('attachee.video_sessions', loading.SESSION_WITH_ASSESSOR,
+         lambda opts, n: VideoSession.query.options(*opts).order_by(VideoSession.start_time.desc()).limit(n),
+         lambda session: session.assessor.username),
+        ('admin.users', loading.USER_WITH_ORGANIZATION,
+         lambda opts, n: User.query.options(*opts).order_by(User.username).limit(n),
+         lambda user: user.organization and user.organization.name),
+        ('org_manager.attachees', loading.ATTACHEE_WITH_PROFILE,
+         lambda opts, n: User.query.options(*opts).filter_by(role=UserRole.ATTACHEE).order_by(User.username).limit(n),
+         lambda user: (user.organization.name, user.attachee_profile.department)),
+    ]
+
+
+def eager_loading_benchmark(sizes=(10, 100, 1000)):
+    """
+    Count the statements each list view issues with and without its loader options
+
+    Returns:
+        List of (view, rows, queries before, queries after) tuples
+    """
+    results = []
+    for rows in sizes:
+        with benchmark_app():
+            seed(rows)
+            for view, options, make_query, touch in _eager_loading_cases():
+                counts = []
+                for opts in ((), options):
+                    db.session.expunge_all()
+                    with count_queries() as stats:
+                        for item in make_query(opts, rows).all():
+                            touch(item)
+                    counts.append(stats.count)
+                results.append((view, rows, counts[0], counts[1]))
+    return results
+
+
+def concurrency_benchmark(writers=8, submissions=25, readers=4):
+    """
+    Submit logbook entries from concurrent threads while others read the lists
+
+    Runs once with driver defaults and once with the engine profile.
+
+    Returns:
+        List of (profile, entries saved, "database is locked" failures, other failures,
+        seconds, reads completed, slowest read in ms) tuples
+    """
+    from app.models import LogbookEntry, LogbookStatus
+    from app.utils.counters import get_counters, LOGBOOK_ENTRIES
+    results = []
+    for tuning in (False, True):
+        with benchmark_app(DATABASE_TUNING=tuning) as app:
+            attachee_ids = seed(writers, entries_per_attachee=20)
+            saved, locked, failed = [0], [0], [0]
+            read_times = []
+            lock = threading.Lock()
+            writing = threading.Event()
+
+            def submit(attachee_id):
+                with app.app_context():
+                    for week in range(submissions):
+                        db.session.add(LogbookEntry(
+                            attachee_id=attachee_id, week_number=100 + week, start_date=date(2024, 2, 5),
+                            end_date=date(2024, 2, 9), tasks='Concurrent submission', skills_gained='SQL',
+                            challenges='None reported', hours_worked=40,
+                            status=LogbookStatus.SUBMITTED))
+                        try:
+                            db.session.commit()
+                            outcome = saved
+                        except (OperationalError, TimeoutError) as e:
+                            db.session.rollback()
+                            outcome = locked if 'database is locked' in str(e) else failed
+                        with lock:
+                            outcome[0] += 1
+
+            def read():
+                with app.app_context():
+                    while writing.is_set():
+                        started = time.perf_counter()
+                        try:
+                            LogbookEntry.query.order_by(LogbookEntry.created_at.desc()).limit(50).all()
+                            get_counters(LOGBOOK_ENTRIES)
+                        except (OperationalError, TimeoutError):
+                            with lock:
+                                failed[0] += 1
+                        db.session.rollback()
+                        with lock:
+                            read_times.append(time.perf_counter() - started)
+
+            writing.set()
+            reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+            writer_threads = [threading.Thread(target=submit, args=(uid,)) for uid in attachee_ids]
+            start = time.perf_counter()
+            for thread in reader_threads + writer_threads:
+                thread.start()
+            for thread in writer_threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            writing.clear()
+            for thread in reader_threads:
+                thread.join()
+            results.append(('tuned' if tuning else 'defaults', saved[0], locked[0], failed[0], elapsed,
+                            len(read_times), max(read_times, default=0) * 1000))
+    return results
+
+
+def search_benchmark(attachees=50000, terms=('attachee4999', 'nairobi comp', 'org'), repeat=5):
+    """
+    Time the attachee search route's query with substring LIKE filters and with the search index
+
+    Returns:
+        List of (term, LIKE ms, indexed ms, matches) tuples
+    """
+    from app.models import User, Organization, UserRole
+    from app.utils.pagination import keyset_paginate
+    from app.utils.search import search_users
+    results = []
+    with benchmark_app():
+        seed(attachees)
+        base = User.query.filter_by(role=UserRole.ATTACHEE)
+        for term in terms:
+            like = base.outerjoin(Organization, User.organization_id == Organization.id).filter(
+                User.username.contains(term) | User.email.contains(term) | Organization.name.contains(term))
+            searched, rank = search_users(base, term)
+            timings = []
+            for query, key in ((like, (User.username, User.id)), (searched, (rank, User.id))):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    keyset_paginate(query, key, per_page=10, descending=False, count='estimate')
+                    db.session.expunge_all()
+                timings.append((time.perf_counter() - start) / repeat * 1000)
+            results.append((term, timings[0], timings[1], searched.count()))
+    return results
+
+
+def autocomplete_benchmark(attachees=50000, repeat=1000):
+    """
+    Time loading the typeahead index and keystroke lookups against it, with
+    the full-text database search for the same prefix as a reference
+
+    Returns:
+        Tuple of (load ms, list of (lookup, µs per index lookup, ms per database search, results))
+    """
+    from app.models import User, UserRole
+    from app.utils.autocomplete import Autocomplete
+    from app.utils.search import search_users
+    index = Autocomplete()
+    results = []
+    with benchmark_app():
+        seed(attachees)
+        org_id = db.session.scalar(db.select(User.organization_id).where(User.username == 'attachee7'))
+        started = time.perf_counter()
+        index.load()
+        load_ms = (time.perf_counter() - started) * 1000
+        lookups = [
+            ('admin users "a"', lambda: index.users('a', [(role,) for role in UserRole])),
+            ('assessor users "attachee1"', lambda: index.users('attachee1', [(UserRole.ATTACHEE,)])),
+            ('manager users "attachee7"', lambda: index.users('attachee7', [(UserRole.ATTACHEE, org_id)])),
+            ('organizations "organization 4"', lambda: index.organizations('organization 4', ['all'])),
+        ]
+        for name, lookup in lookups:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                found = lookup()
+            lookup_us = (time.perf_counter() - started) / repeat * 1e6
+            prefix = name.split('"')[1]
+            started = time.perf_counter()
+            query, rank = search_users(User.query, prefix)
+            query.order_by(rank).limit(10).all()
+            search_ms = (time.perf_counter() - started) * 1000
+            db.session.expunge_all()
+            results.append((name, lookup_us, search_ms, len(found)))
+    return load_ms, results
+
+
+def presence_benchmark(rooms=(100, 10000), operations=2000, database_url=None):
+    """
+    Time video room presence bookkeeping with a number of rooms already live,
+    each holding two connections
+
+    Args:
+        rooms: Live room counts to measure at
+        operations: Joins, leaves and disconnects timed at each count
+        database_url: Also measure DatabasePresence on this database
+
+    Returns:
+        List of (backend, live rooms, µs per join, µs per leave, µs per disconnect)
+    """
+    from app.socket.presence import MemoryPresence, DatabasePresence
+    from app.utils.engine import create_tuned_engine
+    backends = [('memory', MemoryPresence)]
+    if database_url:
+        config = {key: getattr(BenchmarkConfig, key) for key in dir(BenchmarkConfig) if key.isupper()}
+        backends.append(('database', lambda: DatabasePresence(create_tuned_engine(database_url, config))))
+    results = []
+    for name, factory in backends:
+        for live in rooms:
+            presence = factory()
+            for room in range(live):
+                presence.join(f'room-{room}', f'sid-{room}-a', room * 2)
+                presence.join(f'room-{room}', f'sid-{room}-b', room * 2 + 1)
+            timings = []
+            # Like timeit, keep collections of the seeded rooms out of the timings
+            gc.collect()
+            gc.disable()
+            for step in ('join', 'leave', 'join', 'disconnect'):
+                started = time.perf_counter()
+                for i in range(operations):
+                    room, sid = f'new-{i}', f'new-sid-{i}'
+                    if step == 'join':
+                        presence.join(room, sid, -i)
+                    elif step == 'leave':
+                        presence.leave(room, sid)
+                    else:
+                        presence.disconnect(sid)
+                timings.append((time.perf_counter() - started) / operations * 1e6)
+            gc.enable()
+            results.append((name, live, timings[0], timings[1], timings[3]))
+            if name == 'database':
+                presence.engine.dispose()
+    return results
+
+
+def room_join_benchmark(attachees=200, rounds=10):
+    """
+    Replay a reconnect storm: every attachee's socket leaves and rejoins its
+    video room `rounds` times, with the room cache off and on
+
+    Returns:
+        List of (cache, joins per second, queries per join)
+    """
+    from sqlalchemy import event
+    from app import socketio
+    results = []
+    for name, ttl in (('off', 0), ('on', 60)):
+        with benchmark_app(ROOM_CACHE_TTL=ttl) as app:
+            attachee_ids = seed(attachees)
+            clients = []
+            for attachee_id in attachee_ids:
+                http = app.test_client()
+                with http.session_transaction() as session:
+                    session['_user_id'] = str(attachee_id)
+                clients.append((f'room-{attachee_id}', socketio.test_client(app, flask_test_client=http)))
+            queries = []
+            listener = lambda *args: queries.append(1)
+            event.listen(db.engine, 'after_cursor_execute', listener)
+            started = time.perf_counter()
+            for _ in range(rounds):
+                for room_id, client in clients:
+                    client.emit('join_room', {'room_id': room_id})
+                    client.emit('leave_room', {'room_id': room_id})
+                    client.get_received()
+            elapsed = time.perf_counter() - started
+            event.remove(db.engine, 'after_cursor_execute', listener)
+            for _, client in clients:
+                client.disconnect()
+            joins = attachees * rounds
+            results.append((name, joins / elapsed, len(queries) / joins))
+    return results
+
+
+def ice_relay_benchmark(candidates=40, interval=0.002, delays=(0, 10, 25)):
+    """
+    Trickle ICE candidates from one participant of a video room to the
+    other, relayed one by one and coalesced
+
+    Args:
+        candidates: Candidates the sender trickles, with repeats mixed in
+        interval: Seconds between candidates
+        delays: ICE_COALESCE_MS values to compare
+
+    Returns:
+        List of (delay ms, events received, candidates received, relay stats)
+    """
+    from app import socketio
+    from app.models import VideoSession
+    from app.socket.relay import ice_relay
+    results = []
+    for delay in delays:
+        with benchmark_app(ICE_COALESCE_MS=delay) as app:
+            seed(1)
+            session = db.session.scalar(db.select(VideoSession))
+            clients = []
+            for user_id in (session.attachee_id, session.assessor_id):
+                http = app.test_client()
+                with http.session_transaction() as flask_session:
+                    flask_session['_user_id'] = str(user_id)
+                client = socketio.test_client(app, flask_test_client=http)
+                client.emit('join_room', {'room_id': session.room_id})
+                clients.append(client)
+            sender, receiver = clients
+            receiver.get_received()
+            for i in range(candidates):
+                # Browsers repeat some candidates, e.g. after an ICE restart
+                n = i if i % 5 else i // 2
+                sender.emit('ice_candidate', {'room_id': session.room_id, 'candidate': {
+                    'candidate': f'candidate:{n} 1 udp 2122260223 192.0.2.{n % 250} {50000 + n} typ host',
+                    'sdpMid': '0', 'sdpMLineIndex': 0}})
+                socketio.sleep(interval)
+            socketio.sleep(delay / 1000 + 0.05)
+            received = [message for message in receiver.get_received()
+                        if message['name'] in ('ice_candidate', 'ice_candidates')]
+            delivered = sum(len(message['args'][0]['candidates']) if message['name'] == 'ice_candidates' else 1
+                            for message in received)
+            results.append((delay, len(received), delivered, ice_relay.stats()))
+            for client in clients:
+                client.disconnect()
+    return results
+
+
+def socket_metrics_benchmark(calls=200000):
+    """
+    Cost the handler instrumentation adds to each Socket.IO event
+
+    Returns:
+        Tuple of (µs per bare call, µs per instrumented call)
+    """
+    from app.socket.metrics import SocketMetrics
+    metrics = SocketMetrics()
+
+    def handler(data):
+        return data
+
+    timings = []
+    for call in (handler, metrics.instrument('bench', handler)):
+        started = time.perf_counter()
+        for _ in range(calls):
+            call({'room_id': 'room'})
+        timings.append((time.perf_counter() - started) / calls * 1e6)
+    return tuple(timings)
+
+
+def report_jobs_benchmark(attachees=1500, workers=2):
+    """
+    Build the admin user report in the request, as before, and as a
+    background job, measuring how long a gevent worker's loop would stall
+
+    Returns:
+        List of (mode, ms until the request could respond, ms until the PDF
+        was ready, longest event loop stall in ms)
+    """
+    import gevent
+    from app.models import User, UserRole, ReportJob, ReportStatus
+    from app.utils.reports import request_report, shutdown, _build_users
+    results = []
+    with benchmark_app(REPORT_WORKERS=workers, REPORT_FOLDER=tempfile.mkdtemp()) as app:
+        seed(attachees)
+        admin = User(username='admin', email='admin@example.org', role=UserRole.ADMIN, password_hash='x')
+        db.session.add(admin)
+        db.session.commit()
+        stalls = [0.0]
+
+        def heartbeat():
+            # Stands in for the other requests and sockets a worker serves
+            last = time.perf_counter()
+            while True:
+                gevent.sleep(0.005)
+                now = time.perf_counter()
+                stalls[0] = max(stalls[0], now - last)
+                last = now
+
+        ticker = gevent.spawn(heartbeat)
+        gevent.sleep(0.05)
+        started = time.perf_counter()
+        _build_users({}, 'user_report_0.pdf')
+        elapsed = (time.perf_counter() - started) * 1000
+        gevent.sleep(0.05)
+        results.append(('in request', elapsed, elapsed, stalls[0] * 1000))
+        stalls[0] = 0.0
+        started = time.perf_counter()
+        job = request_report(admin, 'users', {})
+        responded = (time.perf_counter() - started) * 1000
+        while True:
+            gevent.sleep(0.05)
+            db.session.expire_all()
+            if db.session.get(ReportJob, job.id).status not in (ReportStatus.QUEUED, ReportStatus.RUNNING):
+                break
+        # Includes starting the pool's processes, as the first job after a restart does
+        results.append((f'job ({workers} workers)', responded, (time.perf_counter() - started) * 1000,
+                        stalls[0] * 1000))
+        ticker.kill()
+        # Let the progress watcher see the outcome before the database goes
+        gevent.sleep(app.config['REPORT_PROGRESS_INTERVAL'] * 2)
+        shutdown()
+    return results
+
+
+def report_stream_benchmark(attachees=500, downloads=8, max_active=4):
+    """
+    Download the admin user report through a job and streamed, then start
+    `downloads` streamed downloads at once
+
+    Returns:
+        (rows, concurrent): rows of (delivery, ms per report, files written,
+        bytes written) and (downloads sent, downloads refused, peak traced
+        memory in MB)
+    """
+    import threading
+    import tracemalloc
+    from app.models import User, UserRole
+    rows = []
+    folder = tempfile.mkdtemp()
+    with benchmark_app(REPORT_WORKERS=0, REPORT_FOLDER=folder, REPORT_STREAM_MAX_ACTIVE=max_active,
+                       REPORT_PROGRESS_INTERVAL=0.05) as app:
+        seed(attachees)
+        admin = User(username='admin', email='admin@example.org', role=UserRole.ADMIN, password_hash='x')
+        db.session.add(admin)
+        db.session.commit()
+
+        def client():
+            http = app.test_client()
+            with http.session_transaction() as session:
+                session['_user_id'] = str(admin.id)
+            return http
+
+        def written():
+            names = os.listdir(folder)
+            return len(names), sum(os.path.getsize(os.path.join(folder, name)) for name in names)
+
+        for delivery in ('job', 'stream'):
+            app.config['REPORT_DELIVERY'] = delivery
+            http = client()
+            files, size = written()
+            started = time.perf_counter()
+            response = http.post('/reports', data={'kind': 'users'})
+            if delivery == 'job':
+                status = response.location
+                while http.get(status, headers={'Accept': 'application/json'}).json['status'] != 'done':
+                    time.sleep(0.02)
+                response = http.get(status + '/download')
+            assert response.data.startswith(b'%PDF')
+            response.close()
+            elapsed = (time.perf_counter() - started) * 1000
+            rows.append((delivery, elapsed, written()[0] - files, written()[1] - size))
+
+        statuses = []
+        clients = [client() for _ in range(downloads)]
+        barrier = threading.Barrier(downloads)
+
+        def download(http):
+            barrier.wait()
+            response = http.post('/reports', data={'kind': 'users'})
+            statuses.append(response.status_code)
+            response.close()
+
+        tracemalloc.start()
+        threads = [threading.Thread(target=download, args=(http,)) for http in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return rows, (statuses.count(200), statuses.count(302), peak)
+
+
+def report_cache_benchmark(entries=52, repeat=20):
+    """
+    Stream one attachee's logbook report `repeat` times with the report
+    cache off and on, then once more after an assessor reviews an entry
+
+    Returns:
+        List of (case, ms per download, whether the PDF matched the previous
+        download byte for byte)
+    """
+    from app.models import LogbookEntry, LogbookStatus
+    results = []
+    for name, maxbytes in (('off', 0), ('on', 64 * 2 ** 20)):
+        with benchmark_app(REPORT_WORKERS=0, REPORT_DELIVERY='stream', REPORT_CACHE_BYTES=maxbytes,
+                           REPORT_STREAM_MAX_ACTIVE=1) as app:
+            attachee_id, = seed(1, entries_per_attachee=entries)
+            http = app.test_client()
+            with http.session_transaction() as session:
+                session['_user_id'] = str(attachee_id)
+
+            def download():
+                response = http.post('/reports', data={'kind': 'logbook', 'attachee_id': attachee_id})
+                data = response.data
+                response.close()
+                assert data.startswith(b'%PDF')
+                return data
+
+            started = time.perf_counter()
+            first = download()
+            results.append((f'cache {name}, first', (time.perf_counter() - started) * 1000, None))
+            started = time.perf_counter()
+            identical = all([download() == first for _ in range(repeat)])
+            results.append((f'cache {name}, repeated', (time.perf_counter() - started) * 1000 / repeat, identical))
+            entry = LogbookEntry.query.filter_by(attachee_id=attachee_id).first()
+            entry.status = LogbookStatus.ASSESSOR_APPROVED
+            entry.grade = 'A'
+            db.session.commit()
+            started = time.perf_counter()
+            reviewed = download()
+            results.append((f'cache {name}, reviewed', (time.perf_counter() - started) * 1000, reviewed == first))
+    return results
+
+
+def _seed_users(users, per_organization=50):
+    """Insert `users` attachees spread over organizations of `per_organization`"""
+    from app.models import User, Organization, UserRole
+    start = datetime(2024, 1, 1)
+    organizations = -(-users // per_organization)
+    db.session.execute(db.insert(Organization), [
+        dict(name=f'Organization {i:06d}', address='Nairobi', contact_email=f'org{i}@example.com',
+             created_at=start) for i in range(organizations)])
+    org_ids = db.session.scalars(db.select(Organization.id).order_by(Organization.id)).all()
+    for offset in range(0, users, 10000):
+        db.session.execute(db.insert(User), [
+            dict(username=f'user{i:07d}', email=f'user{i}@example.com', password_hash='x', role=UserRole.ATTACHEE,
+                 organization_id=org_ids[i // per_organization], created_at=start, is_active=True)
+            for i in range(offset, min(offset + 10000, users))])
+    db.session.commit()
+
+
+def large_report_benchmark(sizes=(1000, 10000, 100000), kinds=('users', 'organizations')):
+    """
+    Build the user and organization reports for growing user tables, once
+    for time and once under tracemalloc for peak memory
+
+    Returns:
+        List of (kind, users, seconds, microseconds per user, peak traced MB,
+        PDF MB)
+    """
+    import io
+    import tracemalloc
+    from app.utils.reports import BUILDERS
+    results = []
+    for size in sizes:
+        with benchmark_app(REPORT_CACHE_BYTES=0) as app:
+            _seed_users(size)
+            for kind in kinds:
+                db.session.remove()
+                gc.collect()
+                buffer = io.BytesIO()
+                started = time.perf_counter()
+                BUILDERS[kind]({}, buffer)
+                elapsed = time.perf_counter() - started
+                db.session.remove()
+                gc.collect()
+                tracemalloc.start()
+                BUILDERS[kind]({}, io.BytesIO())
+                peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+                results.append((kind, size, elapsed, elapsed / size * 1e6, peak, len(buffer.getvalue()) / 2 ** 20))
+    return results
+
+
+def export_benchmark(sizes=(10000, 100000), formats=('csv', 'xlsx')):
+    """
+    Stream the logbook export for growing tables, once for time and once
+    under tracemalloc for peak memory
+
+    Returns:
+        List of (format, entries, ms to the header, ms to the first rows,
+        seconds in all, peak traced MB, output MB)
+    """
+    import tracemalloc
+    from app.models import LogbookEntry
+    from app.utils.exports import export_logbook_entries
+
+    def chunks(fmt):
+        response = export_logbook_entries(LogbookEntry.query, (LogbookEntry.created_at, LogbookEntry.id), fmt)
+        return response.response
+
+    results = []
+    for size in sizes:
+        with benchmark_app() as app:
+            _seed_logbook_entries(random.Random(0), seed(max(1, size // 50)), size)
+            for fmt in formats:
+                with app.test_request_context():
+                    db.session.remove()
+                    gc.collect()
+                    started = time.perf_counter()
+                    stream = iter(chunks(fmt))
+                    output = len(next(stream))
+                    header = time.perf_counter() - started
+                    output += len(next(stream))
+                    first = time.perf_counter() - started
+                    output += sum(len(chunk) for chunk in stream)
+                    elapsed = time.perf_counter() - started
+                with app.test_request_context():
+                    db.session.remove()
+                    gc.collect()
+                    tracemalloc.start()
+                    for _ in chunks(fmt):
+                        pass
+                    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                    tracemalloc.stop()
+                results.append((fmt, size, header * 1000, first * 1000, elapsed, peak, output / 2 ** 20))
+    return results
+
+
+def bulk_logbook_benchmark(attachees=60, entries=12, workers=(0, 2)):
+    """
+    Stream an organization's logbooks as a ZIP, building them in the request
+    and across pool processes
+
+    Returns:
+        List of (workers, ms to the first report, ms for the whole ZIP,
+        reports in the ZIP)
+    """
+    import io
+    import zipfile
+    from app.models import User, UserRole
+    from app.utils.reports import shutdown
+    results = []
+    for count in workers:
+        with benchmark_app(REPORT_WORKERS=count, REPORT_DELIVERY='stream', REPORT_CACHE_BYTES=0) as app:
+            attachee_ids = seed(attachees, entries_per_attachee=entries)
+            organization_id = db.session.get(User, attachee_ids[0]).organization_id
+            db.session.execute(db.update(User).where(User.role == UserRole.ATTACHEE)
+                               .values(organization_id=organization_id))
+            manager = User(username='manager', email='manager@example.org', role=UserRole.ORG_MANAGER,
+                           organization_id=organization_id, password_hash='x')
+            db.session.add(manager)
+            db.session.commit()
+            http = app.test_client()
+            with http.session_transaction() as session:
+                session['_user_id'] = str(manager.id)
+            if count:
+                # Start the pool's processes first, as a running worker has
+                http.post('/reports', data={'kind': 'logbook', 'attachee_id': attachee_ids[0]}).close()
+            started = time.perf_counter()
+            response = http.post('/reports', data={'kind': 'logbooks', 'organization_id': organization_id},
+                                 buffered=False)
+            chunks = iter(response.response)
+            data = [next(chunks)]
+            first = (time.perf_counter() - started) * 1000
+            data.extend(chunks)
+            elapsed = (time.perf_counter() - started) * 1000
+            response.close()
+            with zipfile.ZipFile(io.BytesIO(b''.join(data))) as archive:
+                assert archive.testzip() is None
+                reports = len(archive.namelist())
+            results.append((count, first, elapsed, reports))
+            shutdown()
+    return results
+
+
+_LOGBOOK_WORDS = ('deployed configured tested reviewed documented migrated designed debugged '
+                  'database server api frontend backend report dashboard payments billing '
+                  'docker kubernetes python flask react testing security network monitoring '
+                  'customers meeting training presentation inventory accounting audit').split()
+
+
+# Zipf-like word frequencies, with a long tail of rarer words
+_LOGBOOK_VOCABULARY = _LOGBOOK_WORDS + [f'topic{i}' for i in range(5000)]
+_LOGBOOK_CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(_LOGBOOK_VOCABULARY))))
+
+
+def _logbook_text(rng, words=12):
+    return ' '.join(rng.choices(_LOGBOOK_VOCABULARY, cum_weights=_LOGBOOK_CUM_WEIGHTS, k=words))
+
+
+def _seed_logbook_entries(rng, attachee_ids, entries):
+    """Insert entries logbook entries spread over the attachees, oldest first"""
+    from app.models import LogbookEntry, LogbookStatus
+    statuses = list(LogbookStatus)
+    start = datetime(2024, 1, 1)
+    for batch in range(0, entries, 10000):
+        db.session.execute(db.insert(LogbookEntry), [
+            dict(attachee_id=attachee_ids[i % len(attachee_ids)], week_number=i // len(attachee_ids) % 12 + 1,
+                 start_date=date(2024, 1, 1), end_date=date(2024, 1, 5), tasks=_logbook_text(rng),
+                 skills_gained=_logbook_text(rng, 4), challenges=_logbook_text(rng, 6), hours_worked=40,
+                 status=statuses[i % len(statuses)], created_at=start + timedelta(seconds=i), updated_at=start)
+            for i in range(batch, min(batch + 10000, entries))])
+    db.session.commit()
+
+
+def logbook_search_benchmark(entries=200000, terms=('topic4321', 'billing', '"deployed server"', 'docker audit'),
+                             repeat=5):
+    """
+    Time a logbook search page: status and week filters, ranking, and snippets for the page
+
+    Returns:
+        List of (term, ms per page, matches) tuples
+    """
+    from app.models import LogbookEntry, LogbookStatus
+    from app.utils.pagination import keyset_paginate
+    from app.utils.search import search_logbook_entries, attach_snippets
+    rng = random.Random(0)
+    attachee_count = max(1, entries // 50)
+    results = []
+    with benchmark_app():
+        attachee_ids = seed(attachee_count)
+        _seed_logbook_entries(rng, attachee_ids, entries)
+        rebuild_search_index()
+        base = LogbookEntry.query.filter(LogbookEntry.status == LogbookStatus.SUBMITTED,
+                                         LogbookEntry.week_number.between(2, 10))
+        for term in terms:
+            query, rank = search_logbook_entries(base, term)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                page = keyset_paginate(query, (rank, LogbookEntry.id), per_page=10, descending=False)
+                attach_snippets(page.items, term)
+                db.session.expunge_all()
+            results.append((term, (time.perf_counter() - started) / repeat * 1000, query.count()))
+    return results
+
+
+_SIGNALING_SCRIPT = """
+from gevent import monkey
+monkey.patch_all()
+import json, sys
+from app.utils.benchmarks import signaling_delays
+print(json.dumps(signaling_delays(**json.loads(sys.argv[1]))))
+"""
+
+
+def signaling_delays(database_url, mode, slow_queries, query_seconds, candidates, interval=0.01):
+    """
+    Relay ICE candidates between two Socket.IO clients while other greenlets run slow queries
+
+    Must run in a process that gevent has monkey patched; see signaling_benchmark().
+
+    Returns:
+        Delay in ms of each candidate beyond its scheduled send time
+    """
+    import gevent
+    from sqlalchemy import text
+    from app import socketio
+    from app.models import VideoSession
+    from app.utils.engine import engine_options, make_psycopg2_cooperative
+    with benchmark_app(DATABASE_GEVENT_MODE=mode) as app:
+        session = VideoSession.query.filter_by(attachee_id=seed(1)[0]).one()
+        clients = []
+        for user_id in (session.attachee_id, session.assessor_id):
+            http = app.test_client()
+            with http.session_transaction() as flask_session:
+                flask_session['_user_id'] = str(user_id)
+            # A fresh app context per client call, so Flask-Login's user on g
+            # is not shared with the enclosing benchmark context
+            with app.app_context():
+                client = socketio.test_client(app, flask_test_client=http)
+            with app.app_context():
+                client.emit('join_room', {'room_id': session.room_id})
+            clients.append(client)
+        sender, receiver = clients
+        receiver.get_received()
+
+        engine = create_engine(database_url, **engine_options({**app.config, 'SQLALCHEMY_DATABASE_URI': database_url}))
+        if mode == 'on':
+            make_psycopg2_cooperative()
+        running = True
+
+        def slow_query():
+            while running:
+                with engine.connect() as connection:
+                    connection.execute(text('SELECT pg_sleep(:seconds)'), {'seconds': query_seconds})
+
+        workers = [gevent.spawn(slow_query) for _ in range(slow_queries)]
+        gevent.sleep(interval)
+        delays = []
+        for i in range(candidates):
+            start = time.perf_counter()
+            gevent.sleep(interval)
+            with app.app_context():
+                sender.emit('ice_candidate', {'room_id': session.room_id, 'candidate': f'candidate:{i}'})
+            if not any(packet['name'] == 'ice_candidate' for packet in receiver.get_received()):
+                raise RuntimeError('ICE candidate was not relayed')
+            delays.append((time.perf_counter() - start - interval) * 1000)
+        running = False
+        gevent.joinall(workers)
+        engine.dispose()
+        for worker in workers:
+            if worker.exception is not None:
+                raise worker.exception
+    return delays
+
+
+def signaling_benchmark(database_url, slow_queries=8, query_seconds=0.5, candidates=100):
+    """
+    Signaling delay under concurrent slow PostgreSQL queries, without and with gevent mode
+
+    Returns:
+        List of (mode, median delay ms, max delay ms) tuples
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    results = []
+    for mode in ('off', 'on'):
+        args = dict(database_url=database_url, mode=mode, slow_queries=slow_queries,
+                    query_seconds=query_seconds, candidates=candidates)
+        proc = subprocess.run([sys.executable, '-c', _SIGNALING_SCRIPT, json.dumps(args)],
+                              cwd=root, capture_output=True, text=True)
+        if proc.returncode:
+            errors = [line for line in proc.stderr.splitlines() if 'Error:' in line]
+            raise RuntimeError(errors[-1] if errors else proc.stderr)
+        delays = sorted(json.loads(proc.stdout.splitlines()[-1]))
+        results.append((mode, delays[len(delays) // 2], delays[-1]))
+    return results
+
+
+# Modules that only some views need and that must not load at startup
+LAZY_MODULES = ('reportlab', 'PIL')
+
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app()
+print(json.dumps({'ms': (time.perf_counter() - start) * 1000, 'modules': sorted(sys.modules)}))
+"""
+
+
+def startup_benchmark(runs=3):
+    """
+    Import and build the app in fresh interpreters under `python -X importtime`
+
+    Args:
+        runs: Interpreters to start; the fastest run is reported
+
+    Returns:
+        (startup ms, [(top-level package, import ms)] slowest first, lazy modules that were loaded)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _STARTUP_SCRIPT],
+                              cwd=root, capture_output=True, text=True, check=True)
+        result = json.loads(proc.stdout.splitlines()[-1])
+        if best is None or result['ms'] < best[0]['ms']:
+            best = (result, proc.stderr)
+    result, importtime = best
+    packages = Counter()
+    for line in importtime.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            self_us, _, name = line[len('import time:'):].split('|')
+            if self_us.strip().isdigit():
+                packages[name.strip().split('.')[0]] += int(self_us) / 1000
+    loaded = sorted({name.split('.')[0] for name in result['modules']} & set(LAZY_MODULES))
+    return result['ms'], packages.most_common(), loaded
@@ -0,0 +1,233 @@
+from collections import Counter
+from sqlalchemy import event, inspect, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import User, Organization, LogbookEntry, VideoSession, DashboardCounter
+from app.models import LogbookStatus
+
+counters = DashboardCounter.__table__
+
+
+# Counter keys
+USERS = 'users'
+LOGBOOK_ENTRIES = 'logbook_entries'
+ORGANIZATIONS = 'organizations'
+VIDEO_SESSIONS = 'video_sessions'
+
+
+def role_key(role, org_id=None):
+    """Key for the number of users with a role, overall or in one organization"""
+    key = f'users:role:{role.name}'
+    return f'org:{org_id}:{key}' if org_id else key
+
+
+def status_key(status, org_id=None):
+    """Key for the number of logbook entries in a status, overall or in one organization"""
+    key = f'logbook_entries:status:{status.name}'
+    return f'org:{org_id}:{key}' if org_id else key
+
+
+def user_keys(role, org_id=None):
+    keys = [USERS, role_key(role)]
+    if org_id:
+        keys.append(role_key(role, org_id))
+    return keys
+
+
+def logbook_keys(status, org_id=None):
+    keys = [LOGBOOK_ENTRIES, status_key(status)]
+    if org_id:
+        keys.append(status_key(status, org_id))
+    return keys
+
+
+def get_counters(*keys):
+    """
+    Read several counters in one query
+
+    Returns:
+        Dict of key -> value, with 0 for counters that have no row yet
+    """
+    rows = db.session.execute(select(counters.c.key, counters.c.value).where(counters.c.key.in_(keys)))
+    values = dict.fromkeys(keys, 0)
+    values.update({key: value for key, value in rows})
+    return values
+
+
+# Dialects with INSERT ... ON CONFLICT, so a counter's first row cannot race
+_UPSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _apply(connection, deltas):
+    """Add deltas to counters inside the flushing transaction"""
+    upsert = _UPSERTS.get(connection.dialect.name)
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        if upsert is not None:
+            insert = upsert(counters).values(key=key, value=delta)
+            connection.execute(insert.on_conflict_do_update(index_elements=[counters.c.key],
+                                                            set_={'value': counters.c.value + delta}))
+            continue
+        result = connection.execute(counters.update()
+                                    .where(counters.c.key == key)
+                                    .values(value=counters.c.value + delta))
+        if result.rowcount == 0:
+            connection.execute(counters.insert().values(key=key, value=delta))
+
+
+def _organization_of(connection, user_id):
+    return connection.execute(select(User.organization_id).where(User.id == user_id)).scalar()
+
+
+def _previous(target, attr):
+    """Value an attribute had before the pending change"""
+    history = inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attr)
+
+
+# User events
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    _apply(connection, Counter(user_keys(target.role, target.organization_id)))
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    deltas = Counter()
+    deltas.subtract(user_keys(_previous(target, 'role'), _previous(target, 'organization_id')))
+    _apply(connection, deltas)
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    old_role, old_org = _previous(target, 'role'), _previous(target, 'organization_id')
+    if (old_role, old_org) == (target.role, target.organization_id):
+        return
+    deltas = Counter(user_keys(target.role, target.organization_id))
+    deltas.subtract(user_keys(old_role, old_org))
+
+    # Logbook entries follow their attachee to the new organization
+    if old_org != target.organization_id:
+        rows = connection.execute(select(LogbookEntry.status, func.count())
+                                  .where(LogbookEntry.attachee_id == target.id)
+                                  .group_by(LogbookEntry.status))
+        for status, count in rows:
+            status = status or LogbookStatus.DRAFT
+            if old_org:
+                deltas[status_key(status, old_org)] -= count
+            if target.organization_id:
+                deltas[status_key(status, target.organization_id)] += count
+    _apply(connection, deltas)
+
+
+# Logbook events
+
+@event.listens_for(LogbookEntry, 'after_insert')
+def _logbook_inserted(mapper, connection, target):
+    status = target.status or LogbookStatus.DRAFT
+    _apply(connection, Counter(logbook_keys(status, _organization_of(connection, target.attachee_id))))
+
+
+@event.listens_for(LogbookEntry, 'after_delete')
+def _logbook_deleted(mapper, connection, target):
+    status = _previous(target, 'status') or LogbookStatus.DRAFT
+    deltas = Counter()
+    deltas.subtract(logbook_keys(status, _organization_of(connection, target.attachee_id)))
+    _apply(connection, deltas)
+
+
+@event.listens_for(LogbookEntry, 'after_update')
+def _logbook_updated(mapper, connection, target):
+    old_status = _previous(target, 'status') or LogbookStatus.DRAFT
+    new_status = target.status or LogbookStatus.DRAFT
+    if old_status == new_status:
+        return
+    org_id = _organization_of(connection, target.attachee_id)
+    deltas = Counter(logbook_keys(new_status, org_id))
+    deltas.subtract(logbook_keys(old_status, org_id))
+    _apply(connection, deltas)
+
+
+# Organization and video session events
+
+@event.listens_for(Organization, 'after_insert')
+def _organization_inserted(mapper, connection, target):
+    _apply(connection, {ORGANIZATIONS: 1})
+
+
+@event.listens_for(Organization, 'after_delete')
+def _organization_deleted(mapper, connection, target):
+    _apply(connection, {ORGANIZATIONS: -1})
+
+
+@event.listens_for(VideoSession, 'after_insert')
+def _video_session_inserted(mapper, connection, target):
+    _apply(connection, {VIDEO_SESSIONS: 1})
+
+
+@event.listens_for(VideoSession, 'after_delete')
+def _video_session_deleted(mapper, connection, target):
+    _apply(connection, {VIDEO_SESSIONS: -1})
+
+
+# Reconciliation
+
+def compute_counters():
+    """Count everything from the source tables, as the events would have"""
+    totals = Counter()
+    for role, org_id, count in db.session.execute(
+            select(User.role, User.organization_id, func.count()).group_by(User.role, User.organization_id)):
+        for key in user_keys(role, org_id):
+            totals[key] += count
+
+    for status, org_id, count in db.session.execute(
+            select(LogbookEntry.status, User.organization_id, func.count())
+            .select_from(LogbookEntry).join(User, LogbookEntry.attachee_id == User.id, isouter=True)
+            .group_by(LogbookEntry.status, User.organization_id)):
+        for key in logbook_keys(status or LogbookStatus.DRAFT, org_id):
+            totals[key] += count
+
+    totals[ORGANIZATIONS] = db.session.execute(select(func.count()).select_from(Organization)).scalar()
+    totals[VIDEO_SESSIONS] = db.session.execute(select(func.count()).select_from(VideoSession)).scalar()
+    return totals
+
+
+def reconcile_counters():
+    """
+    Rewrite the counters table from the source tables
+
+    Corrects any drift left by bulk updates or writes that bypass the ORM.
+
+    Returns:
+        Dict of key -> (stored, actual) for every counter that was wrong
+    """
+    actual = compute_counters()
+    stored = dict(db.session.execute(select(counters.c.key, counters.c.value)).all())
+    drift = {key: (stored.get(key, 0), actual.get(key, 0))
+             for key in set(stored) | set(actual)
+             if stored.get(key, 0) != actual.get(key, 0)}
+    db.session.execute(counters.delete())
+    rows = [{'key': key, 'value': value} for key, value in actual.items() if value]
+    if rows:
+        db.session.execute(counters.insert(), rows)
+    db.session.commit()
+    return drift
+
+
+def reconcile_periodically(app, interval):
+    """Background task that reconciles the counters every `interval` seconds"""
+    from app import socketio
+    while True:
+        socketio.sleep(interval)
+        with app.app_context():
+            try:
+                drift = reconcile_counters()
+                if drift:
+                    app.logger.warning(f'Dashboard counters drifted: {drift}')
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f'Error reconciling dashboard counters: {e}')
@@ -0,0 +1,171 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from app import db
+
+
+def gevent_enabled(config):
+    """Whether database access should cooperate with gevent in this process"""
+    mode = config['DATABASE_GEVENT_MODE']
+    if mode != 'auto':
+        return mode == 'on'
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def _gevent_wait_callback(conn, timeout=None):
+    # The psycogreen callback: wait for libpq's socket in the hub instead of
+    # blocking the whole process inside the driver
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import extensions, OperationalError
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f'Bad result from poll: {state!r}')
+
+
+def make_psycopg2_cooperative():
+    """Let other greenlets run while psycopg2 waits on the server (process wide)"""
+    from psycopg2 import extensions
+    extensions.set_wait_callback(_gevent_wait_callback)
+
+
+def _gevent_pool_options(config, url):
+    if not gevent_enabled(config) or (url.get_backend_name() == 'sqlite'
+                                      and url.database in (None, '', ':memory:')):
+        return {}
+    # Any greenlet may want a connection; queue them on a fixed pool
+    # rather than opening overflow connections per request
+    return {
+        'pool_size': config['DATABASE_GEVENT_POOL_SIZE'],
+        'max_overflow': 0,
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+    }
+
+
+def _pool_options(config, url):
+    return _gevent_pool_options(config, url) or {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+    }
+
+
+def _sqlite_options(config, url):
+    if url.database in (None, '', ':memory:'):
+        # In-memory databases use a per-thread pool that takes no sizing
+        return {}
+    return _pool_options(config, url)
+
+
+def _postgresql_options(config, url):
+    settings = {
+        'statement_timeout': config['DATABASE_STATEMENT_TIMEOUT'],
+        'lock_timeout': config['DATABASE_LOCK_TIMEOUT'],
+        'idle_in_transaction_session_timeout': config['DATABASE_IDLE_IN_TRANSACTION_TIMEOUT'],
+    }
+    return {
+        **_pool_options(config, url),
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+        'connect_args': {'options': ' '.join(f'-c {name}={value}' for name, value in settings.items())},
+    }
+
+
+# Engine options per backend; SQLite connections also get sqlite_pragmas()
+PROFILES = {
+    'sqlite': _sqlite_options,
+    'postgresql': _postgresql_options,
+}
+
+
+def engine_options(config):
+    """
+    Engine keyword arguments for the configured database
+
+    Args:
+        config: Application config
+
+    Returns:
+        SQLALCHEMY_ENGINE_OPTIONS with the dialect's profile applied under any
+        options set explicitly in the config. With DATABASE_TUNING off only the
+        gevent pool sizing is applied, when gevent mode is on.
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    profile = PROFILES.get(url.get_backend_name())
+    if profile is None:
+        return options
+    if not config['DATABASE_TUNING']:
+        return {**_gevent_pool_options(config, url), **options}
+    return {**profile(config, url), **options}
+
+
+def sqlite_pragmas(config, in_memory=False):
+    """PRAGMA statements run on every new SQLite connection"""
+    pragmas = [
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT']),
+        ('cache_size', config['SQLITE_CACHE_SIZE']),
+    ]
+    if not in_memory:
+        # WAL lets readers and the single writer proceed without blocking each other
+        pragmas += [
+            ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+            ('mmap_size', config['SQLITE_MMAP_SIZE']),
+        ]
+    return [f'PRAGMA {name}={value}' for name, value in pragmas]
+
+
+def _install_gevent(engine, config):
+    if engine.dialect.driver == 'psycopg2' and gevent_enabled(config):
+        make_psycopg2_cooperative()
+
+
+def _install_profile(engine, config):
+    if engine.dialect.name != 'sqlite':
+        return
+    statements = sqlite_pragmas(config, in_memory=engine.url.database in (None, '', ':memory:'))
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+
+def init_engine_profile(app):
+    """Install per-connection settings on the app's engine; call after db.init_app"""
+    with app.app_context():
+        # Gevent cooperation is a correctness setting, so it does not hang off the tuning flag
+        _install_gevent(db.engine, app.config)
+        if app.config['DATABASE_TUNING']:
+            _install_profile(db.engine, app.config)
+
+
+def create_tuned_engine(url, config):
+    """
+    Standalone engine for an auxiliary database, tuned like the app's
+
+    Args:
+        url: Database URL
+        config: Application config
+
+    Returns:
+        Engine with the dialect's profile and per-connection settings
+    """
+    engine = create_engine(url, **engine_options({**config, 'SQLALCHEMY_DATABASE_URI': url,
+                                                  'SQLALCHEMY_ENGINE_OPTIONS': {}}))
+    _install_gevent(engine, config)
+    if config['DATABASE_TUNING']:
+        _install_profile(engine, config)
+    return engine
@@ -0,0 +1,246 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from enum import Enum
+from xml.sax.saxutils import escape
+from flask import Response, abort, stream_with_context
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import User, Organization, LogbookEntry, VideoSession
+from app.utils.zip_stream import ZipSink
+
+# Rows fetched from the database cursor at a time; each batch becomes one
+# chunk of the response
+ROWS_PER_FETCH = 1000
+# Excel opens at most this many rows, header included
+XLSX_MAX_ROWS = 1048576
+XLSX_MAX_CELL = 32767
+
+FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Spreadsheets run cells starting with these as formulas
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# Characters XML 1.0 cannot hold, even escaped
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+
+
+def _value(value):
+    """A database value as it appears in an export: enums by value, times to the second"""
+    if value is None:
+        return ''
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _partitions(statement):
+    """The statement's rows in batches, from a server-side cursor where the database has one"""
+    result = db.session.execute(statement, execution_options={'stream_results': True,
+                                                              'yield_per': ROWS_PER_FETCH})
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def _csv_cell(value):
+    value = _value(value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_chunks(header, statement):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take():
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(header)
+    yield take()
+    for rows in _partitions(statement):
+        writer.writerows([_csv_cell(value) for value in row] for row in rows)
+        yield take()
+
+
+def _xlsx_cell(value):
+    value = _value(value)
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value!r}</v></c>'
+    text = escape(_XML_INVALID.sub('', str(value))[:XLSX_MAX_CELL])
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(row):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>'
+
+
+def _xlsx_chunks(header, statement):
+    """
+    A one-sheet workbook, written row by row as the rows are fetched
+
+    Cells are inline strings and numbers, so nothing has to be collected
+    first the way a shared string table would require. Rows past Excel's
+    limit are left out; CSV has no such limit.
+    """
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                         '<sheetData>' + _xlsx_row(header)).encode())
+            yield sink.drain()
+            remaining = XLSX_MAX_ROWS - 1
+            for rows in _partitions(statement):
+                rows = rows[:remaining]
+                remaining -= len(rows)
+                sheet.write(''.join(_xlsx_row(row) for row in rows).encode())
+                yield sink.drain()
+                if not remaining:
+                    break
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def export_response(statement, header, name, fmt):
+    """
+    Stream a statement's rows as a CSV or XLSX download
+
+    Rows are fetched ROWS_PER_FETCH at a time and each batch is sent as soon
+    as it is written, so memory stays flat however many rows match and the
+    header reaches the client before the first query has finished.
+
+    Args:
+        statement: Select of the export's columns, in order
+        header: Column titles
+        name: Download file name, without extension
+        fmt: 'csv' or 'xlsx'; anything else is a 400
+    """
+    if fmt not in FORMATS:
+        abort(400)
+    chunks = _csv_chunks if fmt == 'csv' else _xlsx_chunks
+    filename = f'{name}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}'
+    return Response(stream_with_context(chunks(header, statement)), mimetype=FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'private, no-store',
+        # Send each chunk on through a buffering proxy as well
+        'X-Accel-Buffering': 'no',
+    })
+
+
+def _ordered(query, sort_key, descending):
+    return query.order_by(*(column.desc() if descending else column for column in sort_key))
+
+
+def export_logbook_entries(query, sort_key, fmt, descending=True):
+    """
+    Export a filtered LogbookEntry query, in the order its list shows it
+
+    Args:
+        query: LogbookEntry query with the list's filters and no loader options
+        sort_key: The list's sort columns
+        fmt: 'csv' or 'xlsx'
+        descending: Whether the list shows the sort key descending
+    """
+    # Aliased so queries that already join the attachee still work
+    attachee = aliased(User)
+    organization = aliased(Organization)
+    query = query.join(attachee, attachee.id == LogbookEntry.attachee_id)\
+                 .outerjoin(organization, organization.id == attachee.organization_id)\
+                 .with_entities(LogbookEntry.id, attachee.username, attachee.email, organization.name,
+                                LogbookEntry.week_number, LogbookEntry.start_date, LogbookEntry.end_date,
+                                LogbookEntry.hours_worked, LogbookEntry.status, LogbookEntry.grade,
+                                LogbookEntry.tasks, LogbookEntry.skills_gained, LogbookEntry.challenges,
+                                LogbookEntry.org_feedback, LogbookEntry.assessor_feedback,
+                                LogbookEntry.created_at, LogbookEntry.updated_at)
+    header = ('ID', 'Attachee', 'Email', 'Organization', 'Week', 'Start Date', 'End Date', 'Hours',
+              'Status', 'Grade', 'Tasks', 'Skills Gained', 'Challenges', 'Organization Feedback',
+              'Assessor Feedback', 'Created', 'Updated')
+    return export_response(_ordered(query, sort_key, descending).statement, header, 'logbooks', fmt)
+
+
+def export_video_sessions(query, sort_key, fmt, descending=True):
+    """
+    Export a filtered VideoSession query, in the order its list shows it
+
+    Args:
+        query: VideoSession query with the list's filters and no loader options
+        sort_key: The list's sort columns
+        fmt: 'csv' or 'xlsx'
+        descending: Whether the list shows the sort key descending
+    """
+    attachee = aliased(User)
+    assessor = aliased(User)
+    query = query.join(attachee, attachee.id == VideoSession.attachee_id)\
+                 .join(assessor, assessor.id == VideoSession.assessor_id)\
+                 .with_entities(VideoSession.id, VideoSession.title, attachee.username, assessor.username,
+                                VideoSession.start_time, VideoSession.end_time, VideoSession.status,
+                                VideoSession.description, VideoSession.created_at)
+    header = ('ID', 'Title', 'Attachee', 'Assessor', 'Start', 'End', 'Status', 'Description', 'Created')
+    return export_response(_ordered(query, sort_key, descending).statement, header, 'video_sessions', fmt)
+
+
+def export_user_list(query, sort_key, fmt, descending=True):
+    """
+    Export a filtered User query, in the order its list shows it
+
+    Args:
+        query: User query with the list's filters and no loader options
+        sort_key: The list's sort columns
+        fmt: 'csv' or 'xlsx'
+        descending: Whether the list shows the sort key descending
+    """
+    organization = aliased(Organization)
+    query = query.outerjoin(organization, organization.id == User.organization_id)\
+                 .with_entities(User.id, User.username, User.email, User.role, organization.name,
+                                User.is_active, User.created_at, User.last_login)
+    header = ('ID', 'Username', 'Email', 'Role', 'Organization', 'Active', 'Created', 'Last Login')
+    return export_response(_ordered(query, sort_key, descending).statement, header, 'users', fmt)
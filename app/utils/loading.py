@@ -0,0 +1,23 @@
+from sqlalchemy.orm import joinedload, contains_eager
+from app.models import User, LogbookEntry, VideoSession, AttacheeProfile
+
+# Loader options for the list views, so each page renders with a fixed
+# number of queries however many rows it shows.
+
+# Logbook lists that show the attachee of each entry
+LOGBOOK_WITH_ATTACHEE = (joinedload(LogbookEntry.attachee),)
+
+# The same, for queries that already join LogbookEntry.attachee_id == User.id
+JOINED_LOGBOOK_WITH_ATTACHEE = (contains_eager(LogbookEntry.attachee),)
+
+# Session lists seen by the assessor (shows the attachee) and by the attachee
+# (shows the assessor)
+SESSION_WITH_ATTACHEE = (joinedload(VideoSession.attachee),)
+SESSION_WITH_ASSESSOR = (joinedload(VideoSession.assessor),)
+
+# User lists
+USER_WITH_ORGANIZATION = (joinedload(User.organization),)
+ATTACHEE_WITH_PROFILE = (joinedload(User.organization), joinedload(User.attachee_profile))
+
+# Single profiles rendered together with their user
+PROFILE_WITH_USER = (joinedload(AttacheeProfile.user),)
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Per-process LRU with an optional TTL, bounded by entry count or, given
+    `sizeof`, by the total size of its values
+
+    Every invalidation bumps a generation. A caller that loads a value on a
+    miss takes generation() first and passes it to put(), so a value loaded
+    from before a commit is not stored after that commit invalidated it.
+    Entries may name an owner, to drop everything derived from one record.
+    """
+
+    def __init__(self, maxsize, ttl=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize, ttl=None):
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._entries.clear()
+            self.size = 0
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, owner=None, generation=None):
+        # A TTL of 0 or no room disables the cache; a value bigger than the
+        # whole cache would only evict everything
+        size = self.sizeof(value) if self.sizeof else 1
+        if self.ttl == 0 or size > self.maxsize:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[key] = (expires, value, owner, size)
+            self.size += size
+            while self.size > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            if key in self._entries:
+                self._drop(key)
+
+    def invalidate_owner(self, owner):
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, entry in self._entries.items() if entry[2] == owner]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.size = 0
+
+    def _drop(self, key):
+        self.size -= self._entries.pop(key)[3]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
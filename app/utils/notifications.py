@@ -0,0 +1,127 @@
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session, object_session
+from app import db, socketio
+from app.models import Notification
+
+
+def user_room(user_id):
+    """Socket.IO room that every connection of a user joins"""
+    return f'user:{user_id}'
+
+
+def unread_count(user_id):
+    return db.session.scalar(select(func.count()).select_from(Notification)
+                             .where(Notification.user_id == user_id, Notification.is_read.is_(False)))
+
+
+def notify(user_id, title, message, link=None, commit=True):
+    """
+    Create a notification; it is pushed to the user's open pages on commit
+
+    Args:
+        user_id: Recipient
+        title: Short heading
+        message: Body text
+        link: Optional URL of the page the notification is about
+        commit: Commit now, or leave the push to the caller's commit
+
+    Returns:
+        The new Notification
+    """
+    notification = Notification(user_id=user_id, title=title, message=message, link=link, is_read=False)
+    db.session.add(notification)
+    if commit:
+        db.session.commit()
+    return notification
+
+
+def notify_many(user_ids, title, message, link=None, commit=True):
+    """Send the same notification to several users"""
+    notifications = [notify(user_id, title, message, link, commit=False) for user_id in set(user_ids)]
+    if commit:
+        db.session.commit()
+    return notifications
+
+
+def mark_read(user_id, notification_ids=None):
+    """
+    Mark a user's notifications as read and push the new unread count
+
+    Args:
+        user_id: Owner of the notifications
+        notification_ids: Notifications to mark, or None for all of them
+
+    Returns:
+        Number of notifications changed
+    """
+    statement = update(Notification).where(Notification.user_id == user_id, Notification.is_read.is_(False))
+    if notification_ids is not None:
+        statement = statement.where(Notification.id.in_(notification_ids))
+    changed = db.session.execute(statement.values(is_read=True)).rowcount
+    if changed:
+        # Bulk updates skip the mapper events, so count here
+        _pending(db.session)['counts'][user_id] = unread_count(user_id)
+    db.session.commit()
+    return changed
+
+
+def serialize(notification):
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'link': notification.link,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+
+# Pushes are collected while flushing, counted once per flush for all the
+# users involved, and emitted only after the transaction commits
+
+def _pending(session):
+    return session.info.setdefault('notifications', {'created': [], 'counts': {}})
+
+
+@event.listens_for(Notification, 'after_insert')
+def _notification_inserted(mapper, connection, target):
+    pending = _pending(object_session(target))
+    pending['created'].append((target.user_id, serialize(target)))
+    pending['counts'][target.user_id] = None
+
+
+@event.listens_for(Notification, 'after_update')
+@event.listens_for(Notification, 'after_delete')
+def _notification_changed(mapper, connection, target):
+    _pending(object_session(target))['counts'][target.user_id] = None
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _count_unread(session, flush_context):
+    pending = session.info.get('notifications')
+    if not pending:
+        return
+    stale = [user_id for user_id, count in pending['counts'].items() if count is None]
+    if not stale:
+        return
+    rows = session.execute(select(Notification.user_id, func.count())
+                           .where(Notification.user_id.in_(stale), Notification.is_read.is_(False))
+                           .group_by(Notification.user_id))
+    pending['counts'].update(dict.fromkeys(stale, 0))
+    pending['counts'].update(dict(rows.all()))
+
+
+@event.listens_for(Session, 'after_commit')
+def _push(session):
+    pending = session.info.pop('notifications', None)
+    if not pending:
+        return
+    for user_id, payload in pending['created']:
+        socketio.emit('notification', payload, to=user_room(user_id))
+    for user_id, count in pending['counts'].items():
+        if count is not None:
+            socketio.emit('notification_count', {'unread': count}, to=user_room(user_id))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('notifications', None)
@@ -0,0 +1,142 @@
+import base64
+import json
+from datetime import datetime, date
+from sqlalchemy import and_, or_, func, select
+from sqlalchemy.sql.elements import Label
+
+# Row cap for the 'estimate' count mode; totals above it are shown as "N+"
+ESTIMATE_CAP = 1000
+
+
+def encode_cursor(values, direction):
+    """Pack sort key values and a paging direction into an opaque URL-safe token"""
+    payload = [direction] + [v.isoformat() if isinstance(v, (datetime, date)) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """
+    Unpack a cursor produced by encode_cursor
+
+    Returns:
+        Tuple of (direction, values) or (None, None) if the cursor is invalid
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, *values = json.loads(raw)
+        if direction not in ('next', 'prev') or len(values) != len(columns):
+            return None, None
+        parsed = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if value is not None and python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif value is not None and python_type is date:
+                value = date.fromisoformat(value)
+            parsed.append(value)
+        return direction, parsed
+    except (ValueError, TypeError, NotImplementedError):
+        return None, None
+
+
+def _after(columns, values, descending):
+    """Filter for rows strictly after the given key in the sort order"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+class KeysetPagination:
+    """
+    A page of results fetched by key rather than by OFFSET
+
+    Exposes items, has_next, has_prev, next_cursor and prev_cursor for the
+    templates, plus total when counting was requested.
+    """
+
+    def __init__(self, items, columns, has_next, has_prev, total=None, total_is_estimate=False):
+        self.items = items
+        self.columns = columns
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    def _key(self, item):
+        return [getattr(item, column.key) for column in self.columns]
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.items:
+            return None
+        return encode_cursor(self._key(self.items[-1]), 'next')
+
+    @property
+    def prev_cursor(self):
+        if not self.has_prev or not self.items:
+            return None
+        return encode_cursor(self._key(self.items[0]), 'prev')
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=10, descending=True, count=None):
+    """
+    Paginate a query on a unique sort key
+
+    Args:
+        query: Filtered query without an ORDER BY
+        columns: Model columns forming a unique sort key, e.g. (created_at, id).
+                 Labelled expressions such as a search rank are selected too and
+                 set on each item under their label
+        cursor: Cursor from a previous page's next_cursor/prev_cursor
+        per_page: Number of items per page
+        descending: Sort direction applied to every key column
+        count: None to skip the total, 'exact' for COUNT(*), or 'estimate'
+               for a count capped at ESTIMATE_CAP rows
+
+    Returns:
+        KeysetPagination object
+    """
+    columns = list(columns)
+    direction, values = decode_cursor(cursor, columns) if cursor else (None, None)
+
+    # Walking backwards reverses the sort, then the page is flipped back
+    backwards = direction == 'prev'
+    reverse = descending != backwards
+    paged = query
+    if values is not None:
+        paged = paged.filter(_after(columns, values, reverse))
+    paged = paged.order_by(*[c.desc() if reverse else c.asc() for c in columns])
+    labels = [c for c in columns if isinstance(c, Label)]
+    if labels:
+        paged = paged.add_columns(*labels)
+    rows = paged.limit(per_page + 1).all()
+    if labels:
+        items = []
+        for item, *extra in rows:
+            for label, value in zip(labels, extra):
+                setattr(item, label.key, value)
+            items.append(item)
+        rows = items
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, values is not None
+
+    total, total_is_estimate = None, False
+    if count == 'exact':
+        total = query.order_by(None).count()
+    elif count == 'estimate':
+        capped = query.order_by(None).limit(ESTIMATE_CAP + 1).subquery()
+        total = query.session.execute(select(func.count()).select_from(capped)).scalar()
+        if total > ESTIMATE_CAP:
+            total, total_is_estimate = ESTIMATE_CAP, True
+
+    return KeysetPagination(rows, columns, has_next, has_prev, total, total_is_estimate)
@@ -0,0 +1,65 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    """Process pool for hashing, created lazily so each worker process gets its own"""
+    global _executor, _slots
+    workers = current_app.config['PASSWORD_HASH_WORKERS']
+    if not workers:
+        return None
+    with _lock:
+        if _executor is None:
+            # spawn rather than fork, so children do not inherit a gevent hub
+            _executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _slots = threading.BoundedSemaphore(current_app.config['PASSWORD_HASH_MAX_PENDING'] or workers)
+    return _executor
+
+
+def _run(fn, *args):
+    executor = _get_executor()
+    if executor is None:
+        return fn(*args)
+    # With gevent's monkey patching the semaphore and the future wait are
+    # cooperative, so only the calling greenlet blocks while the hash runs
+    with _slots:
+        return executor.submit(fn, *args).result()
+
+
+def hash_password(password):
+    """Hash a password with the configured method, off the calling worker"""
+    return _run(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def verify_password(pwhash, password):
+    """Check a password against a stored hash, off the calling worker"""
+    return _run(check_password_hash, pwhash, password)
+
+
+def _method_prefix(method):
+    """
+    The prefix werkzeug writes for a method, with its defaults filled in the
+    way werkzeug fills them: 'scrypt' is stored as 'scrypt:32768:8:1',
+    'pbkdf2' as 'pbkdf2:sha256:600000'
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        args = [2 ** 15, 8, 1]
+    elif name == 'scrypt':
+        args = [int(arg) for arg in args]
+    elif name == 'pbkdf2':
+        args = (args or ['sha256'])[:1] + [int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS]
+    return ':'.join(str(part) for part in [name, *args])
+
+
+def needs_rehash(pwhash):
+    """Whether a stored hash was made with different parameters than configured"""
+    return pwhash.split('$', 1)[0] != _method_prefix(current_app.config['PASSWORD_HASH_METHOD'])
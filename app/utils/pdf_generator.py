@@ -1,46 +1,193 @@
 from flask import current_app
+from reportlab import rl_config
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfdoc import PDFArray, PDFName, PDFStream, PDFBase85Encode, PDFZCompress
+from reportlab.pdfgen.canvas import Canvas
 import os
 from datetime import datetime
 
-def generate_logbook_report(logbook_entries, attachee):
+# Part of the report cache key: bump it when the logbook report's layout
+# changes, so PDFs cached with the old layout are not served
+LOGBOOK_TEMPLATE_VERSION = 1
+
+
+def _target(output, default_name):
+    """Where a generator writes: a file-like object as given, else a file in REPORT_FOLDER"""
+    if hasattr(output, 'write'):
+        return output, output
+    filename = output or default_name
+    return os.path.join(current_app.config['REPORT_FOLDER'], filename), filename
+
+
+class _CompactCanvas(Canvas):
+    """
+    Canvas that compresses each page's content stream as the page ends
+
+    reportlab otherwise keeps every page's drawing operators as text until
+    save() and compresses them all there, so memory grows with the page
+    count. The filters are the ones save() would apply, so the PDF is the
+    same byte for byte.
+    """
+
+    def showPage(self):
+        super().showPage()
+        page = self._doc.Pages.pages[-1]
+        if not page.compression or page.Contents or not page.stream:
+            return
+        filters = [PDFBase85Encode, PDFZCompress] if rl_config.useA85 else [PDFZCompress]
+        content = page.stream
+        for pdf_filter in reversed(filters):
+            content = pdf_filter.encode(content)
+        contents = PDFStream(content=content)
+        contents.dictionary['Filter'] = PDFArray([PDFName(pdf_filter.pdfname) for pdf_filter in filters])
+        contents.__Comment__ = 'page stream'
+        page.Contents = contents
+        page.stream = None
+
+
+class ProgressDocTemplate(SimpleDocTemplate):
+    """SimpleDocTemplate that reports each finished page to a callback"""
+
+    def __init__(self, filename, progress=None, expected_pages=1, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._progress = progress
+        self.expected_pages = expected_pages
+
+    def afterPage(self):
+        if self._progress:
+            self._progress(min(self.page / max(self.expected_pages, 1), 1.0))
+
+    def build(self, flowables, **kwargs):
+        kwargs.setdefault('canvasmaker', _CompactCanvas)
+        super().build(flowables, **kwargs)
+
+
+class _FlowableStream(list):
+    """
+    Flowables for doc.build, pulled from an iterator as the build consumes
+    them, so only the current page's are held at once. The build loop checks
+    the length before each flowable, which is when the list is topped up.
+    """
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+
+    def __len__(self):
+        # Two ahead, for the keepWithNext lookahead
+        while super().__len__() < 2:
+            flowable = next(self._source, None)
+            if flowable is None:
+                break
+            self.append(flowable)
+        return super().__len__()
+
+
+HEADER_HEIGHT = 24
+ROW_HEIGHT = 18
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+
+def _page_rows(doc, flowables=()):
+    """Table rows that fit under a header on a page, after `flowables`"""
+    # The frame's default padding is 6 points on each side
+    available = doc.height - 12
+    for i, flowable in enumerate(flowables):
+        available -= flowable.wrap(doc.width, doc.height)[1] + flowable.getSpaceAfter()
+        if i:
+            available -= flowable.getSpaceBefore()
+    # Leave a point for rounding, so a table never spills onto another page
+    return max(int((available - HEADER_HEIGHT - 1) // ROW_HEIGHT), 1)
+
+
+def _paged_tables(doc, intro, header, rows, col_widths):
+    """
+    The intro followed by one table per page, each with the header, built
+    from `rows` as the document consumes them
+
+    Rows are single lines of a fixed height, so each page's share is known
+    up front; building one table per page keeps layout linear in the number
+    of rows, where one long table is re-split for every page.
+    """
+    yield from intro
+    capacity = _page_rows(doc, intro)
+    chunk, first = [], True
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == capacity:
+            if not first:
+                yield PageBreak()
+            yield _table(header, chunk, col_widths)
+            chunk, first = [], False
+            capacity = _page_rows(doc)
+    if chunk or first:
+        if not first:
+            yield PageBreak()
+        yield _table(header, chunk, col_widths)
+
+
+def _table(header, rows, col_widths):
+    table = Table([header] + rows, colWidths=col_widths,
+                  rowHeights=[HEADER_HEIGHT] + [ROW_HEIGHT] * len(rows))
+    table.setStyle(TABLE_STYLE)
+    return table
+
+
+def _expected_pages(doc, intro, rows):
+    first = _page_rows(doc, intro)
+    return 1 + max(-(-(rows - first) // _page_rows(doc)), 0)
+
+
+def generate_logbook_report(logbook_entries, attachee, output=None, progress=None):
     """
     Generate a PDF report for logbook entries
     
     Args:
         logbook_entries: List of LogbookEntry objects
         attachee: User object representing the attachee
+        output: File-like object to write the PDF to, or the name of a file in
+            REPORT_FOLDER, by default one with a timestamp
+        progress: Optional callable receiving the fraction of pages written
     
     Returns:
-        Path to the generated PDF file
+        output if it is a file-like object, else the name of the PDF file in
+        REPORT_FOLDER
     """
-    # Create a filename for the report
-    filename = f"logbook_report_{attachee.id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    # Write to the given buffer, or a file named for the report
+    target, result = _target(output, f"logbook_report_{attachee.id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf")
     
-    # Create the PDF document
-    doc = SimpleDocTemplate(filepath, pagesize=letter)
+    # Create the PDF document, about three entries to a page
+    doc = ProgressDocTemplate(target, progress, len(logbook_entries) / 3, pagesize=letter)
     styles = getSampleStyleSheet()
     elements = []
     
     # Add title
     title_style = styles['Heading1']
-    title = Paragraph(f"Logbook Report - {attachee.name}", title_style)
+    title = Paragraph(f"Logbook Report - {attachee.username}", title_style)
     elements.append(title)
     elements.append(Spacer(1, 0.25*inch))
     
     # Add attachee information
     info_style = styles['Normal']
-    elements.append(Paragraph(f"<b>Attachee:</b> {attachee.name}", info_style))
+    elements.append(Paragraph(f"<b>Attachee:</b> {attachee.username}", info_style))
     
+    if attachee.organization:
+        elements.append(Paragraph(f"<b>Organization:</b> {attachee.organization.name}", info_style))
     if hasattr(attachee, 'attachee_profile') and attachee.attachee_profile:
         profile = attachee.attachee_profile
-        if profile.organization:
-            elements.append(Paragraph(f"<b>Organization:</b> {profile.organization.name}", info_style))
         if profile.department:
             elements.append(Paragraph(f"<b>Department:</b> {profile.department}", info_style))
     
@@ -74,132 +221,84 @@ def generate_logbook_report(logbook_entries, attachee):
     # Build the PDF
     doc.build(elements)
     
-    return filename
+    return result
 
-def generate_user_report(users, title="User Report"):
+def generate_user_report(users, title="User Report", output=None, progress=None, count=None):
     """
     Generate a PDF report for users
     
     Args:
-        users: List of User objects
+        users: Iterable of (username, email, role, organization name,
+            created_at) rows, e.g. a query result streamed with yield_per
         title: Title of the report
+        output: File-like object to write the PDF to, or the name of a file in
+            REPORT_FOLDER, by default one with a timestamp
+        progress: Optional callable receiving the fraction of pages written
+        count: Number of users, for progress; defaults to len(users)
     
     Returns:
-        Path to the generated PDF file
+        output if it is a file-like object, else the name of the PDF file in
+        REPORT_FOLDER
     """
-    # Create a filename for the report
-    filename = f"user_report_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    
-    # Create the PDF document
-    doc = SimpleDocTemplate(filepath, pagesize=letter)
+    # Write to the given buffer, or a file named for the report
+    target, result = _target(output, f"user_report_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf")
+    doc = ProgressDocTemplate(target, progress, pagesize=letter)
     styles = getSampleStyleSheet()
-    elements = []
     
-    # Add title
-    title_style = styles['Heading1']
-    title_paragraph = Paragraph(title, title_style)
-    elements.append(title_paragraph)
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Add report date
-    info_style = styles['Normal']
-    elements.append(Paragraph(f"<b>Report Date:</b> {datetime.now().strftime('%Y-%m-%d')}", info_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Create table data
-    data = [["Name", "Email", "Role", "Organization", "Created At"]]
-    
-    for user in users:
-        org_name = user.organization.name if user.organization else "N/A"
-        data.append([
-            user.name,
-            user.email,
-            user.role.value,
-            org_name,
-            user.created_at.strftime('%Y-%m-%d')
-        ])
-    
-    # Create table
-    table = Table(data, colWidths=[1.5*inch, 2*inch, 1*inch, 1.5*inch, 1*inch])
-    
-    # Add style to table
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
+    # Title and report date, then the users a page at a time
+    intro = [
+        Paragraph(title, styles['Heading1']),
+        Spacer(1, 0.25*inch),
+        Paragraph(f"<b>Report Date:</b> {datetime.now().strftime('%Y-%m-%d')}", styles['Normal']),
+        Spacer(1, 0.25*inch),
+    ]
+    doc.expected_pages = _expected_pages(doc, intro, len(users) if count is None else count)
+    rows = ([username, email, role.value, organization or "N/A", created_at.strftime('%Y-%m-%d')]
+            for username, email, role, organization, created_at in users)
+    header = ["Name", "Email", "Role", "Organization", "Created At"]
     
     # Build the PDF
-    doc.build(elements)
+    doc.build(_FlowableStream(_paged_tables(doc, intro, header, rows,
+                                            [1.5*inch, 2*inch, 1*inch, 1.5*inch, 1*inch])))
     
-    return filename
+    return result
 
-def generate_organization_report(organizations):
+def generate_organization_report(organizations, output=None, progress=None, count=None):
     """
     Generate a PDF report for organizations
     
     Args:
-        organizations: List of Organization objects
+        organizations: Iterable of (name, address, contact email, user count)
+            rows, e.g. a query result streamed with yield_per
+        output: File-like object to write the PDF to, or the name of a file in
+            REPORT_FOLDER, by default one with a timestamp
+        progress: Optional callable receiving the fraction of pages written
+        count: Number of organizations, for progress; defaults to
+            len(organizations)
     
     Returns:
-        Path to the generated PDF file
+        output if it is a file-like object, else the name of the PDF file in
+        REPORT_FOLDER
     """
-    # Create a filename for the report
-    filename = f"organization_report_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    
-    # Create the PDF document
-    doc = SimpleDocTemplate(filepath, pagesize=letter)
+    # Write to the given buffer, or a file named for the report
+    target, result = _target(output, f"organization_report_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf")
+    doc = ProgressDocTemplate(target, progress, pagesize=letter)
     styles = getSampleStyleSheet()
-    elements = []
-    
-    # Add title
-    title_style = styles['Heading1']
-    title = Paragraph("Organization Report", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.25*inch))
     
-    # Add report date
-    info_style = styles['Normal']
-    elements.append(Paragraph(f"<b>Report Date:</b> {datetime.now().strftime('%Y-%m-%d')}", info_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Create table data
-    data = [["Name", "Address", "Contact Email", "Number of Users"]]
-    
-    for org in organizations:
-        user_count = len(org.users) if org.users else 0
-        data.append([
-            org.name,
-            org.address or "N/A",
-            org.contact_email or "N/A",
-            str(user_count)
-        ])
-    
-    # Create table
-    table = Table(data, colWidths=[1.5*inch, 2*inch, 2*inch, 1.5*inch])
-    
-    # Add style to table
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
+    # Title and report date, then the organizations a page at a time
+    intro = [
+        Paragraph("Organization Report", styles['Heading1']),
+        Spacer(1, 0.25*inch),
+        Paragraph(f"<b>Report Date:</b> {datetime.now().strftime('%Y-%m-%d')}", styles['Normal']),
+        Spacer(1, 0.25*inch),
+    ]
+    doc.expected_pages = _expected_pages(doc, intro, len(organizations) if count is None else count)
+    rows = ([name, address or "N/A", contact_email or "N/A", str(user_count)]
+            for name, address, contact_email, user_count in organizations)
+    header = ["Name", "Address", "Contact Email", "Number of Users"]
     
     # Build the PDF
-    doc.build(elements)
+    doc.build(_FlowableStream(_paged_tables(doc, intro, header, rows,
+                                            [1.5*inch, 2*inch, 2*inch, 1.5*inch])))
     
-    return filename
\ No newline at end of file
+    return result
@@ -0,0 +1,108 @@
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.expression import ClauseElement
+from sqlalchemy.ext.compiler import compiles
+from datetime import datetime
+from app import db
+from app.models import User, LogbookEntry, FileUpload, VideoSession
+from app.models import UserRole, LogbookStatus, VideoSessionStatus
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN wrapper so bound parameters go through the normal driver path"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN QUERY PLAN ' if compiler.dialect.name == 'sqlite' else 'EXPLAIN '
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def hot_path_queries(user_id=1, org_id=1):
+    """
+    Representative queries for the list and dashboard routes
+
+    Args:
+        user_id: Id used wherever a route filters by the current user
+        org_id: Id used wherever a route filters by the current organization
+
+    Returns:
+        List of (name, Query) tuples
+    """
+    now = datetime.utcnow()
+    return [
+        ('attachee.logbook', LogbookEntry.query.filter_by(attachee_id=user_id)
+            .order_by(LogbookEntry.created_at.desc()).limit(10)),
+        ('attachee.new_logbook_entry', LogbookEntry.query.filter_by(attachee_id=user_id)
+            .order_by(LogbookEntry.week_number.desc()).limit(1)),
+        ('attachee.files', FileUpload.query.filter_by(attachee_id=user_id)
+            .order_by(FileUpload.uploaded_at.desc()).limit(10)),
+        ('attachee.video_sessions', VideoSession.query.filter_by(attachee_id=user_id)
+            .order_by(VideoSession.start_time.desc()).limit(10)),
+        ('assessor.dashboard.recent_entries', LogbookEntry.query.filter_by(status=LogbookStatus.SUBMITTED)
+            .order_by(LogbookEntry.created_at.desc()).limit(5)),
+        ('assessor.dashboard.upcoming_sessions', VideoSession.query.filter_by(
+            assessor_id=user_id, status=VideoSessionStatus.SCHEDULED)
+            .filter(VideoSession.start_time >= now).order_by(VideoSession.start_time).limit(5)),
+        ('assessor.logbooks', LogbookEntry.query.order_by(LogbookEntry.created_at.desc()).limit(10)),
+        ('assessor.logbooks.status', LogbookEntry.query.filter_by(status=LogbookStatus.SUBMITTED)
+            .order_by(LogbookEntry.created_at.desc()).limit(10)),
+        ('assessor.video_sessions', VideoSession.query.filter_by(assessor_id=user_id)
+            .order_by(VideoSession.start_time.desc()).limit(10)),
+        ('assessor.video_sessions.status', VideoSession.query.filter_by(
+            assessor_id=user_id, status=VideoSessionStatus.SCHEDULED)
+            .order_by(VideoSession.start_time.desc()).limit(10)),
+        ('org_manager.dashboard.recent_entries', LogbookEntry.query.join(
+            User, LogbookEntry.attachee_id == User.id).filter(
+            User.organization_id == org_id, LogbookEntry.status == LogbookStatus.SUBMITTED)
+            .order_by(LogbookEntry.created_at.desc()).limit(5)),
+        ('org_manager.attachees', User.query.filter_by(organization_id=org_id, role=UserRole.ATTACHEE)
+            .order_by(User.username).limit(20)),
+        ('org_manager.logbooks', LogbookEntry.query.join(
+            User, LogbookEntry.attachee_id == User.id).filter(User.organization_id == org_id)
+            .order_by(LogbookEntry.created_at.desc()).limit(10)),
+        ('admin.dashboard.recent_users', User.query.order_by(User.created_at.desc()).limit(5)),
+        ('admin.users', User.query.order_by(User.username).limit(20)),
+        ('admin.users.role', User.query.filter(User.role == UserRole.ATTACHEE)
+            .order_by(User.username).limit(20)),
+    ]
+
+
+def explain(query):
+    """Return the plan lines the database reports for a query"""
+    if db.engine.dialect.name == 'postgresql':
+        # Small tables always favour a sequential scan; only report one when
+        # no usable index exists
+        db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+        return [row[0] for row in db.session.execute(Explain(query.statement))]
+    return [row[3] for row in db.session.execute(Explain(query.statement))]
+
+
+def is_full_scan(line):
+    """Whether a plan line reads a whole table rather than an index"""
+    line = line.strip()
+    if line.startswith('SCAN '):
+        # SQLite: "SCAN user" is a table scan, "SCAN user USING INDEX ..." is not
+        return 'USING' not in line and 'CONSTANT ROW' not in line
+    return 'Seq Scan on ' in line
+
+
+def find_full_scans(user_id=1, org_id=1):
+    """
+    Run EXPLAIN over every hot path query
+
+    Returns:
+        List of (name, plan line) tuples for queries that scan a whole table
+    """
+    failures = []
+    for name, query in hot_path_queries(user_id, org_id):
+        try:
+            for line in explain(query):
+                if is_full_scan(line):
+                    failures.append((name, line.strip()))
+        finally:
+            db.session.rollback()
+    return failures
@@ -0,0 +1,112 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_IN_LIST = re.compile(r'\bIN\s*\((?:[^()]|\([^()]*\))*\)', re.I)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneError(Exception):
+    """Raised in strict mode when a request repeats the same statement per row"""
+
+
+def fingerprint(statement):
+    """Reduce a statement to its shape so per-row repeats compare equal"""
+    statement = _IN_LIST.sub('IN (?)', statement)
+    statement = _LITERAL.sub('?', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+class QueryStats:
+    """Statements executed while a collector is active"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        """Fingerprints executed at least `threshold` times, most frequent first"""
+        return [(fp, n) for fp, n in self.fingerprints.most_common() if n >= threshold]
+
+
+def _collectors():
+    if not has_app_context():
+        return None
+    return g.setdefault('_query_collectors', [])
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start_time'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = _collectors()
+    if collectors:
+        duration = time.perf_counter() - conn.info.pop('query_start_time')
+        for stats in collectors:
+            stats.record(statement, duration)
+
+
+@contextmanager
+def count_queries():
+    """
+    Collect the statements executed inside the block
+
+    Example:
+        with count_queries() as stats:
+            render_page()
+        assert stats.count <= 5
+    """
+    stats = QueryStats()
+    collectors = _collectors()
+    collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        collectors.remove(stats)
+
+
+def init_query_stats(app):
+    """Record per-request query counts and flag repeated statements"""
+    if not app.config['QUERY_STATS_ENABLED']:
+        return
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+        _collectors().append(g.query_stats)
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        _collectors().remove(stats)
+
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time'] = f'{stats.duration * 1000:.1f}ms'
+
+        threshold = app.config['QUERY_STATS_REPEAT_THRESHOLD']
+        repeated = stats.repeated(threshold)
+        message = f'{request.method} {request.path} - {stats.count} queries in {stats.duration * 1000:.1f}ms'
+        if repeated:
+            app.logger.warning(f'{message}, repeated: ' +
+                               '; '.join(f'{n}x {fp[:120]}' for fp, n in repeated))
+            if app.config['QUERY_STATS_STRICT']:
+                raise NPlusOneError(f'{request.path} ran {repeated[0][1]}x: {repeated[0][0]}')
+        else:
+            app.logger.info(message)
+        return response
@@ -0,0 +1,108 @@
+import hashlib
+from datetime import date
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.models import User, Organization, AttacheeProfile, LogbookEntry
+from app.utils.lru_cache import LRUCache
+
+
+class ReportCache(LRUCache):
+    """
+    Per-process LRU of built reports, bounded by their total size in bytes
+
+    Keys are fingerprints of everything a report shows, so a cached PDF is
+    only served while its inputs are unchanged, and it is served byte for
+    byte. Entries are also dropped as soon as this process commits a change
+    to their owner's data, rather than waiting for the LRU to evict them.
+    """
+
+    def __init__(self, maxbytes=64 * 2 ** 20):
+        super().__init__(maxbytes, sizeof=len)
+
+    @property
+    def maxbytes(self):
+        return self.maxsize
+
+    def stats(self):
+        return dict(super().stats(), bytes=self.size, maxbytes=self.maxsize)
+
+
+report_cache = ReportCache()
+
+
+def logbook_fingerprint(params):
+    """
+    Cache key of an attachee's logbook report: the template version, the
+    date printed on it, the attachee details it shows, and the ids and
+    latest update of the entries. Editing or reviewing an entry bumps its
+    updated_at, and adding or deleting one changes the ids.
+
+    Returns:
+        Hex digest, or None if the attachee does not exist
+    """
+    from app.utils.pdf_generator import LOGBOOK_TEMPLATE_VERSION
+    attachee_id = params['attachee_id']
+    attachee = db.session.execute(
+        select(User.username, Organization.name, AttacheeProfile.department)
+        .outerjoin(Organization, Organization.id == User.organization_id)
+        .outerjoin(AttacheeProfile, AttacheeProfile.user_id == User.id)
+        .where(User.id == attachee_id)
+    ).first()
+    if attachee is None:
+        return None
+    entries = db.session.execute(
+        select(LogbookEntry.id, LogbookEntry.updated_at)
+        .where(LogbookEntry.attachee_id == attachee_id)
+        .order_by(LogbookEntry.id)
+    ).all()
+    latest = max((updated_at for _, updated_at in entries if updated_at), default=None)
+    source = repr((LOGBOOK_TEMPLATE_VERSION, date.today().isoformat(), attachee_id, tuple(attachee),
+                   [entry_id for entry_id, _ in entries], latest))
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+# Reports whose inputs can be fingerprinted cheaply, and the owner whose
+# changes invalidate them
+FINGERPRINTS = {
+    'logbook': (logbook_fingerprint, lambda params: params['attachee_id']),
+}
+
+
+def cache_key(kind, params):
+    """
+    Returns:
+        (key, owner) for a cacheable report, or (None, None)
+    """
+    if kind not in FINGERPRINTS or not report_cache.maxbytes:
+        return None, None
+    fingerprint, owner = FINGERPRINTS[kind]
+    key = fingerprint(params)
+    return (f'{kind}:{key}', owner(params)) if key else (None, None)
+
+
+# Attachees whose entries a flush touched lose their cached reports once the
+# transaction commits
+
+@event.listens_for(LogbookEntry, 'after_insert')
+@event.listens_for(LogbookEntry, 'after_update')
+@event.listens_for(LogbookEntry, 'after_delete')
+def _entry_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('report_cache', set()).add(target.attachee_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_reports(session):
+    for attachee_id in session.info.pop('report_cache', ()):
+        report_cache.invalidate_owner(attachee_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_reports(session):
+    session.info.pop('report_cache', None)
+
+
+def init_report_cache(app):
+    report_cache.configure(app.config['REPORT_CACHE_BYTES'])
@@ -0,0 +1,571 @@
+import io
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import delete, func, select, update
+from werkzeug.utils import secure_filename
+from app import db
+from app.models import User, Organization, LogbookEntry, ReportJob, ReportStatus, UserRole
+from app.utils.report_cache import cache_key, report_cache
+from app.utils.zip_stream import ZipSink
+
+ACTIVE = (ReportStatus.QUEUED, ReportStatus.RUNNING)
+FINISHED = (ReportStatus.DONE, ReportStatus.FAILED)
+# Finished jobs each sweep deletes at most, so one request never pays for a long backlog
+SWEEP_BATCH = 100
+# Rows the user and organization reports fetch at a time as they stream
+ROWS_PER_FETCH = 1000
+
+_executor = None
+_pool_lock = threading.Lock()
+_stream_slots = None
+# Collapses concurrent duplicate requests within this worker
+_request_lock = threading.Lock()
+
+
+class ReportsBusy(Exception):
+    """Raised when REPORT_MAX_ACTIVE jobs are already queued or running"""
+
+
+def report_room(job_id):
+    """Socket.IO room that receives a job's progress"""
+    return f'report:{job_id}'
+
+
+def report_key(kind, params):
+    return f'{kind}:{json.dumps(params, sort_keys=True, separators=(",", ":"))}'
+
+
+# Builders run inside an app context and write the report to `output`, a
+# file name in REPORT_FOLDER or a file-like object
+
+def _build_users(params, output, progress=None):
+    from app.utils.pdf_generator import generate_user_report
+    count = db.session.scalar(select(func.count()).select_from(User))
+    users = db.session.execute(
+        select(User.username, User.email, User.role, Organization.name, User.created_at)
+        .outerjoin(Organization, Organization.id == User.organization_id)
+        .order_by(User.username, User.id)
+        .execution_options(yield_per=ROWS_PER_FETCH))
+    return generate_user_report(users, output=output, progress=progress, count=count)
+
+
+def _build_organizations(params, output, progress=None):
+    from app.utils.pdf_generator import generate_organization_report
+    count = db.session.scalar(select(func.count()).select_from(Organization))
+    # Every organization's user count in one aggregate, instead of loading
+    # each organization's users
+    user_counts = select(User.organization_id, func.count().label('users')) \
+        .group_by(User.organization_id).subquery()
+    organizations = db.session.execute(
+        select(Organization.name, Organization.address, Organization.contact_email,
+               func.coalesce(user_counts.c.users, 0))
+        .outerjoin(user_counts, user_counts.c.organization_id == Organization.id)
+        .order_by(Organization.name, Organization.id)
+        .execution_options(yield_per=ROWS_PER_FETCH))
+    return generate_organization_report(organizations, output=output, progress=progress, count=count)
+
+
+def _build_logbook(params, output, progress=None):
+    from app.utils.pdf_generator import generate_logbook_report
+    attachee = _attachee(params.get('attachee_id'))
+    if attachee is None:
+        raise ValueError(f"No attachee with id {params.get('attachee_id')}")
+    entries = LogbookEntry.query.filter_by(attachee_id=attachee.id).order_by(LogbookEntry.week_number).all()
+    return generate_logbook_report(entries, attachee, output=output, progress=progress)
+
+
+BUILDERS = {
+    'users': _build_users,
+    'organizations': _build_organizations,
+    'logbook': _build_logbook,
+}
+
+
+def _organization_attachees(params):
+    return db.session.execute(
+        select(User.id, User.username)
+        .where(User.organization_id == params['organization_id'], User.role == UserRole.ATTACHEE)
+        .order_by(User.username, User.id)
+    ).all()
+
+
+# Exports that bundle one report per attachee into a ZIP: the function lists
+# the (attachee id, username) pairs to include
+BULK = {
+    'logbooks': _organization_attachees,
+}
+
+# Form fields each kind of report takes
+PARAMS = {
+    'logbook': ('attachee_id',),
+    'logbooks': ('organization_id',),
+}
+
+
+def report_filename(kind):
+    """Name the browser saves a streamed report as"""
+    extension = 'zip' if kind in BULK else 'pdf'
+    return f"{kind}_report_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{extension}"
+
+
+def _attachee(attachee_id):
+    """The attachee a logbook report is for, or None for any other id"""
+    attachee = db.session.get(User, attachee_id) if attachee_id is not None else None
+    return attachee if attachee is not None and attachee.role == UserRole.ATTACHEE else None
+
+
+def can_access(user, kind, params):
+    """
+    Whether `user` may request and download a report, matching who can view
+    its data; never for a report of an attachee or organization that does
+    not exist, whoever asks
+    """
+    if kind == 'logbooks':
+        # Everyone's logbooks in an organization, for the roles that can
+        # view each of them
+        organization_id = params.get('organization_id')
+        if organization_id is None or db.session.get(Organization, organization_id) is None:
+            return False
+        return user.role in (UserRole.ADMIN, UserRole.ASSESSOR) or \
+            (user.role == UserRole.ORG_MANAGER and user.organization_id == organization_id)
+    if kind != 'logbook':
+        return user.role == UserRole.ADMIN and kind in BUILDERS
+    attachee = _attachee(params.get('attachee_id'))
+    if attachee is None:
+        return False
+    if user.role in (UserRole.ADMIN, UserRole.ASSESSOR):
+        return True
+    if user.role == UserRole.ORG_MANAGER:
+        return user.organization_id is not None and attachee.organization_id == user.organization_id
+    return user.id == attachee.id
+
+
+def request_report(user, kind, params):
+    """
+    Start a report, or join the job already building the same one
+
+    Args:
+        user: Requesting user, already checked with can_access
+        kind: One of BUILDERS or BULK
+        params: JSON parameters of the report
+
+    Returns:
+        The ReportJob
+
+    Raises:
+        ReportsBusy: Too many jobs are queued or running
+    """
+    key = report_key(kind, params)
+    _sweep(current_app)
+    with _request_lock:
+        job = ReportJob.query.filter(ReportJob.key == key, ReportJob.status.in_(ACTIVE)) \
+            .order_by(ReportJob.id).first()
+        if job is not None:
+            db.session.commit()
+            return job
+        active = db.session.scalar(select(func.count()).select_from(ReportJob).where(ReportJob.status.in_(ACTIVE)))
+        if active >= current_app.config['REPORT_MAX_ACTIVE']:
+            db.session.commit()
+            raise ReportsBusy()
+        job = ReportJob(kind=kind, key=key, params=params, requested_by=user.id, status=ReportStatus.QUEUED)
+        db.session.add(job)
+        db.session.commit()
+    _start(current_app._get_current_object(), job.id, kind)
+    return job
+
+
+def _sweep(app):
+    """
+    Fail jobs a crashed worker left behind, so they do not absorb new
+    requests, and delete finished jobs and their files once
+    REPORT_RETENTION has passed. Runs in the caller's transaction.
+    """
+    now = datetime.utcnow()
+    timeout = now - timedelta(seconds=app.config['REPORT_JOB_TIMEOUT'])
+    db.session.execute(update(ReportJob).where(ReportJob.status.in_(ACTIVE), ReportJob.created_at < timeout)
+                       .values(status=ReportStatus.FAILED, error='Timed out', finished_at=now))
+    if not app.config['REPORT_RETENTION']:
+        return
+    expired = db.session.execute(
+        select(ReportJob.id, ReportJob.filename)
+        .where(ReportJob.status.in_(FINISHED),
+               ReportJob.finished_at < now - timedelta(seconds=app.config['REPORT_RETENTION']))
+        .order_by(ReportJob.finished_at)
+        .limit(SWEEP_BATCH)
+    ).all()
+    for _, filename in expired:
+        if filename:
+            _remove_file(app, filename)
+    if expired:
+        db.session.execute(delete(ReportJob).where(ReportJob.id.in_([job_id for job_id, _ in expired])))
+
+
+def _remove_file(app, filename):
+    try:
+        os.remove(os.path.join(app.config['REPORT_FOLDER'], filename))
+    except FileNotFoundError:
+        # Another worker's sweep got there first
+        pass
+
+
+def _start(app, job_id, kind):
+    from app import socketio
+    executor = _get_executor(app)
+    if executor is None or kind in BULK:
+        # Bulk exports fan out to the pool from this worker
+        socketio.start_background_task(_run_inline, app, job_id)
+        future = None
+    else:
+        try:
+            future = executor.submit(run_job, job_id)
+        except BrokenProcessPool:
+            # A pool process died, which breaks the whole pool; start afresh
+            future = _replace_executor(app, executor).submit(run_job, job_id)
+    socketio.start_background_task(_watch, app, job_id, future)
+
+
+def _get_executor(app):
+    """Process pool for report jobs, created lazily so each worker process gets its own"""
+    global _executor
+    workers = app.config['REPORT_WORKERS']
+    if not workers:
+        return None
+    with _pool_lock:
+        if _executor is None:
+            # Children build their own app from this config; spawn rather
+            # than fork, so they do not inherit a gevent hub
+            config = {key: value for key, value in app.config.items()
+                      if key.isupper() and key != 'SQLALCHEMY_ENGINE_OPTIONS'}
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_child, initargs=(config,))
+    return _executor
+
+
+_child_app = None
+
+
+def _init_child(config):
+    global _child_app
+    from app import create_app
+    from app.config import Config
+    _child_app = create_app(type('Config', (Config,), dict(config, REPORT_WORKERS=0)))
+
+
+def run_job(job_id):
+    """Build a queued report; runs in a pool process or, without one, a greenlet"""
+    app = _child_app or current_app._get_current_object()
+    with app.app_context():
+        job = db.session.get(ReportJob, job_id)
+        job.status = ReportStatus.RUNNING
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+        reported = [0]
+
+        def progress(fraction):
+            # Written to the job row, which the requesting worker relays;
+            # every five percent is enough for a progress bar. It uses its
+            # own connection: committing the session would end the
+            # transaction the report's rows are being streamed from
+            percent = min(int(fraction * 100), 99)
+            if percent >= reported[0] + 5:
+                reported[0] = percent
+                with db.engine.begin() as connection:
+                    connection.execute(update(ReportJob).where(ReportJob.id == job_id).values(progress=percent))
+
+        try:
+            if job.kind in BULK:
+                filename = f'{job.kind}_report_{job.id}.zip'
+                chunks = _zip_reports(app, BULK[job.kind](job.params), progress)
+            else:
+                filename = f'{job.kind}_report_{job.id}.pdf'
+                chunks = [_cached_build(job.kind, job.params, progress)]
+            with open(os.path.join(app.config['REPORT_FOLDER'], filename), 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception(f'Report job {job_id} failed')
+            # Nothing will ever serve what was written before the failure
+            _remove_file(app, filename)
+            values = dict(status=ReportStatus.FAILED, error=str(e) or type(e).__name__)
+        else:
+            values = dict(status=ReportStatus.DONE, progress=100, filename=filename)
+        db.session.execute(update(ReportJob).where(ReportJob.id == job_id)
+                           .values(finished_at=datetime.utcnow(), **values))
+        db.session.commit()
+        db.session.remove()
+
+
+def _run_inline(app, job_id):
+    with app.app_context():
+        run_job(job_id)
+
+
+def _logbooks_as_built(app, attachees):
+    """
+    Each attachee's logbook report, in the order they finish
+
+    Reports come from the report cache when possible; the rest are built in
+    the pool, at most two per pool process in flight, so a large export
+    neither waits on one report at a time nor holds them all in memory.
+
+    Yields:
+        (attachee id, username, PDF bytes)
+    """
+    executor = _get_executor(app)
+    limit = 2 * app.config['REPORT_WORKERS']
+    pending = {}
+
+    def submit(attachee_id, username, key, owner, retried=False):
+        nonlocal executor
+        params = {'attachee_id': attachee_id}
+        try:
+            future = executor.submit(build_report, 'logbook', params)
+        except BrokenProcessPool:
+            # A pool process died, which breaks the whole pool; start afresh
+            executor = _replace_executor(app, executor)
+            future = executor.submit(build_report, 'logbook', params)
+        pending[future] = (attachee_id, username, key, owner, executor, retried)
+
+    def finished(return_when):
+        nonlocal executor
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            attachee_id, username, key, owner, pool, retried = pending.pop(future)
+            try:
+                data = future.result()
+            except BrokenProcessPool:
+                # Reports lost with a dead pool process are built again on a
+                # fresh pool, once, so one that kills its process still fails
+                if retried:
+                    raise
+                if executor is pool:
+                    executor = _replace_executor(app, pool)
+                submit(attachee_id, username, key, owner, retried=True)
+                continue
+            if key:
+                report_cache.put(key, data, owner)
+            yield attachee_id, username, data
+
+    try:
+        for attachee_id, username in attachees:
+            params = {'attachee_id': attachee_id}
+            key, owner = cache_key('logbook', params)
+            data = report_cache.get(key) if key else None
+            if data is None and executor is None:
+                data = build_report('logbook', params)
+                if key:
+                    report_cache.put(key, data, owner)
+            if data is not None:
+                yield attachee_id, username, data
+                continue
+            while len(pending) >= limit:
+                yield from finished(FIRST_COMPLETED)
+            submit(attachee_id, username, key, owner)
+        while pending:
+            yield from finished(FIRST_COMPLETED)
+    finally:
+        # An abandoned export must not keep the pool busy
+        for future in pending:
+            future.cancel()
+
+
+def _zip_reports(app, attachees, progress=None):
+    """
+    ZIP of the attachees' logbook reports, produced in chunks as each report
+    is added
+
+    PDFs are compressed already, so entries are stored as they are. Each
+    chunk holds one report; the last holds the ZIP's central directory.
+    """
+    sink = ZipSink()
+    total = len(attachees)
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for done, (attachee_id, username, data) in enumerate(_logbooks_as_built(app, attachees), 1):
+            archive.writestr(f'{secure_filename(username) or "attachee"}_{attachee_id}_logbook.pdf', data)
+            if progress:
+                progress(done / total)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _cached_build(kind, params, progress=None):
+    """The report's PDF from this process's report cache, built on a miss"""
+    key, owner = cache_key(kind, params)
+    data = report_cache.get(key) if key else None
+    if data is None:
+        buffer = io.BytesIO()
+        BUILDERS[kind](params, buffer, progress)
+        data = buffer.getvalue()
+        if key:
+            report_cache.put(key, data, owner)
+    return data
+
+
+def build_report(kind, params):
+    """Build a report in memory; runs in a pool process or, without one, the request"""
+    app = _child_app or current_app._get_current_object()
+    with app.app_context():
+        buffer = io.BytesIO()
+        try:
+            BUILDERS[kind](params, buffer)
+        finally:
+            db.session.remove()
+        return buffer.getvalue()
+
+
+def _get_stream_slots(app):
+    global _stream_slots
+    with _pool_lock:
+        if _stream_slots is None:
+            _stream_slots = threading.BoundedSemaphore(app.config['REPORT_STREAM_MAX_ACTIVE'])
+    return _stream_slots
+
+
+def stream_report(kind, params, filename):
+    """
+    Build a report without touching the disk and send it as the response
+
+    Each report is held in memory from the start of the build until its last
+    chunk is sent, and each worker holds at most REPORT_STREAM_MAX_ACTIVE at
+    a time, so concurrent downloads cannot grow memory without bound. Reports
+    found in the report cache are sent from there and do not count.
+
+    Args:
+        kind: One of BUILDERS or BULK
+        params: JSON parameters of the report
+        filename: Name the browser saves the file as
+
+    Returns:
+        A Response sending the PDF in chunks of REPORT_STREAM_CHUNK_SIZE
+        bytes, or for BULK kinds the ZIP as each report in it is built
+
+    Raises:
+        ReportsBusy: This worker is already building or sending as many
+            reports as it may hold
+    """
+    app = current_app._get_current_object()
+    if kind in BULK:
+        return _stream_bulk(app, kind, params, filename)
+    key, owner = cache_key(kind, params)
+    data = report_cache.get(key) if key else None
+    if data is not None:
+        # Already held by the cache, so it does not take a slot
+        return _pdf_response(data, filename, app.config['REPORT_STREAM_CHUNK_SIZE'])
+    slots = _get_stream_slots(app)
+    if not slots.acquire(blocking=False):
+        raise ReportsBusy()
+    try:
+        executor = _get_executor(app)
+        if executor is None:
+            data = build_report(kind, params)
+        else:
+            try:
+                data = executor.submit(build_report, kind, params).result()
+            except BrokenProcessPool:
+                data = _replace_executor(app, executor).submit(build_report, kind, params).result()
+    except BaseException:
+        slots.release()
+        raise
+    if key:
+        report_cache.put(key, data, owner)
+    response = _pdf_response(data, filename, app.config['REPORT_STREAM_CHUNK_SIZE'])
+    # Called when the server closes the response, even if the client left
+    # before the first chunk was sent
+    response.call_on_close(slots.release)
+    return response
+
+
+def _stream_bulk(app, kind, params, filename):
+    # An export holds a slot while it runs, with at most a few reports in
+    # memory at a time; its length is unknown until the last one is built
+    slots = _get_stream_slots(app)
+    if not slots.acquire(blocking=False):
+        raise ReportsBusy()
+    try:
+        attachees = BULK[kind](params)
+    except BaseException:
+        slots.release()
+        raise
+    response = Response(stream_with_context(_zip_reports(app, attachees)), mimetype='application/zip', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'private, no-store',
+    })
+    response.call_on_close(slots.release)
+    return response
+
+
+def _pdf_response(data, filename, chunk_size):
+    def chunks():
+        view = memoryview(data)
+        for start in range(0, len(view), chunk_size):
+            yield bytes(view[start:start + chunk_size])
+
+    return Response(chunks(), mimetype='application/pdf', headers={
+        'Content-Length': str(len(data)),
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        # Built from live, personal data: never reuse or share a copy
+        'Cache-Control': 'private, no-store',
+    })
+
+
+def serialize(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status.value,
+        'progress': job.progress,
+        'error': job.error,
+    }
+
+
+def _watch(app, job_id, future):
+    """Relay a job's progress from its row to the watchers' room until it ends"""
+    from app import socketio
+    last = None
+    while True:
+        socketio.sleep(app.config['REPORT_PROGRESS_INTERVAL'])
+        with app.app_context():
+            try:
+                job = db.session.get(ReportJob, job_id)
+                if future is not None and future.done() and job.status in ACTIVE and \
+                        (future.cancelled() or future.exception() is not None):
+                    # The pool process died, or the pool was shut down,
+                    # before the job recorded its outcome
+                    job.status = ReportStatus.FAILED
+                    job.error = 'Cancelled' if future.cancelled() else str(future.exception())
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+                state = serialize(job)
+            finally:
+                db.session.remove()
+        if state != last:
+            socketio.emit('report_progress', state, to=report_room(job_id))
+            last = state
+        if state['status'] not in (ReportStatus.QUEUED.value, ReportStatus.RUNNING.value):
+            return
+
+
+def _replace_executor(app, broken):
+    """A fresh pool in place of a broken one, unless another caller replaced it already"""
+    global _executor
+    with _pool_lock:
+        if _executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+    return _get_executor(app)
+
+
+def shutdown():
+    global _executor
+    with _pool_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
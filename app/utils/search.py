@@ -0,0 +1,344 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import event, inspect, select, text, false, literal, or_, Float, Integer
+from app import db
+from app.models import User, Organization, AttacheeProfile, LogbookEntry
+
+
+class SearchIndex:
+    """
+    A full-text table with one document per row of a model
+
+    Kept outside the ORM metadata because SQLite stores it in an FTS5
+    virtual table.
+    """
+
+    def __init__(self, table, key, source, fields, weights, stemmed):
+        self.table = table
+        self.key = key            # document id column on PostgreSQL (rowid on SQLite)
+        self.source = source      # table the documents are built from
+        self.fields = fields      # in ranking order
+        self.weights = weights
+        self.stemmed = stemmed
+
+
+# Usernames, emails and names are matched as written; logbook prose is stemmed
+USERS = SearchIndex('user_search', 'user_id', 'user', ('username', 'email', 'organization', 'profile'),
+                    (10.0, 5.0, 2.0, 1.0), stemmed=False)
+LOGBOOKS = SearchIndex('logbook_search', 'entry_id', 'logbook_entry', ('tasks', 'skills_gained', 'challenges'),
+                       (2.0, 1.5, 1.0), stemmed=True)
+INDEXES = (USERS, LOGBOOKS)
+
+# Words of a search term; anything else is dropped so terms cannot inject
+# query syntax
+_WORD = re.compile(r'[^\W_]+')
+_PHRASE_OR_WORD = re.compile(r'"([^"]*)"|(\S+)')
+MAX_TERMS = 8
+
+# Highlight markers that cannot occur in escaped text
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def parse_terms(term, phrases=False):
+    """
+    Split a search term into words to match, lowercased
+
+    Returns:
+        List of word lists; a quoted phrase (when phrases is set) is one list
+        matched in order, every other word a list of its own matched as a prefix
+    """
+    parts = []
+    for phrase, word in _PHRASE_OR_WORD.findall(term):
+        words = [w.lower() for w in _WORD.findall(phrase or word)]
+        if phrases and phrase and len(words) > 1:
+            parts.append(words)
+        else:
+            parts.extend([w] for w in words)
+    return parts[:MAX_TERMS]
+
+
+class SQLiteBackend:
+    """FTS5 tables with prefix indexes, ranked by bm25"""
+
+    def ddl(self, index):
+        tokenizer = 'porter unicode61 remove_diacritics 2' if index.stemmed else 'unicode61 remove_diacritics 2'
+        return [f"CREATE VIRTUAL TABLE IF NOT EXISTS {index.table} USING fts5("
+                f"{', '.join(index.fields)}, tokenize='{tokenizer}', prefix='2 3')"]
+
+    def delete(self, connection, index, ids):
+        connection.execute(text(f'DELETE FROM {index.table} WHERE rowid = :id'), [{'id': id} for id in ids])
+
+    def upsert(self, connection, index, documents):
+        self.delete(connection, index, [document['id'] for document in documents])
+        connection.execute(text(f"INSERT INTO {index.table} (rowid, {', '.join(index.fields)}) "
+                                f"VALUES (:id, {', '.join(':' + field for field in index.fields)})"), documents)
+
+    def _query(self, terms):
+        return ' '.join(f'"{words[0]}"*' if len(words) == 1 else f'"{" ".join(words)}"' for words in terms)
+
+    def matches(self, index, terms):
+        weights = ', '.join(str(weight) for weight in index.weights)
+        # rowid + 0 stops the planner from probing the FTS table once per
+        # source row by rowid; the MATCH scan then drives the join
+        return text(f'SELECT rowid + 0 AS id, bm25({index.table}, {weights}) AS rank '
+                    f'FROM {index.table} WHERE {index.table} MATCH :query') \
+            .bindparams(query=self._query(terms))
+
+    def snippets(self, connection, index, terms, ids):
+        rows = connection.execute(
+            text(f"SELECT rowid, snippet({index.table}, -1, :start, :end, '…', 16) "
+                 f"FROM {index.table} WHERE {index.table} MATCH :query AND rowid IN ({', '.join(map(str, ids))})"),
+            {'start': _MARK_START, 'end': _MARK_END, 'query': self._query(terms)})
+        return dict(rows.all())
+
+
+class PostgreSQLBackend:
+    """tsvector columns with GIN indexes, ranked by ts_rank"""
+
+    def _config(self, index):
+        return 'english' if index.stemmed else 'simple'
+
+    def ddl(self, index):
+        return [f'CREATE TABLE IF NOT EXISTS {index.table} ('
+                f'{index.key} INTEGER PRIMARY KEY REFERENCES "{index.source}" (id) ON DELETE CASCADE, '
+                f'document TSVECTOR NOT NULL)',
+                f'CREATE INDEX IF NOT EXISTS ix_{index.table}_document ON {index.table} USING GIN (document)']
+
+    def _document(self, index):
+        # Punctuation in emails and usernames becomes spaces so each part is a word
+        return ' || '.join(
+            f"setweight(to_tsvector('{self._config(index)}', translate(coalesce(:{field}, ''), '@._-', '    ')), "
+            f"'{weight}')" for field, weight in zip(index.fields, 'ABCD'))
+
+    def delete(self, connection, index, ids):
+        connection.execute(text(f'DELETE FROM {index.table} WHERE {index.key} = :id'), [{'id': id} for id in ids])
+
+    def upsert(self, connection, index, documents):
+        connection.execute(text(f'INSERT INTO {index.table} ({index.key}, document) '
+                                f'VALUES (:id, {self._document(index)}) '
+                                f'ON CONFLICT ({index.key}) DO UPDATE SET document = EXCLUDED.document'), documents)
+
+    def _query(self, terms):
+        return ' & '.join(f'{words[0]}:*' if len(words) == 1 else f"({' <-> '.join(words)})" for words in terms)
+
+    def matches(self, index, terms):
+        # Negated so that, as with bm25, ascending rank is the best match first
+        tsquery = f"to_tsquery('{self._config(index)}', :query)"
+        return text(f'SELECT {index.key} AS id, -ts_rank(document, {tsquery}) AS rank '
+                    f'FROM {index.table} WHERE document @@ {tsquery}') \
+            .bindparams(query=self._query(terms))
+
+    def snippets(self, connection, index, terms, ids):
+        config = self._config(index)
+        rows = connection.execute(
+            text(f"SELECT id, ts_headline('{config}', concat_ws(' … ', {', '.join(index.fields)}), "
+                 f"to_tsquery('{config}', :query), :options) FROM {index.source} WHERE id = ANY(:ids)"),
+            {'query': self._query(terms), 'ids': list(ids),
+             'options': f'StartSel={_MARK_START}, StopSel={_MARK_END}, MaxFragments=2, MaxWords=16, MinWords=6'})
+        return dict(rows.all())
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend(),
+    'postgresql': PostgreSQLBackend(),
+}
+
+
+def _backend(bind):
+    return BACKENDS.get(bind.dialect.name)
+
+
+def _user_documents(connection, user_ids):
+    """Search documents for the given users, built from their current rows"""
+    rows = connection.execute(
+        select(User.id, User.username, User.email, Organization.name,
+               AttacheeProfile.university, AttacheeProfile.course, AttacheeProfile.department)
+        .outerjoin(Organization, User.organization_id == Organization.id)
+        .outerjoin(AttacheeProfile, AttacheeProfile.user_id == User.id)
+        .where(User.id.in_(user_ids)))
+    return [dict(id=user_id, username=username, email=email, organization=organization or '',
+                 profile=' '.join(part for part in profile if part))
+            for user_id, username, email, organization, *profile in rows]
+
+
+def _logbook_documents(connection, entry_ids):
+    rows = connection.execute(
+        select(LogbookEntry.id, LogbookEntry.tasks, LogbookEntry.skills_gained, LogbookEntry.challenges)
+        .where(LogbookEntry.id.in_(entry_ids)))
+    return [dict(id=entry_id, tasks=tasks, skills_gained=skills_gained, challenges=challenges)
+            for entry_id, tasks, skills_gained, challenges in rows]
+
+
+_DOCUMENTS = {
+    USERS: _user_documents,
+    LOGBOOKS: _logbook_documents,
+}
+
+
+def _index(connection, index, ids):
+    """Bring the documents for the given source rows up to date"""
+    backend = _backend(connection)
+    ids = set(ids)
+    if backend is None or not ids:
+        return
+    documents = _DOCUMENTS[index](connection, ids)
+    missing = ids - {document['id'] for document in documents}
+    if missing:
+        backend.delete(connection, index, missing)
+    if documents:
+        backend.upsert(connection, index, documents)
+
+
+def index_users(connection, user_ids):
+    _index(connection, USERS, user_ids)
+
+
+def index_logbook_entries(connection, entry_ids):
+    _index(connection, LOGBOOKS, entry_ids)
+
+
+def create_search_tables(connection):
+    backend = _backend(connection)
+    for index in INDEXES if backend else ():
+        for statement in backend.ddl(index):
+            connection.execute(text(statement))
+
+
+def rebuild_search_index(batch_size=1000):
+    """
+    Recreate every search document, e.g. after bulk inserts
+
+    Returns:
+        Dict of index table -> number of documents
+    """
+    connection = db.session.connection()
+    create_search_tables(connection)
+    counts = {}
+    for index, model in ((USERS, User), (LOGBOOKS, LogbookEntry)):
+        connection.execute(text(f'DELETE FROM {index.table}'))
+        ids = db.session.scalars(select(model.id).order_by(model.id)).all()
+        for start in range(0, len(ids), batch_size):
+            _index(connection, index, ids[start:start + batch_size])
+        counts[index.table] = len(ids)
+    db.session.commit()
+    return counts
+
+
+def _search(query, index, model, terms):
+    backend = _backend(db.session.get_bind())
+    matches = backend.matches(index, terms).columns(id=Integer, rank=Float).subquery('search')
+    return query.join(matches, matches.c.id == model.id), matches.c.rank.label('search_rank')
+
+
+def _no_rank():
+    return literal(0.0, Float).label('search_rank')
+
+
+def search_users(query, term):
+    """
+    Restrict a User query to full-text matches for a search term
+
+    Each word of the term matches the start of a word in the username,
+    email, organization name or attachee profile.
+
+    Returns:
+        Tuple of (filtered query, rank column); ascending rank is best first,
+        so paginate on (rank, User.id)
+    """
+    terms = parse_terms(term)
+    if not terms:
+        return query.filter(false()), _no_rank()
+    if _backend(db.session.get_bind()) is None:
+        pattern = f'%{term}%'
+        return query.filter(or_(User.username.ilike(pattern), User.email.ilike(pattern))), _no_rank()
+    return _search(query, USERS, User, terms)
+
+
+def search_logbook_entries(query, term):
+    """
+    Restrict a LogbookEntry query to entries whose tasks, skills or challenges match
+
+    "Quoted phrases" match those words in order; other words match the
+    start of a word. Words are stemmed, so "deploy" also finds "deployed".
+
+    Returns:
+        Tuple of (filtered query, rank column); paginate on (rank, LogbookEntry.id)
+    """
+    terms = parse_terms(term, phrases=True)
+    if not terms or _backend(db.session.get_bind()) is None:
+        return query.filter(false()), _no_rank()
+    return _search(query, LOGBOOKS, LogbookEntry, terms)
+
+
+def highlight(snippet):
+    """Escape a snippet and wrap its matched words in <mark>"""
+    return Markup(str(escape(snippet)).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'))
+
+
+def attach_snippets(entries, term):
+    """Set search_snippet on each logbook entry: matching text with the matches marked"""
+    terms = parse_terms(term, phrases=True)
+    backend = _backend(db.session.get_bind())
+    if not entries or not terms or backend is None:
+        return
+    snippets = backend.snippets(db.session.connection(), LOGBOOKS, terms, [entry.id for entry in entries])
+    for entry in entries:
+        entry.search_snippet = highlight(snippets.get(entry.id) or '')
+
+
+def _changed(target, *attrs):
+    state = inspect(target)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    index_users(connection, [target.id])
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    if _changed(target, 'username', 'email', 'organization_id'):
+        index_users(connection, [target.id])
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    index_users(connection, [target.id])
+
+
+@event.listens_for(AttacheeProfile, 'after_insert')
+@event.listens_for(AttacheeProfile, 'after_delete')
+def _profile_inserted_or_deleted(mapper, connection, target):
+    index_users(connection, [target.user_id])
+
+
+@event.listens_for(AttacheeProfile, 'after_update')
+def _profile_updated(mapper, connection, target):
+    if _changed(target, 'university', 'course', 'department'):
+        index_users(connection, [target.user_id])
+
+
+@event.listens_for(Organization, 'after_update')
+def _organization_updated(mapper, connection, target):
+    if _changed(target, 'name'):
+        index_users(connection, connection.scalars(select(User.id).where(User.organization_id == target.id)))
+
+
+@event.listens_for(Organization, 'after_delete')
+def _organization_deleted(mapper, connection, target):
+    index_users(connection, connection.scalars(select(User.id).where(User.organization_id == target.id)))
+
+
+@event.listens_for(LogbookEntry, 'after_insert')
+@event.listens_for(LogbookEntry, 'after_delete')
+def _logbook_entry_inserted_or_deleted(mapper, connection, target):
+    index_logbook_entries(connection, [target.id])
+
+
+@event.listens_for(LogbookEntry, 'after_update')
+def _logbook_entry_updated(mapper, connection, target):
+    # Status, week and organization are filtered on the live rows, so only
+    # text edits touch the index
+    if _changed(target, 'tasks', 'skills_gained', 'challenges'):
+        index_logbook_entries(connection, [target.id])
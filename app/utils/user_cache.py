@@ -0,0 +1,79 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from app.models import User
+from app.utils.lru_cache import LRUCache
+
+
+class UserCache(LRUCache):
+    """
+    Per-process LRU of user column values with a short TTL
+
+    Values are stored as plain dicts rather than ORM instances so a cached
+    user can be attached to each request's session without sharing state
+    between requests.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30):
+        super().__init__(maxsize, ttl)
+
+
+user_cache = UserCache()
+
+
+def _snapshot(user):
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+def _restore(values):
+    """Attach cached column values to the current session without a query"""
+    user = User.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(user, key, value)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def load_cached_user(user_id):
+    """
+    Resolve a user id for Flask-Login, from the cache when possible
+
+    Returns:
+        User attached to the current session, or None
+    """
+    values = user_cache.get(user_id)
+    if values is not None:
+        return _restore(values)
+    generation = user_cache.generation()
+    user = db.session.get(User, user_id)
+    if user is not None:
+        user_cache.put(user_id, _snapshot(user), generation=generation)
+    return user
+
+
+# Users touched by a flush are invalidated once the transaction commits; until
+# then a miss would read, and cache again, the row from before the change
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    # Covers role, is_active and password changes made through the ORM
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('user_cache', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users(session):
+    for user_id in session.info.pop('user_cache', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_users(session):
+    session.info.pop('user_cache', None)
+
+
+def init_user_cache(app):
+    user_cache.configure(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
@@ -0,0 +1,24 @@
+class ZipSink:
+    """
+    Write-only stream for zipfile.ZipFile whose output is taken as it is
+    written, so an archive can be sent while it is still being built
+
+    ZipFile sees an unseekable file and writes each entry's sizes after its
+    data, so entries can be added in any size without buffering them.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """The bytes written since the last drain"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
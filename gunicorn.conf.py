@@ -0,0 +1,33 @@
+# Read by `gunicorn run:app` from the working directory
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker'
+# More than one worker needs SOCKETIO_MESSAGE_QUEUE and PRESENCE_URL so video
+# rooms span workers, and sticky sessions for clients on long-polling
+workers = int(os.environ.get('WEB_CONCURRENCY') or 1)
+
+# Build the app once in the master so workers boot by forking and share its
+# memory copy-on-write
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+if preload_app:
+    # Patch before the app is imported so its module-level locks are cooperative
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def when_ready(server):
+    # Keep the preloaded objects out of garbage collection, which would
+    # otherwise write to (and so copy) their pages in every worker
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from app import db, start_background_tasks
+    app = worker.wsgi
+    with app.app_context():
+        # Never share pooled connections with the master or sibling workers
+        db.engine.dispose(close=False)
+    start_background_tasks(app)
@@ -0,0 +1,44 @@
+"""add hot path indexes
+
+Revision ID: 3f1c9a7d2b64
+Revises: 
+Create Date: 2026-10-17 09:12:41.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b64'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns) - kept in step with __table_args__ in app/models.py
+INDEXES = [
+    ('ix_user_role_username', 'user', ['role', 'username']),
+    ('ix_user_organization_id_role_username', 'user', ['organization_id', 'role', 'username']),
+    ('ix_user_username', 'user', ['username']),
+    ('ix_user_created_at', 'user', ['created_at']),
+    ('ix_logbook_entry_attachee_id_created_at', 'logbook_entry', ['attachee_id', 'created_at']),
+    ('ix_logbook_entry_attachee_id_status', 'logbook_entry', ['attachee_id', 'status']),
+    ('ix_logbook_entry_attachee_id_week_number', 'logbook_entry', ['attachee_id', 'week_number']),
+    ('ix_logbook_entry_status_created_at', 'logbook_entry', ['status', 'created_at']),
+    ('ix_logbook_entry_created_at', 'logbook_entry', ['created_at']),
+    ('ix_file_upload_attachee_id_uploaded_at', 'file_upload', ['attachee_id', 'uploaded_at']),
+    ('ix_video_session_assessor_id_status_start_time', 'video_session', ['assessor_id', 'status', 'start_time']),
+    ('ix_video_session_attachee_id_status_start_time', 'video_session', ['attachee_id', 'status', 'start_time']),
+]
+
+
+def upgrade():
+    # Tables created by db.create_all() may already carry these indexes
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,51 @@
+"""add user search index
+
+Revision ID: 5d7a2c9e4f18
+Revises: 8b2e4d61c0f3
+Create Date: 2026-10-17 14:05:37.260114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d7a2c9e4f18'
+down_revision = '8b2e4d61c0f3'
+branch_labels = None
+depends_on = None
+
+
+# The same documents app/utils/search.py maintains: username, email,
+# organization name and the attachee profile's university, course and department
+SOURCE = '''
+    FROM "user" u
+    LEFT JOIN organization o ON o.id = u.organization_id
+    LEFT JOIN attachee_profile p ON p.user_id = u.id
+'''
+PROFILE = "trim(coalesce(p.university, '') || ' ' || coalesce(p.course, '') || ' ' || coalesce(p.department, ''))"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5("
+                   "username, email, organization, profile, "
+                   "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        op.execute('DELETE FROM user_search')
+        op.execute(f"INSERT INTO user_search (rowid, username, email, organization, profile) "
+                   f"SELECT u.id, u.username, u.email, coalesce(o.name, ''), {PROFILE} {SOURCE}")
+    elif dialect == 'postgresql':
+        op.execute('CREATE TABLE IF NOT EXISTS user_search ('
+                   'user_id INTEGER PRIMARY KEY REFERENCES "user" (id) ON DELETE CASCADE, '
+                   'document TSVECTOR NOT NULL)')
+        op.execute('CREATE INDEX IF NOT EXISTS ix_user_search_document ON user_search USING GIN (document)')
+        fields = [('u.username', 'A'), ('u.email', 'B'), ("coalesce(o.name, '')", 'C'), (PROFILE, 'D')]
+        document = ' || '.join(f"setweight(to_tsvector('simple', translate({value}, '@._-', '    ')), '{weight}')"
+                               for value, weight in fields)
+        op.execute('DELETE FROM user_search')
+        op.execute(f'INSERT INTO user_search (user_id, document) SELECT u.id, {document} {SOURCE}')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS user_search')
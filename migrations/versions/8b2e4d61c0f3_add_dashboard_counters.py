@@ -0,0 +1,58 @@
+"""add dashboard counters
+
+Revision ID: 8b2e4d61c0f3
+Revises: 3f1c9a7d2b64
+Create Date: 2026-10-17 11:40:05.502117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d61c0f3'
+down_revision = '3f1c9a7d2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('dashboard_counter'):
+        op.create_table('dashboard_counter',
+            sa.Column('key', sa.String(length=100), nullable=False),
+            sa.Column('value', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('key')
+        )
+
+    # Seed the counters with the same keys app/utils/counters.py maintains
+    counter = sa.table('dashboard_counter', sa.column('key', sa.String), sa.column('value', sa.Integer))
+    user = sa.table('user', sa.column('role', sa.String), sa.column('organization_id', sa.Integer))
+    entry = sa.table('logbook_entry', sa.column('status', sa.String), sa.column('attachee_id', sa.Integer))
+    organization = sa.table('organization', sa.column('id', sa.Integer))
+    video_session = sa.table('video_session', sa.column('id', sa.Integer))
+    count = sa.func.count()
+    status = sa.func.coalesce(entry.c.status, 'DRAFT')
+    entry_user = sa.table('user', sa.column('id', sa.Integer), sa.column('organization_id', sa.Integer))
+    org_prefix = sa.literal('org:') + sa.cast(entry_user.c.organization_id, sa.String)
+    seeds = [
+        sa.select(sa.literal('users'), count).select_from(user),
+        sa.select(sa.literal('users:role:') + user.c.role, count).group_by(user.c.role),
+        sa.select(sa.literal('org:') + sa.cast(user.c.organization_id, sa.String) + ':users:role:' + user.c.role, count)
+            .where(user.c.organization_id.isnot(None)).group_by(user.c.organization_id, user.c.role),
+        sa.select(sa.literal('logbook_entries'), count).select_from(entry),
+        sa.select(sa.literal('logbook_entries:status:') + status, count).group_by(status),
+        sa.select(org_prefix + ':logbook_entries:status:' + status, count)
+            .select_from(entry.join(entry_user, entry.c.attachee_id == entry_user.c.id))
+            .where(entry_user.c.organization_id.isnot(None))
+            .group_by(entry_user.c.organization_id, status),
+        sa.select(sa.literal('organizations'), count).select_from(organization),
+        sa.select(sa.literal('video_sessions'), count).select_from(video_session),
+    ]
+    op.execute(counter.delete())
+    for seed in seeds:
+        op.execute(counter.insert().from_select(['key', 'value'], seed))
+
+
+def downgrade():
+    op.drop_table('dashboard_counter')
@@ -0,0 +1,41 @@
+"""add logbook search index
+
+Revision ID: a9c41e7b3d52
+Revises: 5d7a2c9e4f18
+Create Date: 2026-10-17 16:21:08.934572
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c41e7b3d52'
+down_revision = '5d7a2c9e4f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS logbook_search USING fts5("
+                   "tasks, skills_gained, challenges, "
+                   "tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')")
+        op.execute('DELETE FROM logbook_search')
+        op.execute('INSERT INTO logbook_search (rowid, tasks, skills_gained, challenges) '
+                   'SELECT id, tasks, skills_gained, challenges FROM logbook_entry')
+    elif dialect == 'postgresql':
+        op.execute('CREATE TABLE IF NOT EXISTS logbook_search ('
+                   'entry_id INTEGER PRIMARY KEY REFERENCES logbook_entry (id) ON DELETE CASCADE, '
+                   'document TSVECTOR NOT NULL)')
+        op.execute('CREATE INDEX IF NOT EXISTS ix_logbook_search_document ON logbook_search USING GIN (document)')
+        document = ' || '.join(
+            f"setweight(to_tsvector('english', translate(coalesce({field}, ''), '@._-', '    ')), '{weight}')"
+            for field, weight in (('tasks', 'A'), ('skills_gained', 'B'), ('challenges', 'C')))
+        op.execute('DELETE FROM logbook_search')
+        op.execute(f'INSERT INTO logbook_search (entry_id, document) SELECT id, {document} FROM logbook_entry')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS logbook_search')
@@ -0,0 +1,34 @@
+"""add notification indexes
+
+Revision ID: c4e8f2a61d07
+Revises: a9c41e7b3d52
+Create Date: 2026-10-17 18:47:12.530916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8f2a61d07'
+down_revision = 'a9c41e7b3d52'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns) - kept in step with __table_args__ in app/models.py
+INDEXES = [
+    ('ix_notification_user_id_created_at', 'notification', ['user_id', 'created_at']),
+    ('ix_notification_user_id_is_read', 'notification', ['user_id', 'is_read']),
+]
+
+
+def upgrade():
+    # Tables created by db.create_all() may already carry these indexes
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,44 @@
+"""add report jobs
+
+Revision ID: e5a3b7c91f42
+Revises: c4e8f2a61d07
+Create Date: 2026-10-17 21:05:38.114206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a3b7c91f42'
+down_revision = 'c4e8f2a61d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('report_job'):
+        op.create_table('report_job',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=30), nullable=False),
+            sa.Column('key', sa.String(length=100), nullable=False),
+            sa.Column('params', sa.JSON(), nullable=False),
+            sa.Column('requested_by', sa.Integer(), nullable=False),
+            sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'DONE', 'FAILED', name='reportstatus'), nullable=False),
+            sa.Column('progress', sa.Integer(), nullable=False),
+            sa.Column('filename', sa.String(length=200), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['requested_by'], ['user.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_report_job_key_status', 'report_job', ['key', 'status'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_report_job_key_status', table_name='report_job', if_exists=True)
+    op.drop_table('report_job')
+    sa.Enum(name='reportstatus').drop(op.get_bind(), checkfirst=True)
@@ -1,8 +1,9 @@
-from app import create_app, socketio
+from app import create_app, socketio, start_background_tasks
  
 app = create_app()
 
 if __name__ == '__main__':
+    start_background_tasks(app)
     socketio.run(app, debug=True)
 
 